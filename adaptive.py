@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""Adaptive testing with a two-parameter logistic (2PL) IRT model.
+
+An adaptive test (``tests.mode = 'adaptive'``) shows one question at a time.
+After each answer the student's ability is re-estimated (EAP on a fixed
+theta grid) and the next question is the unanswered one with the highest
+Fisher information at that estimate. The session stops once the standard
+error falls below ``ADAPTIVE_TARGET_SE`` (after ``ADAPTIVE_MIN_ITEMS``) or
+after ``ADAPTIVE_MAX_ITEMS`` questions.
+
+Item parameters are calibrated offline from ``answer_responses`` by marginal
+maximum likelihood (EM over quadrature nodes, vectorized with NumPy) and
+stored in ``item_params``. Each worker keeps the per-test information table
+in memory, stamped with the bank version, so choosing the next item is one
+column lookup and an argmax.
+"""
+import json
+import math
+import threading
+
+import numpy as np
+from flask import current_app
+
+import queries
+from question_cache import bump_version, current_version
+
+THETA_GRID = np.linspace(-4.0, 4.0, 161)
+_LOG_PRIOR = -0.5 * THETA_GRID ** 2 # Standard normal ability prior, unnormalized
+
+QUADRATURE = np.linspace(-4.0, 4.0, 41)
+_QUAD_WEIGHTS = np.exp(-0.5 * QUADRATURE ** 2) / np.exp(-0.5 * QUADRATURE ** 2).sum()
+
+
+def _log_p(a, b, theta):
+    """log P(correct) and log P(wrong) for items ``(a, b)`` at every theta."""
+    z = np.multiply.outer(a, theta) - (a * b)[:, None]
+    return -np.logaddexp(0, -z), -np.logaddexp(0, z)
+
+
+# --- Calibration ---
+
+def _default_difficulty(p_correct):
+    p = np.clip(p_correct, 0.02, 0.98)
+    return -np.log(p / (1 - p))
+
+
+def calibrate(persons, items, correct, n_items, iterations=100, tol=1e-4, chunk_size=200_000):
+    """Fits 2PL ``(a, b)`` for ``n_items`` items from flat response arrays.
+
+    ``persons`` and ``items`` are integer codes (0-based), ``correct`` is 0/1,
+    one entry per response; items a person never saw are simply missing.
+    Uses Bock-Aitkin EM: the E-step computes each person's posterior over
+    ``QUADRATURE`` in chunks of whole persons, the M-step takes a few Newton
+    steps per item on the expected counts, with weak priors keeping sparse
+    items finite. Returns ``(a, b, iterations_run)``.
+    """
+    order = np.argsort(persons, kind='stable')
+    persons, items = persons[order], items[order]
+    correct = correct[order].astype(bool)
+    new_person = np.r_[True, persons[1:] != persons[:-1]]
+    starts = np.flatnonzero(new_person)
+    row = np.cumsum(new_person) - 1 # Person number of each response
+
+    counts = np.bincount(items, minlength=n_items)
+    p_correct = np.bincount(items, weights=correct, minlength=n_items) / np.maximum(counts, 1)
+    a = np.ones(n_items)
+    c = -_default_difficulty(p_correct) # c = -a * b
+    log_weights = np.log(_QUAD_WEIGHTS)
+
+    # Chunks cover whole persons so each posterior sees all of its responses
+    bounds = [0]
+    for start in starts[1:]:
+        if start - bounds[-1] >= chunk_size:
+            bounds.append(start)
+    bounds.append(len(items))
+
+    iteration = 0
+    for iteration in range(1, iterations + 1):
+        log_p, log_q = _log_p(a, -c / a, QUADRATURE)
+        expected_n = np.zeros((n_items, len(QUADRATURE)))
+        expected_r = np.zeros((n_items, len(QUADRATURE)))
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            chunk_items, chunk_correct = items[lo:hi], correct[lo:hi]
+            contrib = np.where(chunk_correct[:, None], log_p[chunk_items], log_q[chunk_items])
+            chunk_rows = row[lo:hi] - row[lo]
+            chunk_starts = np.flatnonzero(np.r_[True, chunk_rows[1:] != chunk_rows[:-1]])
+            loglik = np.add.reduceat(contrib, chunk_starts, axis=0) + log_weights
+            loglik -= loglik.max(axis=1, keepdims=True)
+            posterior = np.exp(loglik)
+            posterior /= posterior.sum(axis=1, keepdims=True)
+            weights = posterior[chunk_rows]
+            for k in range(len(QUADRATURE)):
+                expected_n[:, k] += np.bincount(chunk_items, weights=weights[:, k], minlength=n_items)
+                expected_r[:, k] += np.bincount(chunk_items, weights=weights[:, k] * chunk_correct,
+                                                minlength=n_items)
+
+        old_a, old_c = a.copy(), c.copy()
+        for _ in range(5): # Newton steps on (a, c); priors a ~ N(1, 1), c ~ N(0, 3^2)
+            prob = 1 / (1 + np.exp(-(np.multiply.outer(a, QUADRATURE) + c[:, None])))
+            resid = expected_r - expected_n * prob
+            info = expected_n * prob * (1 - prob)
+            grad_a = (resid * QUADRATURE).sum(axis=1) - (a - 1)
+            grad_c = resid.sum(axis=1) - c / 9
+            h_aa = -(info * QUADRATURE ** 2).sum(axis=1) - 1
+            h_ac = -(info * QUADRATURE).sum(axis=1)
+            h_cc = -info.sum(axis=1) - 1 / 9
+            det = h_aa * h_cc - h_ac ** 2
+            a = np.clip(a - (h_cc * grad_a - h_ac * grad_c) / det, 0.1, 4.0)
+            c = np.clip(c - (h_aa * grad_c - h_ac * grad_a) / det, -16.0, 16.0)
+        if max(np.abs(a - old_a).max(), np.abs(c - old_c).max()) < tol:
+            break
+    return a, np.clip(-c / a, -4.0, 4.0), iteration
+
+
+def calibrate_test(conn, test_id, min_responses=50, iterations=100):
+    """Calibrates one test's items from ``answer_responses`` and stores them.
+
+    Unanswered questions are treated as missing. Items with fewer than
+    ``min_responses`` responses are not stored and keep their runtime default.
+    Bumps the bank version so every worker reloads its tables; the caller
+    commits. Returns a summary dict.
+    """
+    rows = conn.execute("""
+        SELECT ar.result_id, ar.question_id, ar.correct
+        FROM questions q JOIN all_answer_responses ar ON ar.question_id = q.id
+        WHERE q.test_id = ? AND ar.chosen_option >= 0
+    """, (test_id,)).fetchall()
+    if not rows:
+        return {'responses': 0, 'persons': 0, 'calibrated': 0, 'iterations': 0}
+    data = np.array([tuple(r) for r in rows], dtype=np.int64)
+    _, persons = np.unique(data[:, 0], return_inverse=True)
+    question_ids, items = np.unique(data[:, 1], return_inverse=True)
+    a, b, iterations_run = calibrate(persons, items, data[:, 2], len(question_ids), iterations)
+
+    counts = np.bincount(items, minlength=len(question_ids))
+    keep = counts >= min_responses
+    conn.executemany("""
+        INSERT INTO item_params (question_id, test_id, discrimination, difficulty, responses)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(question_id) DO UPDATE SET
+            discrimination = excluded.discrimination,
+            difficulty = excluded.difficulty,
+            responses = excluded.responses
+    """, [(int(qid), test_id, float(a[i]), float(b[i]), int(counts[i]))
+          for i, qid in enumerate(question_ids.tolist()) if keep[i]])
+    bump_version(conn, test_id)
+    return {'responses': len(data), 'persons': int(persons.max()) + 1,
+            'calibrated': int(keep.sum()), 'iterations': iterations_run}
+
+
+# --- Item tables and the adaptive loop ---
+
+class ItemTable:
+    """One test's item parameters and information at every ``THETA_GRID`` point."""
+
+    def __init__(self, test_id, version, question_ids, a, b):
+        self.test_id = test_id
+        self.version = version
+        self.question_ids = np.asarray(question_ids, dtype=np.int64)
+        self.position = {qid: i for i, qid in enumerate(question_ids)}
+        self.a = np.asarray(a, dtype=np.float64)
+        self.b = np.asarray(b, dtype=np.float64)
+        prob = 1 / (1 + np.exp(-(np.multiply.outer(self.a, THETA_GRID) - (self.a * self.b)[:, None])))
+        self.info = (self.a[:, None] ** 2 * prob * (1 - prob)).astype(np.float32)
+
+    def __len__(self):
+        return len(self.question_ids)
+
+    def estimate(self, question_ids, correct):
+        """EAP ability estimate and its standard error after the given answers."""
+        log_post = _LOG_PRIOR.copy()
+        if question_ids:
+            positions = [self.position[q] for q in question_ids if q in self.position]
+            outcomes = np.array([c for q, c in zip(question_ids, correct) if q in self.position], dtype=bool)
+            log_p, log_q = _log_p(self.a[positions], self.b[positions], THETA_GRID)
+            log_post += np.where(outcomes[:, None], log_p, log_q).sum(axis=0)
+        post = np.exp(log_post - log_post.max())
+        post /= post.sum()
+        theta = float(post @ THETA_GRID)
+        return theta, float(math.sqrt(post @ (THETA_GRID - theta) ** 2))
+
+    def next_item(self, theta, administered):
+        """The most informative question at ``theta`` not yet administered, or None."""
+        column = self.info[:, int(np.abs(THETA_GRID - theta).argmin())].copy()
+        positions = [self.position[q] for q in administered if q in self.position]
+        column[positions] = -np.inf
+        best = int(column.argmax())
+        return None if column[best] == -np.inf else int(self.question_ids[best])
+
+
+def load_item_table(conn, test_id, version):
+    """Builds a test's table; uncalibrated items get a=1 and b from their p-value."""
+    rows = conn.execute("""
+        SELECT q.id, p.discrimination, p.difficulty, s.attempts, s.correct
+        FROM questions q
+        LEFT JOIN item_params p ON p.question_id = q.id
+        LEFT JOIN question_stats s ON s.question_id = q.id
+        WHERE q.test_id = ? ORDER BY q.id
+    """, (test_id,)).fetchall()
+    question_ids, a, b = [], [], []
+    for qid, disc, diff, attempts, n_correct in rows:
+        question_ids.append(qid)
+        if disc is not None:
+            a.append(disc)
+            b.append(diff)
+        else:
+            a.append(1.0)
+            b.append(float(_default_difficulty(n_correct / attempts)) if attempts else 0.0)
+    return ItemTable(test_id, version, question_ids, a, b)
+
+
+class ItemTableCache:
+    def __init__(self):
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def get(self, conn, test_id):
+        version = current_version(conn, test_id)
+        with self._lock:
+            table = self._tables.get(test_id)
+        if table is None or table.version != version:
+            table = load_item_table(conn, test_id, version)
+            with self._lock:
+                self._tables[test_id] = table
+        return table
+
+
+def get_item_table_cache(app=None):
+    if app is None:
+        app = current_app._get_current_object()
+    cache = app.extensions.get('adaptive_tables')
+    if cache is None:
+        cache = app.extensions.setdefault('adaptive_tables', ItemTableCache())
+    return cache
+
+
+def should_stop(answered, se, config):
+    if answered >= config.get('ADAPTIVE_MAX_ITEMS', 30):
+        return True
+    return answered >= config.get('ADAPTIVE_MIN_ITEMS', 5) and se <= config.get('ADAPTIVE_TARGET_SE', 0.35)
+
+
+def ability_percentage(theta):
+    """Percentile of ``theta`` under the N(0, 1) ability scale, stored as the result percentage."""
+    return round(50 * (1 + math.erf(theta / math.sqrt(2))))
+
+
+class AdaptiveAttempt:
+    """An open adaptive attempt: the questions served and the answers given so far."""
+
+    def __init__(self, attempt_id, question_ids, responses):
+        self.id = attempt_id
+        self.question_ids = question_ids
+        self.responses = responses # [chosen_option_index, correct] per answered question
+
+    @property
+    def current_question(self):
+        if len(self.question_ids) > len(self.responses):
+            return self.question_ids[len(self.responses)]
+        return None
+
+    def correct_flags(self):
+        return [bool(correct) for _, correct in self.responses]
+
+    def sheet(self, bank):
+        """The answers as an encoded sheet for ``bank`` (the questions served, in order)."""
+        chosen = {qid: response[0] for qid, response in zip(self.question_ids, self.responses)}
+        return np.array([chosen.get(q['id'], -1) for q in bank.questions], dtype=np.int8)
+
+
+def open_attempt(conn, user_id, test_id, timestamp):
+    """Returns the user's open adaptive attempt, starting one at theta = 0 if needed.
+
+    If the question the attempt is waiting on has been deleted, it moves on
+    to the best remaining question; with none left the attempt is abandoned
+    (closed without a result) and a new one starts. Returns None if the test
+    has no questions. The caller commits.
+    """
+    row = conn.execute(queries.OPEN_ADAPTIVE_ATTEMPT, (user_id, test_id)).fetchone()
+    table = get_item_table_cache().get(conn, test_id)
+    if row:
+        attempt = AdaptiveAttempt(row['id'], json.loads(row['question_ids']), json.loads(row['responses'] or '[]'))
+        current = attempt.current_question
+        if current is None or current in table.position:
+            return attempt
+        answered = len(attempt.responses)
+        theta, _ = table.estimate(attempt.question_ids[:answered], attempt.correct_flags())
+        replacement = table.next_item(theta, attempt.question_ids)
+        if replacement is not None:
+            attempt.question_ids[answered] = replacement
+            conn.execute("UPDATE attempts SET question_ids = ? WHERE id = ?",
+                         (json.dumps(attempt.question_ids), attempt.id))
+            return attempt
+        conn.execute("UPDATE attempts SET submitted_at = ? WHERE id = ?", (timestamp, attempt.id))
+    first = table.next_item(0.0, [])
+    if first is None:
+        return None
+    cursor = conn.execute("""
+        INSERT INTO attempts (user_id, test_id, question_ids, responses, started_at)
+        VALUES (?, ?, ?, '[]', ?)
+    """, (user_id, test_id, json.dumps([first]), timestamp))
+    return AdaptiveAttempt(cursor.lastrowid, [first], [])
+
+
+def answer(conn, attempt, test_id, chosen, correct, config):
+    """Records the answer to the current question and picks the next one.
+
+    Returns ``(finished, theta, se)``; when not finished the next question
+    has been appended to the attempt. The caller commits.
+    """
+    attempt.responses.append([chosen, int(correct)])
+    table = get_item_table_cache().get(conn, test_id)
+    theta, se = table.estimate(attempt.question_ids, attempt.correct_flags())
+    finished = should_stop(len(attempt.responses), se, config)
+    if not finished:
+        following = table.next_item(theta, attempt.question_ids)
+        if following is None:
+            finished = True
+        else:
+            attempt.question_ids.append(following)
+    conn.execute("UPDATE attempts SET question_ids = ?, responses = ? WHERE id = ?",
+                 (json.dumps(attempt.question_ids), json.dumps(attempt.responses), attempt.id))
+    return finished, theta, se
+
+
+def load_attempt(conn, attempt_id, user_id, test_id):
+    """The user's open adaptive attempt with this id, or None if it is not theirs, already submitted or not adaptive.
+
+    A pooled attempt has no ``responses``; it is not loaded here even if the
+    test has since been switched to adaptive mode.
+    """
+    row = conn.execute(queries.ADAPTIVE_ATTEMPT, (attempt_id, user_id, test_id)).fetchone()
+    if not row:
+        return None
+    return AdaptiveAttempt(row['id'], json.loads(row['question_ids']), json.loads(row['responses']))
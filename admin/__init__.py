@@ -1,11 +1,11 @@
-# admin/__init__.py
+# -*- coding: utf-8 -*-
+"""The admin blueprint; its routes live in admin/routes.py.
+
+Templates are looked up in the application's own templates/ folder, so
+'admin/manage_tests.html' resolves to templates/admin/manage_tests.html.
+"""
 from flask import Blueprint
 
-# تعريف المخطط (Blueprint) لقسم الإدارة
-# هذا هو التعريف الصحيح. 
-# سيقوم Flask بالبحث عن القوالب في مجلد 'templates' الخاص بالتطبيق الرئيسي
-# وعندما نطلب 'admin/admin_login.html' سيبحث عن 'templates/admin/admin_login.html'
-admin_bp = Blueprint('admin', __name__, url_prefix='/admin') 
+admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
-# استيراد المسارات لربطها بالمخطط
-from . import routes
\ No newline at end of file
+from . import routes  # noqa: E402,F401 - registers the routes on admin_bp
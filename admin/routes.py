@@ -1,19 +1,440 @@
-# ... هذا السطر موجود عندك ...
+# -*- coding: utf-8 -*-
+"""Admin pages: tests, questions, users, exports and metrics (``/admin``)."""
+import csv
+import io
+import sqlite3
+import tempfile
+from datetime import datetime as dt
+
+from flask import (
+    abort, current_app, flash, redirect, render_template, request, Response, session, stream_with_context, url_for
+)
+from werkzeug.wsgi import wrap_file
+
+import archive
+import leaderboard
+import metrics
+import passwords
+import question_io
+import question_pool
+import question_search
+import results_export
+import user_io
+from db import get_db
+from pagination import paginate
+from question_cache import bump_version, get_question_bank, get_question_cache
+from results import rebuild_progress
+from results_writer import get_result_writer
+
+from . import admin_bp
+
+
+
 @admin_bp.before_request
 def require_admin_login():
-    # ... (الكود الموجود حالياً) ...
+    """Ensures user is logged in and is the admin."""
     if 'user_id' not in session:
         flash('الرجاء تسجيل الدخول للوصول لهذه الصفحة.', 'warning')
         return redirect(url_for('login'))
+    if session.get('username') != 'admin':
+        flash('ليس لديك الصلاحيات الكافية.', 'danger')
+        return redirect(url_for('dashboard')) # Redirect non-admins away
 
-# --- أضف هذا المسار الجديد ---
 @admin_bp.route('/')
 def index():
-    # هذا الكود سيقوم بإعادة توجيه أي زيارة لـ /admin/
-    # إلى صفحة /admin/manage-tests تلقائياً
+    """Redirects base admin URL to manage tests page."""
     return redirect(url_for('admin.manage_tests'))
-# --- نهاية الإضافة ---
 
 @admin_bp.route('/manage-tests', methods=['GET', 'POST'])
 def manage_tests():
-    # ... (باقي الكود كما هو) ...
\ No newline at end of file
+    """Handles adding new tests and displaying existing ones."""
+    if request.method == 'POST': # Add new test
+        test_name = request.form.get('test_name')
+        test_type = request.form.get('test_type')
+        test_level = request.form.get('test_level')
+        sample_size = request.form.get('sample_size') or None
+        test_mode = request.form.get('test_mode') or None
+
+        if not test_name or not test_type or not test_level:
+            flash('الرجاء ملء جميع الحقول.', 'danger')
+            return redirect(url_for('admin.manage_tests'))
+
+        try:
+            sample_size = int(sample_size) if sample_size else None
+            if sample_size is not None and sample_size < 1:
+                raise ValueError
+            conn = get_db()
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO tests (name, type, level, sample_size, mode) VALUES (?, ?, ?, ?, ?)",
+                (test_name, test_type, int(test_level), sample_size,
+                 'adaptive' if test_mode == 'adaptive' else None)
+            )
+            conn.commit()
+            flash(f'تمت إضافة الاختبار "{test_name}" بنجاح.', 'success')
+        except sqlite3.Error as e:
+            flash(f'حدث خطأ أثناء إضافة الاختبار: {e}', 'danger')
+        except ValueError:
+            flash('المرحلة يجب أن تكون رقماً وعدد الأسئلة رقماً موجباً.', 'danger')
+        return redirect(url_for('admin.manage_tests'))
+
+    # (GET) Display existing tests
+    current_tests = []
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, name, type, level, sample_size, mode FROM tests ORDER BY id ASC")
+        current_tests = cursor.fetchall()
+    except sqlite3.Error as e:
+        flash(f'حدث خطأ أثناء جلب الاختبارات: {e}', 'danger')
+
+    return render_template('admin/manage_tests.html', current_tests=current_tests)
+
+@admin_bp.route('/manage-questions/<int:test_id>', methods=['GET', 'POST'])
+def manage_questions(test_id):
+    """Handles adding new questions and displaying questions for a specific test."""
+    conn = get_db()
+    cursor = conn.cursor()
+    form = {}
+    duplicates = []
+
+    if request.method == 'POST': # Add new question
+        question_text = request.form.get('question_text')
+        option1 = request.form.get('option1')
+        option2 = request.form.get('option2')
+        option3 = request.form.get('option3')
+        option4 = request.form.get('option4')
+        correct_option = request.form.get('correct_option')
+        stratum = (request.form.get('stratum') or '').strip() or None
+
+        error = question_io.validate_question(question_text, option1, option2, option3, option4, correct_option)
+        if not error and not request.form.get('allow_duplicate'):
+            duplicates = question_search.find_duplicates(conn, question_text,
+                                                         current_app.config['DUPLICATE_THRESHOLD'])
+        if error:
+            flash(error, 'danger')
+        elif duplicates: # Shown next to the filled-in form below; the admin can add it anyway
+            flash('يوجد في بنك الأسئلة سؤال مشابه لهذا السؤال. راجع الأسئلة المشابهة قبل الإضافة.', 'warning')
+            form = request.form
+        else:
+            try:
+                cursor.execute("""
+                    INSERT INTO questions (test_id, text, option1, option2, option3, option4, correct_option, stratum)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (test_id, question_text, option1, option2, option3, option4, correct_option, stratum))
+                bump_version(conn, test_id)
+                conn.commit()
+                get_question_cache().invalidate(test_id)
+                flash('تمت إضافة السؤال بنجاح.', 'success')
+            except sqlite3.Error as e:
+                flash(f'حدث خطأ أثناء إضافة السؤال: {e}', 'danger')
+
+        if not duplicates:
+            return redirect(url_for('admin.manage_questions', test_id=test_id))
+
+    # (GET) Display test info and questions
+    cursor.execute("SELECT name, sample_size, mode FROM tests WHERE id = ?", (test_id,))
+    test = cursor.fetchone()
+    if not test:
+        flash('الاختبار غير موجود.', 'danger')
+        return redirect(url_for('admin.manage_tests'))
+
+    page = paginate(conn, "SELECT id, text, correct_option FROM questions WHERE test_id = ? {keyset} ORDER BY {order}",
+                    (test_id,), [('id', 'id')])
+    total_questions = question_pool.get_pool_index_cache().get(conn, test_id).size
+
+    return render_template('admin/manage_questions.html', test=test, questions=page.items, page=page,
+                           total_questions=total_questions, test_id=test_id, form=form, duplicates=duplicates)
+
+
+@admin_bp.route('/search-questions')
+def search_questions():
+    """Searches every test's questions, or lists the ones similar to a given text."""
+    query = (request.args.get('q') or '').strip()
+    test_id = request.args.get('test_id', type=int)
+    similar = bool(request.args.get('similar'))
+    results = []
+    conn = get_db()
+    try:
+        tests = conn.execute("SELECT id, name FROM tests ORDER BY id").fetchall()
+        limit = current_app.config.get('QUESTION_SEARCH_LIMIT', 50)
+        if query and similar:
+            results = [match for match in question_search.find_duplicates(
+                           conn, query, current_app.config['DUPLICATE_THRESHOLD'], limit=limit)
+                       if test_id is None or match['test_id'] == test_id]
+        elif query:
+            results = question_search.search(conn, query, test_id, limit)
+    except sqlite3.Error as e:
+        tests = []
+        flash(f'حدث خطأ أثناء البحث: {e}', 'danger')
+    return render_template('admin/search_questions.html', query=query, test_id=test_id, similar=similar,
+                           tests=tests, results=results)
+
+
+@admin_bp.route('/sample-size/<int:test_id>', methods=['POST'])
+def set_sample_size(test_id):
+    """Sets how many questions each attempt draws from the test's pool (empty = all)."""
+    value = (request.form.get('sample_size') or '').strip()
+    try:
+        sample_size = int(value) if value else None
+        if sample_size is not None and sample_size < 1:
+            raise ValueError
+        conn = get_db()
+        conn.execute("UPDATE tests SET sample_size = ? WHERE id = ?", (sample_size, test_id))
+        conn.commit()
+        flash('تم حفظ عدد الأسئلة لكل محاولة.', 'success')
+    except ValueError:
+        flash('عدد الأسئلة يجب أن يكون رقماً موجباً.', 'danger')
+    except sqlite3.Error as e:
+        flash(f'حدث خطأ أثناء حفظ الإعداد: {e}', 'danger')
+    return redirect(url_for('admin.manage_questions', test_id=test_id))
+
+
+@admin_bp.route('/test-mode/<int:test_id>', methods=['POST'])
+def set_test_mode(test_id):
+    """Switches a test between a fixed form and adaptive (one question at a time) mode."""
+    mode = 'adaptive' if request.form.get('test_mode') == 'adaptive' else None
+    try:
+        conn = get_db()
+        conn.execute("UPDATE tests SET mode = ? WHERE id = ?", (mode, test_id))
+        conn.commit()
+        flash('تم حفظ نمط الاختبار.', 'success')
+    except sqlite3.Error as e:
+        flash(f'حدث خطأ أثناء حفظ الإعداد: {e}', 'danger')
+    return redirect(url_for('admin.manage_questions', test_id=test_id))
+
+
+@admin_bp.route('/question-analytics/<int:test_id>')
+def question_analytics(test_id):
+    """Shows difficulty, option choices and discrimination for each question of a test."""
+    import item_analysis # Pulls in numpy; only this page needs it
+    conn = get_db()
+    bank = get_question_bank(conn, test_id)
+    if not bank:
+        flash('الاختبار غير موجود.', 'danger')
+        return redirect(url_for('admin.manage_tests'))
+    return render_template('admin/question_analytics.html', test=bank, test_id=test_id,
+                           items=item_analysis.test_analytics(conn, bank))
+
+
+@admin_bp.route('/import-questions/<int:test_id>', methods=['POST'])
+def import_questions(test_id):
+    """Bulk-imports questions from an uploaded CSV or JSONL file."""
+    upload = request.files.get('questions_file')
+    if not upload or not upload.filename:
+        flash('الرجاء اختيار ملف الأسئلة.', 'danger')
+        return redirect(url_for('admin.manage_questions', test_id=test_id))
+
+    conn = get_db()
+    if not conn.execute("SELECT 1 FROM tests WHERE id = ?", (test_id,)).fetchone():
+        flash('الاختبار غير موجود.', 'danger')
+        return redirect(url_for('admin.manage_tests'))
+
+    file_format = question_io.guess_format(upload.filename, request.form.get('format', 'csv'))
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    try:
+        threshold = current_app.config['DUPLICATE_THRESHOLD'] if request.form.get('skip_duplicates') else None
+        summary = question_io.import_questions(conn, test_id, stream, file_format, duplicate_threshold=threshold)
+    except (sqlite3.Error, UnicodeDecodeError, csv.Error) as e:
+        summary = None
+        flash(f'حدث خطأ أثناء استيراد الأسئلة: {e}', 'danger')
+    finally:
+        get_question_cache().invalidate(test_id)
+
+    if summary:
+        flash(f"تم استيراد {summary['imported']} سؤالاً.", 'success' if summary['imported'] else 'warning')
+        errors = summary['errors']
+        if errors:
+            details = '، '.join(f'السطر {line}: {message}' for line, message in errors[:10])
+            more = f' (و{len(errors) - 10} أخطاء أخرى)' if len(errors) > 10 else ''
+            flash(f'تم تخطي {len(errors)} صفاً غير صالح. {details}{more}', 'warning')
+    return redirect(url_for('admin.manage_questions', test_id=test_id))
+
+
+@admin_bp.route('/export-questions/<int:test_id>')
+def export_questions(test_id):
+    """Streams a test's question bank as CSV or JSONL."""
+    file_format = 'jsonl' if request.args.get('format') == 'jsonl' else 'csv'
+    conn = get_db()
+    if not conn.execute("SELECT 1 FROM tests WHERE id = ?", (test_id,)).fetchone():
+        abort(404)
+    mimetype = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(question_io.export_questions(conn, test_id, file_format)),
+                    mimetype=f'{mimetype}; charset=utf-8',
+                    headers={'Content-Disposition': f'attachment; filename=questions_{test_id}.{file_format}'})
+
+
+@admin_bp.route('/delete-question/<int:question_id>/<int:test_id>')
+def delete_question(question_id, test_id):
+    """Deletes a specific question."""
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute("SELECT test_id FROM questions WHERE id = ?", (question_id,))
+        question = cursor.fetchone()
+        cursor.execute("DELETE FROM questions WHERE id = ?", (question_id,))
+        cursor.execute("DELETE FROM question_stats WHERE question_id = ?", (question_id,))
+        if question:
+            bump_version(conn, question['test_id'])
+        conn.commit()
+        if question:
+            get_question_cache().invalidate(question['test_id'])
+        flash('تم حذف السؤال بنجاح.', 'success')
+    except sqlite3.Error as e:
+        flash(f'حدث خطأ أثناء حذف السؤال: {e}', 'danger')
+
+    return redirect(url_for('admin.manage_questions', test_id=test_id))
+
+
+@admin_bp.route('/manage-users')
+def manage_users():
+    """Displays non-admin users, one page at a time."""
+    page = None
+    try:
+        conn = get_db()
+        page = paginate(conn, "SELECT id, username, email FROM users WHERE username != 'admin' {keyset} ORDER BY {order}",
+                        (), [('id', 'id')])
+    except sqlite3.Error as e:
+        flash(f'خطأ في جلب المستخدمين: {e}', 'danger')
+
+    return render_template('admin/manage_users.html', users=page.items if page else [], page=page)
+
+@admin_bp.route('/import-users', methods=['POST'])
+def import_users():
+    """Creates student accounts from an uploaded CSV roster."""
+    upload = request.files.get('users_file')
+    if not upload or not upload.filename:
+        flash('الرجاء اختيار ملف الطلاب.', 'danger')
+        return redirect(url_for('admin.manage_users'))
+
+    dry_run = bool(request.form.get('dry_run'))
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    try:
+        summary = user_io.import_users(get_db(), stream, dry_run=dry_run,
+                                       pool=passwords.get_password_pool(),
+                                       max_rows=current_app.config.get('USER_IMPORT_MAX_ROWS'))
+    except (sqlite3.Error, UnicodeDecodeError, csv.Error) as e:
+        summary = None
+        flash(f'حدث خطأ أثناء استيراد الطلاب: {e}', 'danger')
+    except passwords.Overloaded:
+        summary = None
+        flash('الخادم مشغول حالياً؛ أعد رفع الملف بعد قليل (الحسابات المنشأة مسبقاً ستظهر كموجودة).', 'warning')
+
+    if summary:
+        if dry_run:
+            flash(f"الملف صالح لإنشاء {summary['imported']} حساباً (تجربة دون حفظ).", 'info')
+        else:
+            flash(f"تم إنشاء {summary['imported']} حساباً.", 'success' if summary['imported'] else 'warning')
+        errors = summary['errors']
+        if errors:
+            details = '، '.join(f'السطر {line}: {message}' for line, message in errors[:10])
+            more = f' (و{len(errors) - 10} أخطاء أخرى)' if len(errors) > 10 else ''
+            flash(f'تم تخطي {len(errors)} صفاً. {details}{more}', 'warning')
+    return redirect(url_for('admin.manage_users'))
+
+@admin_bp.route('/delete-user/<int:user_id>')
+def delete_user(user_id):
+    """Deletes a user and their associated results (due to ON DELETE CASCADE)."""
+    try:
+        conn = get_db() # Includes PRAGMA foreign_keys = ON
+        cursor = conn.cursor()
+        leaderboard.forget_user(conn, user_id)
+        archive.forget_user(conn, user_id)
+        cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        conn.commit()
+        flash(f'تم حذف المستخدم (ID: {user_id}) وجميع نتائجه بنجاح.', 'success')
+    except sqlite3.Error as e:
+        flash(f'حدث خطأ أثناء حذف المستخدم: {e}', 'danger')
+
+    return redirect(url_for('admin.manage_users'))
+
+# --- NEW: Route to delete a test ---
+@admin_bp.route('/delete-test/<int:test_id>')
+def delete_test(test_id):
+    """Deletes a test and its associated questions/results (due to ON DELETE CASCADE)."""
+    try:
+        conn = get_db() # Includes PRAGMA foreign_keys = ON
+        cursor = conn.cursor()
+        cursor.execute("SELECT type FROM tests WHERE id = ?", (test_id,))
+        test = cursor.fetchone()
+        archive.forget_test(conn, test_id)
+        cursor.execute("DELETE FROM tests WHERE id = ?", (test_id,))
+        cursor.execute("DELETE FROM question_stats WHERE test_id = ?", (test_id,))
+        bump_version(conn, test_id)
+        if test: # The cascade removed results, so the unlocked levels may have dropped
+            rebuild_progress(conn, test['type'])
+        conn.commit()
+        get_question_cache().invalidate(test_id)
+        flash(f'تم حذف الاختبار (ID: {test_id}) وجميع أسئلته ونتائجه بنجاح.', 'success')
+    except sqlite3.Error as e:
+        flash(f'حدث خطأ أثناء حذف الاختبار: {e}.', 'danger')
+        print(f"Error deleting test {test_id}: {e}") # Log error for debugging
+
+    return redirect(url_for('admin.manage_tests'))
+# --- End NEW ---
+
+
+@admin_bp.route('/export-results')
+def export_results():
+    """Shows the filter form for exporting test results."""
+    tests = []
+    try:
+        tests = get_db().execute("SELECT id, name, type, level FROM tests ORDER BY type, level, id").fetchall()
+    except sqlite3.Error as e:
+        flash(f'حدث خطأ أثناء جلب الاختبارات: {e}', 'danger')
+    return render_template('admin/export_results.html', tests=tests)
+
+
+@admin_bp.route('/export-results/download')
+def download_results():
+    """Streams the filtered test results as CSV or Parquet."""
+    try:
+        filters = results_export.ExportFilters.from_args(request.args)
+    except ValueError:
+        flash('قيم التصفية غير صالحة.', 'danger')
+        return redirect(url_for('admin.export_results'))
+    file_format = 'parquet' if request.args.get('format') == 'parquet' else 'csv'
+    chunk_size = current_app.config.get('RESULTS_EXPORT_CHUNK_SIZE', 5000)
+    pool = results_export.get_export_pool()
+    try:
+        conn = pool.acquire()
+    except sqlite3.OperationalError:
+        flash('يوجد تصدير آخر قيد التنفيذ، الرجاء المحاولة بعد قليل.', 'warning')
+        return redirect(url_for('admin.export_results'))
+
+    chunks = results_export.iter_result_chunks(conn, filters, chunk_size)
+    filename = f"test_results_{dt.now():%Y%m%d_%H%M%S}.{file_format}"
+    headers = {'Content-Disposition': f'attachment; filename={filename}'}
+    if file_format == 'csv':
+        response = Response(results_export.csv_chunks(chunks), mimetype='text/csv; charset=utf-8', headers=headers)
+        response.call_on_close(lambda: pool.release(conn))
+        return response
+
+    # Parquet's footer is written last, so build the file on disk first
+    spool = tempfile.TemporaryFile()
+    try:
+        results_export.write_parquet(chunks, spool)
+    except (RuntimeError, sqlite3.Error) as e:
+        spool.close()
+        flash(f'تعذر إنشاء ملف Parquet: {e}', 'danger')
+        return redirect(url_for('admin.export_results'))
+    finally:
+        pool.release(conn)
+    spool.seek(0)
+    return Response(wrap_file(request.environ, spool), mimetype='application/vnd.apache.parquet',
+                    headers=headers, direct_passthrough=True)
+
+
+@admin_bp.route('/metrics')
+def view_metrics():
+    """Shows per-endpoint latency percentiles, SQL and render cost."""
+    registry = metrics.get_registry(current_app)
+    writer = get_result_writer()
+    return render_template('admin/metrics.html',
+                           enabled=current_app.config.get('METRICS_ENABLED'),
+                           endpoints=registry.snapshot(),
+                           counters=registry.counter_snapshot(),
+                           cache_stats=get_question_cache().stats(),
+                           writer=writer)
+
+
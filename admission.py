@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""Admission control for the routes every student hits at once.
+
+When an exam opens or closes, take_test and submit_test get a burst of
+requests within seconds. Letting all of them in makes them all slow: they
+queue on the connection pool and the SQLite write lock until they time out,
+and almost nobody gets through. Instead each limited route has a ``Gate``:
+
+* a token bucket caps the rate at which requests are let in (``rate`` per
+  second, ``burst`` at once);
+* at most ``concurrency`` requests run the view at the same time;
+* up to ``queue`` more wait their turn in arrival order, one per student,
+  for at most ``max_wait`` seconds.
+
+Everything beyond that is turned away at once with a 503 and a small page
+that retries by itself after ``Retry-After`` seconds, re-posting the
+submitted answers. The requests that are admitted finish at normal speed.
+Limits are per process; see ``ADMISSION_LIMITS`` in config.py.
+"""
+import functools
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from flask import current_app, render_template, request, session
+
+import metrics
+
+
+class TokenBucket:
+    """Allows ``rate`` events per second on average and ``burst`` at once."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self):
+        """Takes a token and returns 0, or returns the seconds until one is available (taking nothing)."""
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def charge(self):
+        """Takes a token even if none is left; the debt delays later admissions."""
+        with self._lock:
+            self._refill()
+            self.tokens -= 1
+
+
+class Gate:
+    """A concurrency limit with a bounded FIFO of waiters and an optional token bucket."""
+
+    def __init__(self, concurrency, queue=0, max_wait=0.0, rate=None, burst=None):
+        self.concurrency = concurrency
+        self.queue = queue
+        self.max_wait = max_wait
+        self.bucket = TokenBucket(rate, burst or rate) if rate else None
+        self.active = 0
+        self.shed_rate = 0.0 # Per second, over the last full second
+        self.done_rate = 0.0
+        self._sheds = 0
+        self._done = 0
+        self._window_start = time.monotonic()
+        self.pid = os.getpid()
+        self._waiters = deque()
+        self._waiting_keys = set()
+        self._lock = threading.Lock()
+
+    def acquire(self, key=None):
+        """Returns ``(None, seconds_waited)`` once admitted, or ``(reason, retry_after_seconds)`` when shed.
+
+        ``key`` identifies the client; a client already waiting cannot queue
+        a second request (a student hammering reload). A rate token is spent
+        only by a request that is let in: one that is queued takes its token
+        when it gets a slot, and one that is turned away takes none.
+        """
+        with self._lock:
+            if self.active < self.concurrency and not self._waiters:
+                wait = self.bucket.take() if self.bucket else 0.0
+                if wait:
+                    return self._shed('rate', wait)
+                self.active += 1
+                return None, 0
+            if len(self._waiters) >= self.queue:
+                return self._shed('queue_full')
+            if key is not None:
+                if key in self._waiting_keys:
+                    return self._shed('duplicate')
+                self._waiting_keys.add(key)
+            waiter = (threading.Event(), key)
+            self._waiters.append(waiter)
+        started = time.monotonic()
+        if waiter[0].wait(self.max_wait):
+            return self._admit_waiter(started)
+        with self._lock:
+            if waiter[0].is_set(): # Handed a slot just as the wait ran out
+                return self._admit_waiter(started)
+            self._waiters.remove(waiter)
+            self._waiting_keys.discard(key)
+            return self._shed('timeout')
+
+    def _admit_waiter(self, started):
+        if self.bucket:
+            self.bucket.charge()
+        return None, time.monotonic() - started
+
+    def _tick(self):
+        now = time.monotonic()
+        if now - self._window_start >= 1.0:
+            self.shed_rate = self._sheds / (now - self._window_start)
+            self.done_rate = self._done / (now - self._window_start)
+            self._sheds = self._done = 0
+            self._window_start = now
+
+    def _shed(self, reason, wait=0.0):
+        self._tick()
+        self._sheds += 1
+        return reason, wait
+
+    def backlog_seconds(self):
+        """Roughly how long the requests shed in the last second would take to serve at the current rate."""
+        return self.shed_rate / max(self.done_rate, 1.0)
+
+    def release(self):
+        """Frees a slot, handing it straight to the longest waiter if there is one."""
+        with self._lock:
+            self._tick()
+            self._done += 1
+            if self._waiters:
+                event, key = self._waiters.popleft()
+                self._waiting_keys.discard(key)
+                event.set()
+            else:
+                self.active -= 1
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+
+_gates_lock = threading.Lock()
+
+
+def get_gate(name, app=None):
+    """This process's gate for ``name``, or None if the route is not limited."""
+    if app is None:
+        app = current_app._get_current_object()
+    gates = app.extensions.get('admission')
+    if gates is None or gates[0] != os.getpid():
+        with _gates_lock:
+            gates = app.extensions.get('admission')
+            if gates is None or gates[0] != os.getpid():
+                limits = app.config.get('ADMISSION_LIMITS') if app.config.get('ADMISSION_ENABLED') else None
+                gates = (os.getpid(), {route: Gate(**options) for route, options in (limits or {}).items()})
+                app.extensions['admission'] = gates
+    return gates[1].get(name)
+
+
+def shed(name, gate, reason, retry_after, as_json=False):
+    """The 503 "please wait" page; it retries the same request on its own.
+
+    The retries are spread at random over the time the gate needs to serve
+    the requests it has been turning away, so they come back at about the
+    rate it completes them instead of as another burst. API clients
+    (``as_json``) get ``{"error": "busy", "retry_after": n}`` and should
+    wait as long before retrying.
+    """
+    metrics.get_registry(current_app).increment('admission_shed', route=name, reason=reason)
+    base = current_app.config.get('ADMISSION_RETRY_AFTER', 2)
+    spread = random.uniform(0, base + gate.backlog_seconds())
+    retry_after = min(math.ceil(max(retry_after, base) + spread), current_app.config.get('ADMISSION_MAX_RETRY_AFTER', 30))
+    if as_json:
+        response = current_app.response_class(json.dumps({'error': 'busy', 'retry_after': retry_after}),
+                                              status=503, mimetype='application/json')
+    else:
+        fields = list(request.form.items(multi=True)) if request.method == 'POST' else []
+        response = current_app.response_class(
+            render_template('busy.html', retry_after=retry_after, method=request.method,
+                            url=request.full_path if request.query_string else request.path, fields=fields),
+            status=503, mimetype='text/html')
+    response.headers['Retry-After'] = str(retry_after)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+def limit(name, as_json=False):
+    """Runs the decorated view behind the gate ``name``; ``as_json`` for API views."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            gate = get_gate(name)
+            if gate is None:
+                return view(*args, **kwargs)
+            reason, seconds = gate.acquire(session.get('user_id'))
+            if reason:
+                return shed(name, gate, reason, seconds, as_json)
+            if seconds:
+                metrics.get_registry(current_app).increment('admission_queued', route=name)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                gate.release()
+        return wrapper
+    return decorator
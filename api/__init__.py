@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""The JSON API for the mobile app (``/api/v1``); its routes live in api/routes.py.
+
+It serves the same data as the dashboard, test and results pages and uses
+the same session cookie, so a client logs in through ``/login`` first.
+"""
+from flask import Blueprint
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+from . import routes  # noqa: E402,F401 - registers the routes on api_bp
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""JSON versions of the dashboard, take_test and submit_test (``/api/v1``).
+
+Responses are compact UTF-8 JSON with a strong ETag, so a client polling
+with ``If-None-Match`` gets an empty 304 while nothing changed. Rendered
+bodies are kept in this process's ``api_cache``:
+
+* a student's dashboard, for as long as their ``user_progress`` rows are
+  unchanged (every recorded result bumps ``attempts``) and at most
+  ``API_CACHE_SECONDS``, since new tests and other students' scores (the
+  percentiles) change it too. A poll then costs one primary-key lookup and
+  a dictionary lookup; pages further back in the history are not cached;
+* a test that serves its whole bank, shared by every student until the
+  bank version changes. Pooled and adaptive tests open a per-student
+  attempt and are rendered on each request.
+
+Questions never carry their correct option.
+"""
+import json
+import sqlite3
+import time
+
+from flask import current_app, request, session, url_for
+from werkzeug.datastructures import MultiDict
+
+import admission
+import http_cache
+import queries
+from db import get_db
+from views import SubmissionRejected, dashboard_data, grade_submission, open_test
+
+from . import api_bp
+
+
+def get_api_cache(app=None):
+    if app is None:
+        app = current_app._get_current_object()
+    cache = app.extensions.get('api_cache')
+    if cache is None:
+        cache = app.extensions.setdefault(
+            'api_cache', http_cache.FragmentCache(app.config.get('API_CACHE_MAX_ENTRIES', 5000), 'api_cache'))
+    return cache
+
+
+def render(payload):
+    return http_cache.RenderedPage(json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=str),
+                                   'application/json')
+
+
+def json_response(payload, status=200):
+    """An uncached JSON response, for errors and per-request results."""
+    response = current_app.response_class(render(payload).body, status=status, mimetype='application/json')
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@api_bp.before_request
+def require_student_login():
+    if 'user_id' not in session:
+        return json_response({'error': 'login required'}, 401)
+    if session.get('username') == 'admin':
+        return json_response({'error': 'not available to the admin'}, 403)
+
+
+@api_bp.errorhandler(sqlite3.Error)
+def database_error(e):
+    print(f"Database error in {request.endpoint}: {e}")
+    return json_response({'error': 'database error'}, 503)
+
+
+def dashboard_payload(conn, user_id, full_history):
+    data = dashboard_data(conn, user_id, full_history)
+    tests = [dict(test, type=test_type)
+             for test_type, by_level in (('قياس', data['tests_qiyas_by_level']),
+                                         ('تحصيلي', data['tests_tahseli_by_level']))
+             for level in sorted(by_level) for test in by_level[level]]
+    page = data['history_page']
+    return {'username': session.get('username'), 'tests': tests, 'history': data['past_results'],
+            'next': page.next_cursor, 'prev': page.prev_cursor}
+
+
+@api_bp.route('/dashboard')
+def dashboard():
+    """The tests a student can take and their past results, newest first (``?history=all`` adds archived ones)."""
+    conn = get_db()
+    user_id = session['user_id']
+    full_history = request.args.get('history') == 'all'
+    if any(arg in request.args for arg in ('after', 'before', 'per_page')):
+        return http_cache.page_response(render(dashboard_payload(conn, user_id, full_history)))
+    progress = conn.execute(queries.DASHBOARD_VERSION, (user_id,)).fetchone()
+    version = (progress[0], progress[1], int(time.time() // current_app.config.get('API_CACHE_SECONDS', 30)))
+    page = get_api_cache().get(('dashboard', user_id, full_history), version,
+                               lambda: render(dashboard_payload(conn, user_id, full_history)))
+    return http_cache.page_response(page)
+
+
+@api_bp.route('/tests/<int:test_id>')
+@admission.limit('take_test', as_json=True)
+def test(test_id):
+    """The questions of a test, without answers; adaptive tests serve one question at a time."""
+    conn = get_db()
+    row = conn.execute(queries.TEST_INFO, (test_id,)).fetchone()
+    if not row:
+        return json_response({'error': 'test not found'}, 404)
+    test_data = open_test(conn, session['user_id'], row)
+    conn.commit()
+    if test_data is None:
+        return json_response({'error': 'test has no questions'}, 404)
+
+    def payload():
+        data = {key: value for key, value in test_data.items() if key not in ('questions', 'version')}
+        data['questions'] = [{'id': q['id'], 'text': q['text'], 'options': q['options']}
+                             for q in test_data['questions']]
+        return render(data)
+
+    if test_data['version'] is not None: # The same for every student
+        return http_cache.page_response(get_api_cache().get(('test', test_id), test_data['version'], payload))
+    return http_cache.page_response(payload())
+
+
+@api_bp.route('/tests/<int:test_id>/submit', methods=['POST'])
+@admission.limit('submit_test', as_json=True)
+def submit(test_id):
+    """Grades a test from ``{"answers": {question_id: option}, "attempt_id": ..., "question_id": ...}``.
+
+    A form post with the fields of test.html works too. Adaptive tests take
+    one answer per call and reply ``{"finished": false, "next": url}``
+    until the session stops.
+    """
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        answers = body.get('answers') or {}
+        if not isinstance(answers, dict):
+            return json_response({'error': 'invalid answers'}, 400)
+        form = MultiDict({f'question_{qid}': str(option) for qid, option in answers.items()})
+        for field in ('attempt_id', 'question_id'):
+            if body.get(field) is not None:
+                form[field] = str(body[field])
+    else:
+        form = request.form
+    try:
+        result = grade_submission(get_db(), session['user_id'], test_id, form)
+    except SubmissionRejected as e:
+        return json_response({'error': e.message}, 409)
+    if result is None:
+        return json_response({'finished': False, 'next': url_for('api.test', test_id=test_id)})
+    return json_response(dict(result, finished=True))
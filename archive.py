@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""Hot/cold split of ``test_results``: old attempts move to an archive database.
+
+``dashboard`` and ``submit_test`` only read ``test_results``, so that table
+and its indexes should hold recent attempts only. ``flask archive-results``
+moves results older than ``ARCHIVE_AFTER_DAYS``, with their
+``answer_responses``, into the database at ``ARCHIVE_DATABASE``, which every
+pooled connection attaches as ``archive``. The summaries the dashboard uses
+(``user_progress``, ``score_histograms``, ``test_best``, ``question_stats``)
+are aggregates over all attempts and are left as they are.
+
+Reads that need every attempt (the full history, reviewing an old attempt,
+exports and the rebuild commands) go through the temporary views
+``all_test_results`` and ``all_answer_responses``: the hot and archived
+tables joined with UNION ALL, or just the hot tables when no archive is
+configured. Result ids are never reused, so an id names one attempt in
+either place. The views list the hot tables' columns as they are when the
+connection opens (``migrations.upgrade`` redefines them), so a migration
+that adds a column to ``test_results`` must add it to ``ARCHIVE_SCHEMA`` too.
+
+SQLite commits a transaction that spans attached WAL databases atomically
+per file only. Each chunk is therefore copied and committed before it is
+deleted: a crash can leave a chunk in both tables for a moment, never in
+neither, and running the command again finishes the move.
+"""
+import json
+
+RESULT_COLUMNS = ('id', 'user_id', 'test_id', 'score', 'total_questions', 'percentage', 'timestamp',
+                  'answers', 'answers_fingerprint', 'attempt_id')
+RESPONSE_COLUMNS = ('result_id', 'question_id', 'chosen_option', 'correct')
+
+# The archive has no foreign keys into the main database (SQLite cannot
+# declare them across files); forget_user and forget_test delete by hand.
+ARCHIVE_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS archive.test_results (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        test_id INTEGER NOT NULL,
+        score INTEGER NOT NULL,
+        total_questions INTEGER NOT NULL,
+        percentage INTEGER NOT NULL,
+        timestamp DATETIME,
+        answers BLOB,
+        answers_fingerprint INTEGER,
+        attempt_id INTEGER
+    )
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS archive.idx_archived_results_user_timestamp
+    ON test_results (user_id, timestamp, id, test_id, score, total_questions, percentage)
+    ''',
+    'CREATE INDEX IF NOT EXISTS archive.idx_archived_results_test ON test_results (test_id)',
+    '''
+    CREATE TABLE IF NOT EXISTS archive.answer_responses (
+        result_id INTEGER NOT NULL,
+        question_id INTEGER NOT NULL,
+        chosen_option INTEGER NOT NULL,
+        correct INTEGER NOT NULL,
+        PRIMARY KEY (result_id, question_id)
+    ) WITHOUT ROWID
+    ''',
+    'CREATE INDEX IF NOT EXISTS archive.idx_archived_responses_question ON answer_responses (question_id)',
+]
+
+
+def _union_view(conn, name, table, columns, archived):
+    current = [row[1] for row in conn.execute(f"PRAGMA main.table_info({table})")]
+    columns = ', '.join(column for column in columns if column in current or not current)
+    select = f"SELECT {columns} FROM main.{table}"
+    if archived:
+        select += f" UNION ALL SELECT {columns} FROM archive.{table}"
+    conn.execute(f"DROP VIEW IF EXISTS temp.{name}")
+    conn.execute(f"CREATE TEMP VIEW {name} AS {select}")
+
+
+def define_views(conn):
+    """(Re)creates the ``all_test_results`` and ``all_answer_responses`` views on ``conn``."""
+    archived = is_attached(conn)
+    _union_view(conn, 'all_test_results', 'test_results', RESULT_COLUMNS, archived)
+    _union_view(conn, 'all_answer_responses', 'answer_responses', RESPONSE_COLUMNS, archived)
+
+
+def attach(conn, path):
+    """Attaches the archive at ``path`` (if any) and defines the ``all_*`` views on ``conn``."""
+    if path:
+        conn.execute("ATTACH DATABASE ? AS archive", (path,))
+        conn.execute("PRAGMA archive.journal_mode = WAL")
+        for statement in ARCHIVE_SCHEMA:
+            conn.execute(statement)
+    define_views(conn)
+
+
+def is_attached(conn):
+    return any(row[1] == 'archive' for row in conn.execute("PRAGMA database_list"))
+
+
+def archive_results(conn, before, chunk_size=5000):
+    """Moves results dated before ``before`` and their answer responses to the archive.
+
+    Works through the hot table in id order, ``chunk_size`` results per pair
+    of transactions, and commits as it goes. Returns the number of results
+    moved.
+    """
+    if not is_attached(conn):
+        raise RuntimeError('No archive database is configured (ARCHIVE_DATABASE).')
+    results = ', '.join(RESULT_COLUMNS)
+    responses = ', '.join(RESPONSE_COLUMNS)
+    moved = 0
+    last_id = 0
+    while True:
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM main.test_results WHERE id > ? AND timestamp < ? ORDER BY id LIMIT ?",
+            (last_id, before, chunk_size))]
+        if not ids:
+            break
+        last_id = ids[-1]
+        ids_json = json.dumps(ids)
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(f"""
+            INSERT OR IGNORE INTO archive.test_results ({results})
+            SELECT {results} FROM main.test_results WHERE id IN (SELECT value FROM json_each(?))
+        """, (ids_json,))
+        conn.execute(f"""
+            INSERT OR IGNORE INTO archive.answer_responses ({responses})
+            SELECT {responses} FROM main.answer_responses WHERE result_id IN (SELECT value FROM json_each(?))
+        """, (ids_json,))
+        conn.commit()
+        # The answer responses go with their results through the foreign key
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.execute("""
+            DELETE FROM main.test_results
+            WHERE id IN (SELECT value FROM json_each(?)) AND id IN (SELECT id FROM archive.test_results)
+        """, (ids_json,))
+        moved += cursor.rowcount
+        conn.commit()
+    return moved
+
+
+def _forget(conn, where, params):
+    if not is_attached(conn):
+        return
+    conn.execute(f"""
+        DELETE FROM archive.answer_responses
+        WHERE result_id IN (SELECT id FROM archive.test_results WHERE {where})
+    """, params)
+    conn.execute(f"DELETE FROM archive.test_results WHERE {where}", params)
+
+
+def forget_user(conn, user_id):
+    """Deletes a user's archived results; the caller deletes the user and commits."""
+    _forget(conn, "user_id = ?", (user_id,))
+
+
+def forget_test(conn, test_id):
+    """Deletes a test's archived results; the caller deletes the test and commits."""
+    _forget(conn, "test_id = ?", (test_id,))
+
+
+def purge_orphans(conn):
+    """Deletes archived results whose user or test no longer exists. Returns how many."""
+    if not is_attached(conn):
+        return 0
+    where = ("user_id NOT IN (SELECT id FROM main.users) "
+             "OR test_id NOT IN (SELECT id FROM main.tests)")
+    count = conn.execute(f"SELECT COUNT(*) FROM archive.test_results WHERE {where}").fetchone()[0]
+    if count:
+        _forget(conn, where, ())
+    return count
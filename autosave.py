@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""Answers saved while a test is in progress, with coalesced writes.
+
+test.html posts each changed answer to /autosave/<test_id> and restores
+the saved ones when the page is reloaded, so a dropped connection no longer
+loses the attempt. Saving is frequent and each save is small, so the
+``AutosaveBuffer`` keeps the latest answers of each ``(user, test)`` in
+memory. A background thread writes everything changed since the last pass
+every ``AUTOSAVE_FLUSH_MS`` in one transaction. Each changed draft becomes
+one upsert into ``draft_answers``; ``json_patch`` merges the new answers into
+the stored ones. Thousands of clicks a second become a few hundred row
+writes and one commit per interval.
+
+Each draft belongs to one attempt, named by a token the page gets with the
+saved answers (``new_attempt_token``: microseconds since the epoch, so later
+attempts get larger tokens) and sends with every save. submit_test grades
+the posted form on top of the draft and then closes it: the answers are
+cleared and the row keeps the token of the submission with ``submitted``
+set. A save for that attempt or an earlier one, such as a request still
+in flight or still waiting in another worker's buffer, is turned away
+(``accepts``) instead of bringing the old answers back into the next
+attempt; the upsert applies the same rule when a buffered save is written
+late. Buffers are per process; a draft saved through another worker is
+visible once that worker has flushed it.
+"""
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from flask import current_app
+
+import queries
+from db import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+_UPSERT_DRAFT = """
+    INSERT INTO draft_answers (user_id, test_id, attempt, answers, updated_at) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, test_id) DO UPDATE SET
+        answers = CASE WHEN attempt = excluded.attempt THEN json_patch(answers, excluded.answers)
+                       ELSE excluded.answers END,
+        attempt = excluded.attempt,
+        submitted = 0,
+        updated_at = excluded.updated_at
+    WHERE excluded.attempt > draft_answers.attempt
+       OR (excluded.attempt = draft_answers.attempt AND NOT draft_answers.submitted)
+"""
+
+_CLOSE_DRAFT = """
+    INSERT INTO draft_answers (user_id, test_id, attempt, answers, updated_at, submitted) VALUES (?, ?, ?, '{}', ?, 1)
+    ON CONFLICT(user_id, test_id) DO UPDATE SET
+        answers = '{}',
+        attempt = MAX(attempt, excluded.attempt),
+        submitted = 1,
+        updated_at = excluded.updated_at
+"""
+
+# ``submitted`` drafts hold no answers; their ``attempt`` is the token of the submission.
+Draft = namedtuple('Draft', 'attempt submitted answers')
+
+_buffer_lock = threading.Lock()
+
+
+def new_attempt_token(draft=None):
+    """A token for a new attempt, later than any ``draft`` already has."""
+    token = time.time_ns() // 1000
+    return max(token, draft.attempt + 1) if draft else token
+
+
+def clean_answers(payload, max_answers):
+    """Returns ``(attempt, {question_id: option})`` from an autosave request body, or None if invalid."""
+    if not isinstance(payload, dict):
+        return None
+    attempt, answers = payload.get('attempt'), payload.get('answers')
+    if type(attempt) is not int or attempt < 0 or not isinstance(answers, dict) or len(answers) > max_answers:
+        return None
+    cleaned = {}
+    for qid, option in answers.items():
+        if not str(qid).isdigit() or not isinstance(option, str) or len(option) > 1000:
+            return None
+        cleaned[str(int(qid))] = option
+    return attempt, cleaned
+
+
+def accepts(draft, attempt):
+    """Whether answers saved for ``attempt`` may go into ``draft`` (the same open attempt, or a later one)."""
+    return draft is None or attempt > draft.attempt or (attempt == draft.attempt and not draft.submitted)
+
+
+def write_drafts(conn, rows):
+    """Upserts ``(user_id, test_id, attempt, answers, timestamp)`` rows; the caller commits.
+
+    Rows for a submitted or superseded attempt are skipped.
+    """
+    conn.executemany(_UPSERT_DRAFT, [(user_id, test_id, attempt, json.dumps(answers, ensure_ascii=False), timestamp)
+                                     for user_id, test_id, attempt, answers, timestamp in rows])
+
+
+def close_draft(conn, user_id, test_id, timestamp):
+    """Marks the draft of a submitted test closed, so no earlier attempt can save into it; the caller commits."""
+    conn.execute(_CLOSE_DRAFT, (user_id, test_id, new_attempt_token(), timestamp))
+
+
+def load_draft(conn, user_id, test_id):
+    """The stored ``Draft`` of a user's test, or None."""
+    row = conn.execute(queries.DRAFT_ANSWERS, (user_id, test_id)).fetchone()
+    return Draft(row[0], bool(row[1]), json.loads(row[2])) if row else None
+
+
+def overlay(draft, attempt, answers):
+    """``draft`` with unwritten ``answers`` saved for ``attempt`` applied, as the upsert would."""
+    if not accepts(draft, attempt):
+        return draft
+    if draft is not None and draft.attempt == attempt:
+        return Draft(attempt, False, dict(draft.answers, **answers))
+    return Draft(attempt, False, dict(answers))
+
+
+def _merge(entries, key, attempt, answers):
+    """Adds later answers to a buffered ``(attempt, answers)`` entry, keeping only the latest attempt."""
+    entry = entries.get(key)
+    if entry is None or attempt > entry[0]:
+        entries[key] = (attempt, dict(answers))
+    elif attempt == entry[0]:
+        entry[1].update(answers)
+
+
+class AutosaveBuffer:
+    """Coalesces saved answers per ``(user_id, test_id)`` and writes them from a background thread."""
+
+    def __init__(self, pool, flush_interval_ms=1000, max_pending=20000):
+        self.pool = pool
+        self.interval = flush_interval_ms / 1000
+        self.max_pending = max_pending
+        self.pid = os.getpid()
+        self.saves = 0
+        self.flushes = 0
+        self.written = 0
+        self._pending = {}
+        self._flushing = {} # The batch being written, still visible to draft()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='autosave-writer', daemon=True)
+        self._thread.start()
+
+    def save(self, user_id, test_id, attempt, answers):
+        """Buffers answers; returns False if the buffer is full and the caller should write them itself."""
+        key = (user_id, test_id)
+        with self._lock:
+            if key not in self._pending and len(self._pending) >= self.max_pending:
+                return False
+            _merge(self._pending, key, attempt, answers)
+            self.saves += 1
+        return True
+
+    def draft(self, conn, user_id, test_id):
+        """The ``Draft`` of a user's test: the stored one overlaid with saves not yet written."""
+        key = (user_id, test_id)
+        with self._lock: # Before reading the table: a batch leaves _flushing only once committed
+            unwritten = [(entry[0], dict(entry[1])) for entry in (self._flushing.get(key), self._pending.get(key))
+                         if entry is not None]
+        draft = load_draft(conn, user_id, test_id)
+        for attempt, answers in unwritten:
+            draft = overlay(draft, attempt, answers)
+        return draft
+
+    def discard(self, user_id, test_id):
+        """Forgets the unwritten answers of a submitted attempt; the caller closes its stored draft."""
+        with self._lock:
+            self._pending.pop((user_id, test_id), None)
+            self._flushing.pop((user_id, test_id), None)
+
+    def flush(self):
+        """Writes everything buffered so far in one transaction."""
+        with self._lock:
+            if not self._pending:
+                return
+            self._flushing, self._pending = self._pending, {}
+        timestamp = datetime.now()
+        with self.pool.connection() as conn:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+            except sqlite3.Error as e: # Database locked: keep the batch for the next pass
+                logger.warning("Error starting to save drafts, will retry: %s", e)
+                with self._lock:
+                    for key in list(self._flushing):
+                        if key in self._pending: # Newer saves go on top of the older batch
+                            _merge(self._flushing, key, *self._pending[key])
+                        self._pending[key] = self._flushing[key]
+                    self._flushing = {}
+                return
+            try:
+                # Taken under the write lock: a draft discarded by now is not written, and the
+                # upsert skips the saves of any attempt closed before this commit
+                with self._lock:
+                    rows = [(user_id, test_id, attempt, answers, timestamp)
+                            for (user_id, test_id), (attempt, answers) in self._flushing.items()]
+                write_drafts(conn, rows)
+                conn.commit()
+                self.written += len(rows)
+            except sqlite3.Error as e:
+                conn.rollback()
+                logger.warning("Error saving %d drafts, retrying one by one: %s", len(rows), e)
+                # Isolate the rows that fail (e.g. the user or test was deleted meanwhile)
+                for row in rows:
+                    try:
+                        write_drafts(conn, [row])
+                        conn.commit()
+                        self.written += 1
+                    except sqlite3.Error as e:
+                        conn.rollback()
+                        logger.error("Dropped draft of user %s on test %s: %s", row[0], row[1], e)
+            finally:
+                with self._lock:
+                    self._flushing = {}
+        self.flushes += 1
+
+    def close(self):
+        """Stops the thread after writing everything still buffered."""
+        if self._thread.is_alive():
+            self._stop.set()
+            self._thread.join()
+        self.flush()
+        self.pool.close()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Error flushing autosaved answers")
+
+
+def get_autosave_buffer(app=None):
+    """Returns this process's buffer, or None when saves are written inline (``AUTOSAVE_FLUSH_MS`` unset)."""
+    if app is None:
+        app = current_app._get_current_object()
+    if not app.config.get('AUTOSAVE_FLUSH_MS'):
+        return None
+    buffer = app.extensions.get('autosave')
+    if buffer is None or buffer.pid != os.getpid():
+        with _buffer_lock:
+            buffer = app.extensions.get('autosave')
+            if buffer is None or buffer.pid != os.getpid():
+                buffer = AutosaveBuffer(
+                    ConnectionPool.from_config(dict(app.config, DB_POOL_SIZE=1)),
+                    flush_interval_ms=app.config['AUTOSAVE_FLUSH_MS'],
+                    max_pending=app.config.get('AUTOSAVE_MAX_PENDING', 20000),
+                )
+                app.extensions['autosave'] = buffer
+                atexit.register(buffer.close)
+    return buffer
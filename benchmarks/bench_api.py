@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Dashboard polling: the HTML page against the cached JSON API.
+
+Seeds ``--users`` students with ``--history`` past results each, then has
+``--polls`` random students fetch, in turn, the server-rendered dashboard,
+``/api/v1/dashboard`` (the first fetch per student renders, later ones hit
+the cache) and ``/api/v1/dashboard`` with the ETag it returned, which is
+answered with an empty 304. Reports latency and bytes per response.
+
+Usage::
+
+    python benchmarks/bench_api.py --users 2000 --history 50 --polls 5000
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from db import get_db  # noqa: E402
+from loadtest import seed  # noqa: E402
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def run(client, cookies, rng, polls, path, etags=None):
+    timings, sizes = [], []
+    for _ in range(polls):
+        user_id = rng.choice(list(cookies))
+        client.set_cookie(app.config.get('SESSION_COOKIE_NAME', 'session'), cookies[user_id])
+        headers = {'If-None-Match': etags[user_id]} if etags and user_id in etags else {}
+        start = time.perf_counter()
+        response = client.get(path, headers=headers)
+        body = response.get_data()
+        timings.append(time.perf_counter() - start)
+        sizes.append(len(body))
+        if etags is not None and response.status_code == 200:
+            etags[user_id] = response.headers['ETag']
+    return timings, sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--history', type=int, default=50)
+    parser.add_argument('--tests', type=int, default=20)
+    parser.add_argument('--polls', type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, 'api.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            seed(args.tests, 10, args.users, args.history)
+        with app.app_context():
+            users = get_db().execute("SELECT id, username FROM users WHERE username != 'admin'").fetchall()
+        serializer = app.session_interface.get_signing_serializer(app)
+        cookies = {u['id']: serializer.dumps({'user_id': u['id'], 'username': u['username']}) for u in users}
+        client = app.test_client()
+
+        for label, path, etags in (('HTML dashboard', '/dashboard', None),
+                                   ('API, cached', '/api/v1/dashboard', None),
+                                   ('API, If-None-Match', '/api/v1/dashboard', {})):
+            if etags is not None: # Every student has polled once and holds an ETag
+                run(client, cookies, random.Random(1), args.polls, path, etags)
+            timings, sizes = run(client, cookies, random.Random(1), args.polls, path, etags)
+            print(f"{label:20} p50 {percentile(timings, 50) * 1000:6.2f} ms  "
+                  f"p95 {percentile(timings, 95) * 1000:6.2f} ms  "
+                  f"{sum(sizes) / len(sizes):8.0f} bytes per response")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Autosave requests per second and the database writes behind them.
+
+``--students`` students are mid-exam, each answering questions on a
+``--questions`` question test; ``--threads`` clients send their autosave
+requests (one changed answer each) as fast as they can for ``--seconds``.
+Inline mode writes and commits every request; buffered mode coalesces them
+per student and writes every ``--flush-ms``. Each mode runs against a fresh
+database, and the saved drafts are checked against the last answer sent
+for every question.
+
+Usage::
+
+    python benchmarks/bench_autosave.py --students 5000 --threads 16 --seconds 5 --synchronous FULL
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, hash_password, init_db  # noqa: E402
+from autosave import get_autosave_buffer, load_draft  # noqa: E402
+from db import get_db  # noqa: E402
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def seed(students, questions):
+    """Returns the test id, its question ids and a signed session cookie per student."""
+    with app.app_context():
+        init_db()
+        conn = get_db()
+        test_id = conn.execute("INSERT INTO tests (name, type, level) VALUES ('autosave', 'قياس', 1)").lastrowid
+        conn.executemany("""
+            INSERT INTO questions (test_id, text, option1, option2, option3, option4, correct_option)
+            VALUES (?, ?, 'أ', 'ب', 'ج', 'د', 'أ')
+        """, [(test_id, f'سؤال {q}') for q in range(questions)])
+        password = hash_password('pw')
+        conn.executemany("INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
+                         [(f'student{i}', f'student{i}@example.com', password) for i in range(students)])
+        conn.commit()
+        question_ids = [row[0] for row in conn.execute("SELECT id FROM questions WHERE test_id = ?", (test_id,))]
+        users = conn.execute("SELECT id, username FROM users WHERE username LIKE 'student%' ORDER BY id").fetchall()
+    serializer = app.session_interface.get_signing_serializer(app)
+    cookies = {u['id']: serializer.dumps({'user_id': u['id'], 'username': u['username']}) for u in users}
+    return test_id, question_ids, cookies
+
+
+def run_mode(mode, args):
+    app.extensions.pop('sqlite_pool', None)
+    app.extensions.pop('autosave', None)
+    app.config['AUTOSAVE_FLUSH_MS'] = args.flush_ms if mode == 'buffered' else None
+    with contextlib.redirect_stdout(io.StringIO()):
+        test_id, question_ids, cookies = seed(args.students, args.questions)
+    user_ids = list(cookies)
+    url = f'/autosave/{test_id}'
+
+    stop = threading.Event()
+    latencies = []
+    last_sent = {}
+    lock = threading.Lock()
+
+    def client(worker):
+        rng = random.Random(worker)
+        http = app.test_client()
+        mine_users = user_ids[worker::args.threads] # Each student's saves arrive in order, as from one page
+        mine, sent = [], {}
+        while not stop.is_set():
+            user_id = rng.choice(mine_users)
+            qid = rng.choice(question_ids)
+            option = rng.choice('أبجد')
+            http.set_cookie(app.config['SESSION_COOKIE_NAME'], cookies[user_id])
+            start = time.perf_counter()
+            response = http.post(url, json={'attempt': 1, 'answers': {str(qid): option}})
+            if response.status_code == 200:
+                mine.append(time.perf_counter() - start)
+                sent[(user_id, qid)] = option
+        with lock:
+            latencies.extend(mine)
+            last_sent.update(sent)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.threads)]
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    with app.app_context():
+        buffer = get_autosave_buffer()
+        if buffer:
+            buffer.flush()
+        conn = get_db()
+        drafts = {}
+        for user_id, qid in last_sent:
+            drafts.setdefault(user_id, load_draft(conn, user_id, test_id).answers)
+        mismatches = sum(drafts[user_id].get(str(qid)) != option for (user_id, qid), option in last_sent.items())
+
+    print(f"[{mode}]")
+    print(f"  saves/s: {len(latencies) / args.seconds:9.1f}  "
+          f"p50 {percentile(latencies, 50) * 1000:6.2f} ms  p99 {percentile(latencies, 99) * 1000:6.2f} ms")
+    if buffer:
+        print(f"  rows written/s: {buffer.written / args.seconds:9.1f}  commits/s: {buffer.flushes / args.seconds:5.1f}")
+        buffer.close()
+    else:
+        print(f"  rows written/s: {len(latencies) / args.seconds:9.1f}  commits/s: {len(latencies) / args.seconds:5.1f}")
+    print(f"  drafts checked: {len(drafts)}, answers not matching the last one sent: {mismatches}")
+    return mismatches == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--questions', type=int, default=40)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--flush-ms', type=int, default=1000)
+    parser.add_argument('--synchronous', default='FULL',
+                        help='PRAGMA synchronous for request connections (default: FULL)')
+    parser.add_argument('--modes', default='inline,buffered')
+    args = parser.parse_args()
+
+    app.config['DB_SYNCHRONOUS'] = args.synchronous
+    app.config['DB_POOL_SIZE'] = args.threads + 2
+    app.config['SLOW_REQUEST_MS'] = None
+    consistent = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in args.modes.split(','):
+            app.config['DATABASE'] = os.path.join(tmp, f'{mode}.db')
+            consistent &= run_mode(mode, args)
+    return 0 if consistent else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""Goodput of an exam-start burst with and without admission control.
+
+The app runs in its own process behind Werkzeug's threaded server, one
+thread per connection. ``--students`` logged-in clients, one thread each,
+arrive within ``--window`` seconds, open the test and submit it, as at the
+start of a scheduled exam. A client gives up on a request after
+``--client-timeout`` seconds, as a browser or proxy would, and retries at
+once, as would a student who clicks again; so does a client that gets an
+error. The server still finishes a request the client gave up on. A 503 is
+retried after its Retry-After, scaled by ``--retry-scale`` to keep the run
+short. A student counts towards goodput when their submission succeeds
+within ``--deadline`` seconds of arriving. Each mode and burst size runs
+against a fresh database.
+
+Usage::
+
+    python benchmarks/bench_burst.py --students 100,400,1600 --window 1 --client-timeout 2
+"""
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import app, hash_password, init_db  # noqa: E402
+from db import get_db  # noqa: E402
+
+SERVER = r"""
+import json, sys
+from werkzeug.serving import make_server
+from app import create_app
+app = create_app(json.loads(sys.argv[1]))
+server = make_server('127.0.0.1', int(sys.argv[2]), app, threaded=True)
+print('ready', flush=True)
+server.serve_forever()
+"""
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def seed(students):
+    """Creates the students; returns the answer form and a signed session cookie per student."""
+    with app.app_context():
+        init_db()
+        conn = get_db()
+        conn.executemany(
+            "INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
+            [(f'student{i}', f'student{i}@example.com', hash_password('pw')) for i in range(students)])
+        conn.commit()
+        users = conn.execute("SELECT id, username FROM users WHERE username LIKE 'student%' ORDER BY id").fetchall()
+        questions = conn.execute("SELECT id, correct_option FROM questions WHERE test_id = 1").fetchall()
+    # Signing the session cookie directly skips a login burst that is not what is measured here
+    serializer = app.session_interface.get_signing_serializer(app)
+    cookies = [f"{app.config['SESSION_COOKIE_NAME']}="
+               + serializer.dumps({'user_id': u['id'], 'username': u['username']}) for u in users]
+    answers = urllib.parse.urlencode({f"question_{q['id']}": q['correct_option'] for q in questions})
+    return answers, cookies
+
+
+def send(port, method, path, cookie, body, timeout):
+    """Returns ``(status, retry_after)``; raises on timeouts and connection errors."""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        headers = {'Cookie': cookie}
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status, int(response.getheader('Retry-After') or 1)
+    finally:
+        conn.close()
+
+
+def run(mode, students, args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        answers, cookies = seed(students)
+    port = free_port()
+    config = {'DATABASE': app.config['DATABASE'], 'ADMISSION_ENABLED': mode == 'admission',
+              'DB_SYNCHRONOUS': args.synchronous, 'SLOW_REQUEST_MS': None}
+    server = subprocess.Popen([sys.executable, '-c', SERVER, json.dumps(config), str(port)], cwd=ROOT,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    server.stdout.readline()
+    # The routes print a line per result; keep the pipe drained so the server never blocks on it
+    threading.Thread(target=server.stdout.read, daemon=True).start()
+
+    done = []
+    counts = {'shed': 0, 'timed_out': 0, 'failed': 0}
+    lock = threading.Lock()
+    start = threading.Event()
+    give_up = [0.0]
+
+    def request(method, path, cookie, body=None):
+        """Repeats a request until it succeeds or the run ends; returns True on success."""
+        while time.perf_counter() < give_up[0]:
+            try:
+                status, retry_after = send(port, method, path, cookie, body, args.client_timeout)
+            except socket.timeout:
+                status, retry_after = 'timed_out', 0
+            except OSError:
+                status, retry_after = 'failed', 0
+            if status == 200:
+                return True
+            with lock:
+                counts['shed' if status == 503 else status if isinstance(status, str) else 'failed'] += 1
+            if status == 503:
+                time.sleep(retry_after * args.retry_scale)
+        return False
+
+    def student(i, cookie):
+        rng = random.Random(i)
+        start.wait()
+        time.sleep(rng.uniform(0, args.window))
+        arrived = time.perf_counter()
+        if request('GET', '/test/1', cookie) and request('POST', '/submit/1', cookie, answers):
+            with lock:
+                done.append(time.perf_counter() - arrived)
+
+    threads = [threading.Thread(target=student, args=(i, c)) for i, c in enumerate(cookies)]
+    for t in threads:
+        t.start()
+    began = time.perf_counter()
+    give_up[0] = began + args.window + args.deadline
+    start.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - began
+    server.terminate()
+    server.wait()
+    with app.app_context():
+        stored = get_db().execute("SELECT COUNT(*) FROM test_results").fetchone()[0]
+
+    on_time = [d for d in done if d <= args.deadline]
+    print(f"  {mode:10s} {len(on_time):5d} on time ({len(on_time) / elapsed:6.1f}/s), "
+          f"p50 {percentile(done, 50):5.2f} s, p99 {percentile(done, 99):5.2f} s, "
+          f"{stored:5d} results stored, shed {counts['shed']:5d}, timed out {counts['timed_out']:5d}, "
+          f"failed {counts['failed']:5d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', default='100,400,1600')
+    parser.add_argument('--window', type=float, default=1.0)
+    parser.add_argument('--deadline', type=float, default=20.0)
+    parser.add_argument('--client-timeout', type=float, default=2.0)
+    parser.add_argument('--retry-scale', type=float, default=0.5)
+    parser.add_argument('--synchronous', default='FULL',
+                        help='PRAGMA synchronous for request connections (default: FULL)')
+    parser.add_argument('--modes', default='none,admission')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n, students in enumerate(int(s) for s in args.students.split(',')):
+            print(f"[{students} students within {args.window:g} s]")
+            for mode in args.modes.split(','):
+                app.config['DATABASE'] = os.path.join(tmp, f'{mode}-{n}.db')
+                app.extensions.pop('sqlite_pool', None)
+                run(mode, students, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""Time for a fresh worker process to import the app and serve its first page.
+
+Each run starts a new interpreter that imports ``app``, calls
+``create_app()`` and requests ``--path`` with the test client; the import,
+factory and first request are timed separately, along with the modules
+loaded by then. ``--no-bytecode-cache`` disables the Jinja template cache
+to show what it saves.
+
+Usage::
+
+    python benchmarks/bench_cold_start.py --runs 10 --path /login
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+from app import create_app
+t1 = time.perf_counter()
+app = create_app(json.loads(sys.argv[1]))
+t2 = time.perf_counter()
+status = app.test_client().get(sys.argv[2]).status_code
+t3 = time.perf_counter()
+print(json.dumps({'import': t1 - t0, 'create_app': t2 - t1, 'first_request': t3 - t2,
+                  'status': status, 'modules': len(sys.modules), 'numpy': 'numpy' in sys.modules}))
+"""
+
+
+def run_once(config, path):
+    out = subprocess.run([sys.executable, '-c', CHILD, json.dumps(config), path],
+                         cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/login')
+    parser.add_argument('--no-bytecode-cache', action='store_true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = {'DATABASE': os.path.join(tmp, 'bench.db'),
+                  'JINJA_BYTECODE_CACHE_DIR': None if args.no_bytecode_cache else os.path.join(tmp, 'jinja')}
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], cwd=ROOT, check=True,
+                       capture_output=True, env=dict(os.environ, FLASK_DATABASE=json.dumps(config['DATABASE'])))
+        run_once(config, args.path) # Warms the OS file cache and the template cache
+        runs = [run_once(config, args.path) for _ in range(args.runs)]
+
+    print(f"{args.runs} cold starts, GET {args.path} -> {runs[0]['status']}, "
+          f"{runs[0]['modules']} modules loaded, numpy loaded: {runs[0]['numpy']}")
+    for phase in ('import', 'create_app', 'first_request'):
+        samples = sorted(r[phase] * 1000 for r in runs)
+        print(f"  {phase:14s} median {samples[len(samples) // 2]:7.1f} ms   max {samples[-1]:7.1f} ms")
+    total = sorted(sum(r[p] for p in ('import', 'create_app', 'first_request')) * 1000 for r in runs)
+    print(f"  {'total':14s} median {total[len(total) // 2]:7.1f} ms   max {total[-1]:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""Concurrent dashboard reads vs. submit_test writes against SQLite.
+
+Runs the same mixed workload twice on a throw-away database:
+
+* ``legacy`` - a fresh ``sqlite3.connect()`` per operation on a rollback
+  journal, the way app.py used to work;
+* ``pooled`` - connections from ``db.ConnectionPool`` (WAL, busy_timeout).
+
+Usage::
+
+    python benchmarks/bench_db_concurrency.py --readers 8 --writers 4 --seconds 5
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import ConnectionPool  # noqa: E402
+
+SCHEMA = """
+CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL,
+                    password_hash TEXT NOT NULL, email TEXT UNIQUE NOT NULL);
+CREATE TABLE tests (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL,
+                    type TEXT NOT NULL, level INTEGER NOT NULL DEFAULT 1);
+CREATE TABLE test_results (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,
+                           test_id INTEGER NOT NULL, score INTEGER NOT NULL,
+                           total_questions INTEGER NOT NULL, percentage INTEGER NOT NULL,
+                           timestamp DATETIME DEFAULT CURRENT_TIMESTAMP);
+"""
+
+READ_SQL = """
+    SELECT tr.score, tr.total_questions, tr.percentage, tr.timestamp, t.name as test_name
+    FROM test_results tr JOIN tests t ON tr.test_id = t.id
+    WHERE tr.user_id = ? ORDER BY tr.timestamp DESC
+"""
+WRITE_SQL = """
+    INSERT INTO test_results (user_id, test_id, score, total_questions, percentage, timestamp)
+    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+"""
+
+
+def seed(path, users):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany("INSERT INTO users (username, password_hash, email) VALUES (?, 'x', ?)",
+                     [(f'u{i}', f'u{i}@example.com') for i in range(users)])
+    conn.executemany("INSERT INTO tests (name, type, level) VALUES (?, 'قياس', ?)",
+                     [(f't{i}', i) for i in range(1, 11)])
+    conn.commit()
+    conn.close()
+
+
+class LegacyConnections:
+    """Connect-per-operation with the default rollback journal."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def run(self, sql, params, write):
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute("PRAGMA foreign_keys = ON")
+            rows = conn.execute(sql, params).fetchall()
+            if write:
+                conn.commit()
+            return rows
+        finally:
+            conn.close()
+
+
+class PooledConnections:
+    def __init__(self, path, size):
+        self.pool = ConnectionPool(path, size=size)
+
+    def run(self, sql, params, write):
+        with self.pool.connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+            if write:
+                conn.commit()
+            return rows
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def run_mode(name, backend, users, readers, writers, seconds):
+    stop = threading.Event()
+    stats = {'read': [], 'write': []}
+    errors = {'locked': 0, 'other': 0}
+    lock = threading.Lock()
+
+    def worker(kind):
+        latencies = []
+        while not stop.is_set():
+            user_id = random.randint(1, users)
+            start = time.perf_counter()
+            try:
+                if kind == 'read':
+                    backend.run(READ_SQL, (user_id,), write=False)
+                else:
+                    score = random.randint(0, 10)
+                    backend.run(WRITE_SQL, (user_id, random.randint(1, 10), score, 10, score * 10),
+                                write=True)
+            except sqlite3.OperationalError as e:
+                with lock:
+                    errors['locked' if 'locked' in str(e) else 'other'] += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+        with lock:
+            stats[kind].extend(latencies)
+
+    threads = [threading.Thread(target=worker, args=('read',)) for _ in range(readers)]
+    threads += [threading.Thread(target=worker, args=('write',)) for _ in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    print(f"[{name}]")
+    for kind in ('read', 'write'):
+        samples = stats[kind]
+        print(f"  {kind:5}: {len(samples) / seconds:9.1f} ops/s  "
+              f"p50 {percentile(samples, 50) * 1000:7.2f} ms  "
+              f"p99 {percentile(samples, 99) * 1000:7.2f} ms")
+    print(f"  'database is locked' errors: {errors['locked']}, other errors: {errors['other']}")
+    return errors['locked']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--modes', default='legacy,pooled')
+    args = parser.parse_args()
+
+    locked = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in args.modes.split(','):
+            path = os.path.join(tmp, f'{mode}.db')
+            seed(path, args.users)
+            if mode == 'legacy':
+                backend = LegacyConnections(path)
+            else:
+                backend = PooledConnections(path, size=args.readers + args.writers)
+            count = run_mode(mode, backend, args.users, args.readers, args.writers, args.seconds)
+            if mode == 'pooled':
+                locked += count
+                backend.pool.close()
+    return 1 if locked else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""Logins per second and tail latency across password hashing cost settings.
+
+Simulates the start of an exam: ``--clients`` students post /login as fast
+as they can, each on its own test client. Every setting in ``--costs`` runs
+against its own fresh database whose users were hashed with that setting,
+so each login is a full verification. ``sha256`` is the legacy unsalted
+format, ``scrypt:N`` is scrypt with cost N. Logins turned away by the
+password pool's admission control (503) are counted separately.
+
+Usage::
+
+    python benchmarks/bench_login.py --clients 32 --seconds 5 --workers 4 --costs sha256,scrypt:4096,scrypt:16384
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, init_db  # noqa: E402
+from db import get_db  # noqa: E402
+import passwords  # noqa: E402
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def configure(cost):
+    if cost == 'sha256':
+        app.config['PASSWORD_HASHER'] = 'sha256'
+    else:
+        app.config['PASSWORD_HASHER'] = 'scrypt'
+        app.config['PASSWORD_SCRYPT_N'] = int(cost.split(':')[1])
+    passwords.configure(app.config)
+
+
+def seed(clients):
+    with app.app_context():
+        init_db()
+        conn = get_db()
+        password_hash = passwords.hash_password('pw') # Salt reuse is fine for a benchmark
+        conn.executemany(
+            "INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
+            [(f'student{i}', f'student{i}@example.com', password_hash) for i in range(clients)])
+        conn.commit()
+
+
+def run_cost(cost, clients, seconds):
+    app.extensions.pop('sqlite_pool', None)
+    pool = app.extensions.pop('password_pool', None)
+    if pool:
+        pool.close()
+    configure(cost)
+    with contextlib.redirect_stdout(io.StringIO()):
+        seed(clients)
+
+    stop = threading.Event()
+    latencies = []
+    rejected = [0]
+    lock = threading.Lock()
+
+    def student(i):
+        client = app.test_client()
+        form = {'username': f'student{i}', 'password': 'pw'}
+        mine, busy = [], 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            response = client.post('/login', data=form)
+            if response.status_code == 302:
+                mine.append(time.perf_counter() - start)
+                client.get('/logout')
+            elif response.status_code == 503:
+                busy += 1
+        with lock:
+            latencies.extend(mine)
+            rejected[0] += busy
+
+    threads = [threading.Thread(target=student, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    print(f"[{cost}]")
+    print(f"  logins/s: {len(latencies) / seconds:9.1f}  "
+          f"p50 {percentile(latencies, 50) * 1000:7.2f} ms  "
+          f"p99 {percentile(latencies, 99) * 1000:7.2f} ms  "
+          f"rejected (503): {rejected[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--workers', type=int, default=4, help='PASSWORD_POOL_WORKERS')
+    parser.add_argument('--max-pending', type=int, default=64, help='PASSWORD_POOL_MAX_PENDING')
+    parser.add_argument('--kind', choices=['thread', 'process'], default='thread', help='PASSWORD_POOL_KIND')
+    parser.add_argument('--costs', default='sha256,scrypt:4096,scrypt:16384,scrypt:32768')
+    args = parser.parse_args()
+
+    app.config['DB_POOL_SIZE'] = args.clients + 2
+    app.config['SLOW_REQUEST_MS'] = None
+    app.config['PASSWORD_POOL_WORKERS'] = args.workers
+    app.config['PASSWORD_POOL_MAX_PENDING'] = args.max_pending
+    app.config['PASSWORD_POOL_KIND'] = args.kind
+    with tempfile.TemporaryDirectory() as tmp:
+        for cost in args.costs.split(','):
+            app.config['DATABASE'] = os.path.join(tmp, f"{cost.replace(':', '-')}.db")
+            run_cost(cost, args.clients, args.seconds)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
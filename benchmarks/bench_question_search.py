@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""Question search and near-duplicate checks on a large synthetic bank.
+
+Seeds ``--questions`` Arabic questions built from a random vocabulary, some
+written with diacritics or alef/yaa variants, through the normal
+``INSERT INTO questions`` path so the search triggers do the indexing. Then
+times ``--queries`` searches of one to three words (the last one a prefix),
+the same searches as a ``LIKE`` scan for comparison, and duplicate checks
+for lightly edited copies of existing questions, reporting how many of those
+copies were found.
+
+Usage::
+
+    python benchmarks/bench_question_search.py --questions 100000 --queries 500
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, init_db  # noqa: E402
+from db import get_db  # noqa: E402
+import question_search  # noqa: E402
+
+LETTERS = 'ابتثجحخدذرزسشصضطظعغفقكلمنهويأإآىة'
+HARAKAT = 'َُِّْ'
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def make_vocabulary(rng, size):
+    return [''.join(rng.choice(LETTERS) for _ in range(rng.randint(3, 8))) for _ in range(size)]
+
+
+def decorate(rng, word):
+    """Adds diacritics to a word now and then, as some question writers do."""
+    if rng.random() < 0.2:
+        return ''.join(c + (rng.choice(HARAKAT) if rng.random() < 0.5 else '') for c in word)
+    return word
+
+
+def make_question(rng, vocabulary):
+    return ' '.join(decorate(rng, rng.choice(vocabulary)) for _ in range(rng.randint(6, 16))) + '؟'
+
+
+def edit(rng, text):
+    """A near copy: one word dropped and diacritics stripped or added."""
+    words = text.split()
+    del words[rng.randrange(len(words))]
+    return ' '.join(decorate(rng, question_search.normalize(w)) for w in words)
+
+
+def seed(rng, count, tests):
+    vocabulary = make_vocabulary(rng, 20000)
+    with app.app_context():
+        init_db()
+        conn = get_db()
+        conn.executemany("INSERT INTO tests (name, type, level) VALUES (?, 'قياس', 1)",
+                         [(f'بنك {i}',) for i in range(tests)])
+        test_ids = [row[0] for row in conn.execute("SELECT id FROM tests")]
+        start = time.perf_counter()
+        for offset in range(0, count, 5000):
+            conn.executemany("""
+                INSERT INTO questions (test_id, text, option1, option2, option3, option4, correct_option)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [(rng.choice(test_ids), make_question(rng, vocabulary), *options, options[0])
+                  for options in ([rng.choice(vocabulary) for _ in range(4)]
+                                  for _ in range(min(5000, count - offset)))])
+            conn.commit()
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--questions', type=int, default=100000)
+    parser.add_argument('--tests', type=int, default=50)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--like-queries', type=int, default=20, help='LIKE scans to time (they are slow).')
+    args = parser.parse_args()
+    rng = random.Random(7)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, 'search.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            seed_time = seed(rng, args.questions, args.tests)
+        print(f"Inserted {args.questions} questions (indexed by the triggers) in {seed_time:.1f}s "
+              f"({args.questions / seed_time:.0f}/s)")
+
+        with app.app_context():
+            conn = get_db()
+            texts = [row[0] for row in conn.execute(
+                "SELECT text FROM questions ORDER BY random() LIMIT ?", (args.queries,))]
+            queries = []
+            for text in texts:
+                words = question_search.normalize(text).rstrip('؟').split()
+                start = rng.randrange(len(words))
+                phrase = words[start:start + rng.randint(1, 3)]
+                phrase[-1] = phrase[-1][:max(2, len(phrase[-1]) - 2)] # Typed so far
+                queries.append(' '.join(phrase))
+
+            timings, hits = [], 0
+            for query in queries:
+                start = time.perf_counter()
+                hits += len(question_search.search(conn, query))
+                timings.append(time.perf_counter() - start)
+            print(f"FTS search:        p50 {percentile(timings, 50) * 1000:7.2f} ms  "
+                  f"p95 {percentile(timings, 95) * 1000:7.2f} ms  ({hits / len(queries):.1f} results per query)")
+
+            timings = []
+            for query in queries[:args.like_queries]:
+                start = time.perf_counter()
+                conn.execute("SELECT id FROM questions WHERE text LIKE ? LIMIT 50", (f'%{query}%',)).fetchall()
+                timings.append(time.perf_counter() - start)
+            print(f"LIKE scan:         p50 {percentile(timings, 50) * 1000:7.2f} ms  "
+                  f"p95 {percentile(timings, 95) * 1000:7.2f} ms  (no normalization)")
+
+            timings, found, expected_count = [], 0, 0
+            threshold = app.config['DUPLICATE_THRESHOLD']
+            for text in texts:
+                copy = edit(rng, text)
+                start = time.perf_counter()
+                matches = question_search.find_duplicates(conn, copy, threshold)
+                timings.append(time.perf_counter() - start)
+                # Copies edited past the threshold are not expected to be found
+                expected = question_search.similarity(copy, text) >= threshold
+                expected_count += expected
+                found += expected and any(m['text'] == text for m in matches)
+            print(f"Duplicate check:   p50 {percentile(timings, 50) * 1000:7.2f} ms  "
+                  f"p95 {percentile(timings, 95) * 1000:7.2f} ms  "
+                  f"(found {found} of {expected_count} copies above the threshold)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""Submits per second for submit_test with inline writes vs. write-behind.
+
+Simulates the end of a timed exam: ``--students`` logged-in clients post
+their answer sheets to /submit/<test_id> as fast as they can. Each mode runs
+against its own fresh database, and the number of stored results is checked
+after the write-behind queue has been flushed.
+
+Usage::
+
+    python benchmarks/bench_submit_throughput.py --students 32 --seconds 5 --synchronous FULL
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, hash_password, init_db  # noqa: E402
+from db import get_db  # noqa: E402
+from results_writer import get_result_writer  # noqa: E402
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def seed(students):
+    with app.app_context():
+        init_db()
+        conn = get_db()
+        conn.executemany(
+            "INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
+            [(f'student{i}', f'student{i}@example.com', hash_password('pw')) for i in range(students)])
+        conn.commit()
+        questions = conn.execute("SELECT id, correct_option FROM questions WHERE test_id = 1").fetchall()
+    return {f"question_{q['id']}": q['correct_option'] for q in questions}
+
+
+def run_mode(mode, students, seconds):
+    app.extensions.pop('sqlite_pool', None)
+    app.extensions.pop('question_cache', None)
+    app.extensions.pop('result_writer', None)
+    app.config['RESULTS_WRITE_BEHIND'] = (mode == 'write-behind')
+    with contextlib.redirect_stdout(io.StringIO()):
+        answers = seed(students)
+
+    clients = []
+    for i in range(students):
+        client = app.test_client()
+        client.post('/login', data={'username': f'student{i}', 'password': 'pw'})
+        clients.append(client)
+
+    stop = threading.Event()
+    latencies = []
+    lock = threading.Lock()
+
+    def student(client):
+        mine = []
+        while not stop.is_set():
+            start = time.perf_counter()
+            response = client.post('/submit/1', data=answers)
+            if response.status_code == 200:
+                mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        threads = [threading.Thread(target=student, args=(c,)) for c in clients]
+        for t in threads:
+            t.start()
+        time.sleep(seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        with app.app_context():
+            writer = get_result_writer()
+            if writer:
+                writer.flush()
+            stored = get_db().execute("SELECT COUNT(*) FROM test_results").fetchone()[0]
+
+    print(f"[{mode}]")
+    print(f"  submits/s: {len(latencies) / seconds:9.1f}  "
+          f"p50 {percentile(latencies, 50) * 1000:7.2f} ms  "
+          f"p99 {percentile(latencies, 99) * 1000:7.2f} ms")
+    if writer:
+        print(f"  batches: {writer.batches}, avg batch {writer.written / max(writer.batches, 1):.1f}")
+        writer.close()
+    print(f"  responses: {len(latencies)}, stored results: {stored}")
+    return len(latencies) == stored
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--synchronous', default='FULL',
+                        help='PRAGMA synchronous for request connections (default: FULL)')
+    parser.add_argument('--modes', default='inline,write-behind')
+    args = parser.parse_args()
+
+    app.config['DB_SYNCHRONOUS'] = args.synchronous
+    app.config['DB_POOL_SIZE'] = args.students + 2
+    consistent = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in args.modes.split(','):
+            app.config['DATABASE'] = os.path.join(tmp, f'{mode}.db')
+            consistent &= run_mode(mode, args.students, args.seconds)
+    return 0 if consistent else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""End-to-end load test of the student exam flow, without any network.
+
+Seeds a synthetic database, then runs ``--students`` concurrent simulated
+students through register -> login -> dashboard -> take_test -> submit_test
+while ``--admins`` clients browse and edit questions in
+admin.manage_questions. Requests go through Flask's test client by default,
+or through a local WSGI server on 127.0.0.1 with ``--wsgi``.
+
+Per-route throughput and latency percentiles are printed and written to a
+JSON file so runs can be compared::
+
+    python benchmarks/loadtest.py --students 20 --duration 10 --output run.json
+    python benchmarks/loadtest.py --students 20 --duration 10 --compare run.json
+"""
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import app, hash_password, init_db  # noqa: E402
+from db import get_db  # noqa: E402
+from leaderboard import rebuild_leaderboards  # noqa: E402
+from results import rebuild_progress  # noqa: E402
+
+TEST_LINK = re.compile(r'/test/(\d+)')
+RADIO = re.compile(r'name="(question_\d+)"\s+value="([^"]*)"')
+
+
+def seed(tests, questions_per_test, users, history):
+    """Fills a fresh database with synthetic tests, users and past results."""
+    rng = random.Random(42)
+    with app.app_context():
+        init_db()
+        conn = get_db()
+        conn.execute("DELETE FROM tests")
+        test_rows = [(f'اختبار تجريبي {i}', 'قياس' if i % 2 else 'تحصيلي', i // 2 + 1)
+                     for i in range(tests)]
+        conn.executemany("INSERT INTO tests (name, type, level) VALUES (?, ?, ?)", test_rows)
+        test_ids = [row[0] for row in conn.execute("SELECT id FROM tests ORDER BY id")]
+        conn.executemany("""
+            INSERT INTO questions (test_id, text, option1, option2, option3, option4, correct_option)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [(tid, f'سؤال {tid}-{q}', 'أ', 'ب', 'ج', 'د', rng.choice('أبجد'))
+              for tid in test_ids for q in range(questions_per_test)])
+        password = hash_password('password')
+        conn.executemany("INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
+                         [(f'seed{i}', f'seed{i}@example.com', password) for i in range(users)])
+        conn.execute("INSERT INTO users (username, email, password_hash) VALUES ('admin', 'admin@example.com', ?)",
+                     (hash_password('admin'),))
+        user_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE username != 'admin'")]
+        start = datetime.now() - timedelta(days=365)
+        results = []
+        for user_id in user_ids:
+            for _ in range(history):
+                score = rng.randint(0, questions_per_test)
+                results.append((user_id, rng.choice(test_ids), score, questions_per_test,
+                                round(score / max(questions_per_test, 1) * 100),
+                                start + timedelta(minutes=rng.randint(0, 525600))))
+        conn.executemany("""
+            INSERT INTO test_results (user_id, test_id, score, total_questions, percentage, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, results)
+        rebuild_progress(conn)
+        rebuild_leaderboards(conn)
+        conn.commit()
+        return test_ids
+
+
+class TestClientSession:
+    def __init__(self):
+        self.client = app.test_client()
+
+    def get(self, path):
+        r = self.client.get(path)
+        return r.status_code, r.get_data(as_text=True)
+
+    def post(self, path, data):
+        r = self.client.post(path, data=data)
+        return r.status_code, r.get_data(as_text=True)
+
+
+class HttpSession:
+    """Minimal cookie-keeping client for the local WSGI server."""
+
+    def __init__(self, port):
+        self.port = port
+        self.cookies = {}
+
+    def _request(self, method, path, body=None):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port)
+        headers = {}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        if body is not None:
+            body = urllib.parse.urlencode(body)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        text = response.read().decode('utf-8', 'replace')
+        for header in response.headers.get_all('Set-Cookie') or []:
+            name, _, value = header.split(';', 1)[0].partition('=')
+            self.cookies[name.strip()] = value.strip()
+        conn.close()
+        return response.status, text
+
+    def get(self, path):
+        return self._request('GET', path)
+
+    def post(self, path, data):
+        return self._request('POST', path, data)
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def timed(self, route, fn, *args):
+        start = time.perf_counter()
+        try:
+            status, text = fn(*args)
+        except Exception:
+            status, text = 599, ''
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.samples.setdefault(route, []).append(elapsed)
+            if status >= 400:
+                self.errors[route] = self.errors.get(route, 0) + 1
+        return status, text
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def student_loop(make_session, recorder, stop, worker_id):
+    rng = random.Random(worker_id)
+    iteration = 0
+    while not stop.is_set():
+        session = make_session()
+        username = f'load{worker_id}_{iteration}_{rng.randrange(10 ** 9)}'
+        iteration += 1
+        recorder.timed('register', session.post, '/register', {
+            'username': username, 'email': f'{username}@example.com',
+            'password': 'password', 'confirm_password': 'password'})
+        recorder.timed('login', session.post, '/login', {'username': username, 'password': 'password'})
+        while not stop.is_set():
+            _, html = recorder.timed('dashboard', session.get, '/dashboard')
+            test_ids = TEST_LINK.findall(html)
+            if not test_ids:
+                break
+            test_id = rng.choice(test_ids)
+            _, html = recorder.timed('take_test', session.get, f'/test/{test_id}')
+            choices = {}
+            for name, value in RADIO.findall(html):
+                choices.setdefault(name, []).append(value)
+            answers = {name: rng.choice(values) for name, values in choices.items()}
+            recorder.timed('submit_test', session.post, f'/submit/{test_id}', answers)
+            if rng.random() < 0.3: # Some students log out and come back as someone new
+                break
+
+
+def admin_loop(make_session, recorder, stop, test_ids, worker_id):
+    rng = random.Random(10_000 + worker_id)
+    session = make_session()
+    recorder.timed('admin_login', session.post, '/login', {'username': 'admin', 'password': 'admin'})
+    while not stop.is_set():
+        test_id = rng.choice(test_ids)
+        recorder.timed('admin_manage_questions', session.get, f'/admin/manage-questions/{test_id}')
+        if rng.random() < 0.1:
+            recorder.timed('admin_add_question', session.post, f'/admin/manage-questions/{test_id}', {
+                'question_text': f'سؤال إضافي {rng.randrange(10 ** 6)}',
+                'option1': 'أ', 'option2': 'ب', 'option3': 'ج', 'option4': 'د', 'correct_option': 'أ'})
+        time.sleep(0.05)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=16, help='Concurrent simulated students.')
+    parser.add_argument('--admins', type=int, default=1, help='Concurrent admin clients.')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run.')
+    parser.add_argument('--tests', type=int, default=10)
+    parser.add_argument('--questions-per-test', type=int, default=20)
+    parser.add_argument('--users', type=int, default=1000, help='Pre-seeded users.')
+    parser.add_argument('--history', type=int, default=20, help='Past results per seeded user.')
+    parser.add_argument('--wsgi', action='store_true', help='Go through a local WSGI server.')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--compare', help='Print the change against an earlier JSON run.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, 'loadtest.db')
+        app.config['DB_POOL_SIZE'] = max(app.config.get('DB_POOL_SIZE', 8), args.students + args.admins)
+        sink = io.StringIO()
+        with contextlib.redirect_stdout(sink):
+            seed_start = time.perf_counter()
+            test_ids = seed(args.tests, args.questions_per_test, args.users, args.history)
+            seed_time = time.perf_counter() - seed_start
+
+        server = None
+        if args.wsgi:
+            from werkzeug.serving import WSGIRequestHandler, make_server
+
+            class QuietHandler(WSGIRequestHandler):
+                def log_request(self, *args, **kwargs):
+                    pass
+
+            server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            make_session = lambda: HttpSession(server.port)  # noqa: E731
+        else:
+            make_session = TestClientSession
+
+        recorder = Recorder()
+        stop = threading.Event()
+        threads = [threading.Thread(target=student_loop, args=(make_session, recorder, stop, i))
+                   for i in range(args.students)]
+        threads += [threading.Thread(target=admin_loop, args=(make_session, recorder, stop, test_ids, i))
+                    for i in range(args.admins)]
+        with contextlib.redirect_stdout(sink):
+            for t in threads:
+                t.start()
+            time.sleep(args.duration)
+            stop.set()
+            for t in threads:
+                t.join()
+        if server:
+            server.shutdown()
+
+    routes = {}
+    for route, samples in sorted(recorder.samples.items()):
+        routes[route] = {
+            'requests': len(samples),
+            'errors': recorder.errors.get(route, 0),
+            'rps': len(samples) / args.duration,
+            'p50_ms': percentile(samples, 50) * 1000,
+            'p95_ms': percentile(samples, 95) * 1000,
+            'p99_ms': percentile(samples, 99) * 1000,
+        }
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'mode': 'wsgi' if args.wsgi else 'test_client',
+        'params': vars(args),
+        'seed_seconds': seed_time,
+        'routes': routes,
+    }
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)['routes']
+
+    print(f"Seeded {args.tests} tests x {args.questions_per_test} questions, {args.users} users, "
+          f"{args.users * args.history} results in {seed_time:.2f}s")
+    print(f"{'route':26} {'req':>7} {'err':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route, r in routes.items():
+        line = (f"{route:26} {r['requests']:7d} {r['errors']:5d} {r['rps']:8.1f} "
+                f"{r['p50_ms']:8.2f} {r['p95_ms']:8.2f} {r['p99_ms']:8.2f}")
+        if previous and route in previous and previous[route]['p95_ms']:
+            change = (r['p95_ms'] / previous[route]['p95_ms'] - 1) * 100
+            line += f"   p95 {change:+.0f}% vs. baseline"
+        print(line)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Wrote {args.output}")
+    return 1 if any(r['errors'] for r in routes.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""``flask`` CLI commands: database setup and maintenance, bulk import/export, grading.
+
+Commands that need numpy (grading, item statistics, calibration) import it
+when they run, so ``flask --help`` and the web workers do not pay for it.
+"""
+import csv
+import os
+import sqlite3
+from datetime import datetime as dt
+from datetime import timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+import archive
+import leaderboard
+import migrations
+import question_io
+import results_export
+import user_io
+from db import get_db
+from question_cache import get_question_bank, get_question_cache
+from results import rebuild_progress
+
+
+def init_db():
+    """Initializes the database schema and adds initial data."""
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+
+        # Create or upgrade the schema; existing tables and data are kept
+        applied = migrations.upgrade(conn)
+        for version, description in applied:
+            print(f"Applied migration {version}: {description}")
+        print("Database tables created or already exist.")
+
+        # Add initial data only if tests table is empty
+        cursor.execute("SELECT COUNT(*) FROM tests")
+        if cursor.fetchone()[0] == 0:
+            print("Adding initial test data...")
+            # Add Qiyas tests and questions
+            cursor.execute("INSERT INTO tests (name, type, level) VALUES (?, ?, ?)",
+                           ("اختبار قدرات تجريبي (كمي) - المرحلة 1", "قياس", 1))
+            test1_id = cursor.lastrowid
+            questions1 = [
+                (test1_id, "إذا كان س + 5 = 12، فما قيمة س؟", "5", "6", "7", "8", "7"),
+                (test1_id, "ما هو ناتج 3 × (4 + 6)؟", "18", "22", "30", "42", "30"),
+                (test1_id, "دائرة نصف قطرها 5 سم، ما محيطها؟ (ط ≈ 3.14)", "15.7 سم", "25 سم", "31.4 سم", "50 سم", "31.4 سم"),
+            ]
+            cursor.executemany("INSERT INTO questions (test_id, text, option1, option2, option3, option4, correct_option) VALUES (?, ?, ?, ?, ?, ?, ?)", questions1)
+
+            cursor.execute("INSERT INTO tests (name, type, level) VALUES (?, ?, ?)",
+                           ("اختبار قدرات تجريبي (كمي) - المرحلة 2", "قياس", 2))
+
+            # Add Tahseli tests and questions
+            cursor.execute("INSERT INTO tests (name, type, level) VALUES (?, ?, ?)",
+                           ("اختبار تحصيلي تجريبي (أحياء) - المرحلة 1", "تحصيلي", 1))
+            test2_id = cursor.lastrowid
+            questions2 = [
+                (test2_id, "ما هي الوحدة الأساسية للحياة؟", "النسيج", "العضو", "الخلية", "الجهاز", "الخلية"),
+                (test2_id, "أي جزء من الخلية النباتية مسؤول عن عملية البناء الضوئي؟", "الميتوكوندريا", "النواة", "الجدار الخلوي", "البلاستيدات الخضراء", "البلاستيدات الخضراء"),
+            ]
+            cursor.executemany("INSERT INTO questions (test_id, text, option1, option2, option3, option4, correct_option) VALUES (?, ?, ?, ?, ?, ?, ?)", questions2)
+
+            cursor.execute("INSERT INTO tests (name, type, level) VALUES (?, ?, ?)",
+                           ("اختبار تحصيلي تجريبي (أحياء) - المرحلة 2", "تحصيلي", 2))
+
+            conn.commit()
+            print("Initial data added.")
+
+    except sqlite3.Error as e:
+        print(f"Database error during initialization: {e}")
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Clears existing data and creates new tables."""
+    database = current_app.config['DATABASE']
+    if os.path.exists(database):
+        os.remove(database)
+        print("Removed old database.")
+    for suffix in ('-wal', '-shm'): # WAL side files belong to the old database
+        if os.path.exists(database + suffix):
+            os.remove(database + suffix)
+    archive_database = current_app.config.get('ARCHIVE_DATABASE')
+    if archive_database: # Archived results belong to the old database too
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(archive_database + suffix):
+                os.remove(archive_database + suffix)
+    init_db()
+    click.echo('Initialized the database.')
+
+
+@click.command('rebuild-progress')
+@with_appcontext
+def rebuild_progress_command():
+    """Recomputes the user_progress table from all test results."""
+    conn = get_db()
+    count = rebuild_progress(conn)
+    conn.commit()
+    click.echo(f'Rebuilt {count} progress rows.')
+
+
+@click.command('rebuild-item-stats')
+@click.option('--test-id', type=int, default=None, help='Only rebuild this test.')
+@with_appcontext
+def rebuild_item_stats_command(test_id):
+    """Recomputes the per-question statistics from the stored answer responses."""
+    import item_analysis
+    conn = get_db()
+    count = item_analysis.rebuild_question_stats(conn, test_id)
+    conn.commit()
+    click.echo(f'Rebuilt statistics for {count} questions.')
+
+
+@click.command('rebuild-leaderboards')
+@click.option('--test-id', type=int, default=None, help='Only rebuild this test.')
+@with_appcontext
+def rebuild_leaderboards_command(test_id):
+    """Recomputes the score histograms and best scores from all test results."""
+    conn = get_db()
+    count = leaderboard.rebuild_leaderboards(conn, test_id)
+    conn.commit()
+    click.echo(f'Rebuilt leaderboards from {count} best scores.')
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Rebuilds the question search index and near-duplicate sketches."""
+    import question_search
+    conn = get_db()
+    count = question_search.rebuild_index(conn)
+    conn.commit()
+    click.echo(f'Indexed {count} questions.')
+
+
+@click.command('calibrate-items')
+@click.option('--test-id', type=int, required=True, help='The test whose questions to calibrate.')
+@click.option('--min-responses', type=int, default=50, show_default=True,
+              help='Questions with fewer answers keep their default parameters.')
+@click.option('--iterations', type=int, default=100, show_default=True, help='Maximum EM iterations.')
+@with_appcontext
+def calibrate_items_command(test_id, min_responses, iterations):
+    """Fits 2PL IRT parameters for a test's questions from the stored answer responses."""
+    import adaptive
+    conn = get_db()
+    summary = adaptive.calibrate_test(conn, test_id, min_responses, iterations)
+    conn.commit()
+    click.echo(f"Calibrated {summary['calibrated']} questions from {summary['responses']} responses "
+               f"by {summary['persons']} attempts ({summary['iterations']} iterations).")
+
+
+@click.group('db')
+def db_cli():
+    """Schema migration commands."""
+
+@db_cli.command('upgrade')
+@click.option('--to', 'target', type=int, default=None, help='Stop at this schema version.')
+@with_appcontext
+def db_upgrade_command(target):
+    """Applies pending migrations without touching existing data."""
+    conn = get_db()
+    applied = migrations.upgrade(conn, target)
+    for version, description in applied:
+        click.echo(f'Applied migration {version}: {description}')
+    click.echo(f'Schema is at version {migrations.get_version(conn)}.')
+
+@db_cli.command('status')
+@with_appcontext
+def db_status_command():
+    """Shows the current schema version and pending migrations."""
+    conn = get_db()
+    click.echo(f'Current version: {migrations.get_version(conn)} (latest: {migrations.LATEST_VERSION})')
+    for version, description, _ in migrations.pending_migrations(conn):
+        click.echo(f'  pending {version}: {description}')
+
+@db_cli.command('check-plans')
+@with_appcontext
+def db_check_plans_command():
+    """Fails if any hot-path query falls back to a full table scan."""
+    failures = migrations.check_query_plans(get_db())
+    for name, plan in failures.items():
+        click.echo(f'{name}: ' + '; '.join(plan), err=True)
+    if failures:
+        raise SystemExit(1)
+    click.echo(f'All {len(migrations.HOT_PATH_QUERIES)} hot-path queries use an index.')
+
+
+@click.command('grade-batch')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--test-id', type=int, required=True, help='Test the answer sheets belong to.')
+@click.option('--format', 'file_format', type=click.Choice(['jsonl', 'csv']), default=None,
+              help='Input format (default: from the file extension).')
+@click.option('--answers-as-index', is_flag=True,
+              help='Answers are option numbers 1-4 or letters A-D instead of option text.')
+@click.option('--report', type=click.Path(dir_okay=False), default=None,
+              help='CSV file for per-student scores and the per-question correctness matrix.')
+@click.option('--chunk-size', type=int, default=5000, show_default=True)
+@click.option('--dry-run', is_flag=True, help='Grade without writing to test_results.')
+@with_appcontext
+def grade_batch_command(path, test_id, file_format, answers_as_index, report, chunk_size, dry_run):
+    """Grades a file of answer sheets and stores the results in bulk."""
+    import grading
+    conn = get_db()
+    bank = get_question_bank(conn, test_id)
+    if not bank or not bank.questions:
+        raise click.ClickException(f'Test {test_id} does not exist or has no questions.')
+    report_file = open(report, 'w', encoding='utf-8', newline='') if report else None
+    try:
+        summary = grading.grade_file(
+            conn, bank, path, file_format=file_format, as_index=answers_as_index,
+            timestamp=dt.now(), chunk_size=chunk_size,
+            report=csv.writer(report_file) if report_file else None, dry_run=dry_run)
+    finally:
+        if report_file:
+            report_file.close()
+    graded = summary['graded']
+    click.echo(f"Graded {graded} answer sheets, stored {summary['stored']} results.")
+    if graded:
+        click.echo(f"Mean score: {summary['score_sum'] / graded:.2f} / {len(bank.questions)}")
+        p_values = summary['correct_per_question'] / graded
+        click.echo('Per-question proportion correct: ' + ' '.join(f'{p:.2f}' for p in p_values))
+    if summary['unknown_students']:
+        click.echo(f"Skipped {len(summary['unknown_students'])} unknown students: "
+                   + ', '.join(str(s) for s in summary['unknown_students'][:20]), err=True)
+    if summary['ignored_questions']:
+        click.echo('Ignored answer columns with a malformed question id: '
+                   + ', '.join(sorted(f'question_{q}' for q in summary['ignored_questions'])),
+                   err=True)
+
+
+@click.group('questions')
+def questions_cli():
+    """Bulk import and export of question banks."""
+
+@questions_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--test-id', type=int, required=True, help='Test to add the questions to.')
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Input format (default: from the file extension).')
+@click.option('--chunk-size', type=int, default=500, show_default=True)
+@click.option('--dry-run', is_flag=True, help='Validate the file without inserting anything.')
+@click.option('--skip-duplicates', is_flag=True,
+              help='Skip questions too similar to one already in the bank (DUPLICATE_THRESHOLD).')
+@with_appcontext
+def questions_import_command(path, test_id, file_format, chunk_size, dry_run, skip_duplicates):
+    """Validates and inserts questions from a CSV or JSONL file."""
+    conn = get_db()
+    if not conn.execute("SELECT 1 FROM tests WHERE id = ?", (test_id,)).fetchone():
+        raise click.ClickException(f'Test {test_id} does not exist.')
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        try:
+            summary = question_io.import_questions(
+                conn, test_id, f, file_format or question_io.guess_format(path),
+                chunk_size=chunk_size, dry_run=dry_run,
+                duplicate_threshold=current_app.config['DUPLICATE_THRESHOLD'] if skip_duplicates else None)
+        finally:
+            get_question_cache().invalidate(test_id)
+    for line, message in summary['errors']:
+        click.echo(f'line {line}: {message}', err=True)
+    verb = 'Validated' if dry_run else 'Imported'
+    click.echo(f"{verb} {summary['imported']} questions, skipped {len(summary['errors'])} invalid rows.")
+
+@questions_cli.command('export')
+@click.option('--test-id', type=int, required=True)
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']), default='csv', show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), default='-', help='Output file (default: stdout).')
+@with_appcontext
+def questions_export_command(test_id, file_format, output):
+    """Writes a test's question bank as CSV or JSONL."""
+    conn = get_db()
+    with click.open_file(output, 'wb') as f: # bytes, so csv's \r\n line endings are kept as-is
+        for chunk in question_io.export_questions(conn, test_id, file_format):
+            f.write(chunk.encode('utf-8'))
+
+
+@click.group('users')
+def users_cli():
+    """Bulk provisioning of student accounts."""
+
+@users_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', type=int, default=1000, show_default=True)
+@click.option('--workers', type=int, default=None,
+              help='Processes hashing passwords (default: USER_IMPORT_WORKERS).')
+@click.option('--dry-run', is_flag=True, help='Validate the roster without creating accounts.')
+@with_appcontext
+def users_import_command(path, chunk_size, workers, dry_run):
+    """Creates accounts from a CSV roster with username, email and password columns."""
+    conn = get_db()
+    workers = workers if workers is not None else current_app.config.get('USER_IMPORT_WORKERS')
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        summary = user_io.import_users(conn, f, chunk_size=chunk_size, dry_run=dry_run, workers=workers)
+    for line, message in summary['errors']:
+        click.echo(f'line {line}: {message}', err=True)
+    verb = 'Validated' if dry_run else 'Created'
+    click.echo(f"{verb} {summary['imported']} accounts, skipped {len(summary['errors'])} rows.")
+
+
+@click.command('export-results')
+@click.option('--output', type=click.Path(dir_okay=False), default='-',
+              help='Output file (default: stdout; required for parquet).')
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'parquet']), default='csv', show_default=True)
+@click.option('--test-id', type=int, default=None)
+@click.option('--type', 'test_type', default=None, help='Test type, e.g. قياس or تحصيلي.')
+@click.option('--level', type=int, default=None)
+@click.option('--from', 'date_from', type=click.DateTime(['%Y-%m-%d']), default=None, help='First day (YYYY-MM-DD).')
+@click.option('--to', 'date_to', type=click.DateTime(['%Y-%m-%d']), default=None, help='Last day, inclusive.')
+@click.option('--chunk-size', type=int, default=None, help='Rows fetched per chunk.')
+@with_appcontext
+def export_results_command(output, file_format, test_id, test_type, level, date_from, date_to, chunk_size):
+    """Exports test results joined with users and tests from one consistent snapshot."""
+    if file_format == 'parquet' and output == '-':
+        raise click.UsageError('Parquet export needs --output.')
+    filters = results_export.ExportFilters(
+        test_id=test_id, test_type=test_type, level=level,
+        date_from=date_from.date() if date_from else None,
+        date_to=date_to.date() if date_to else None)
+    chunk_size = chunk_size or current_app.config.get('RESULTS_EXPORT_CHUNK_SIZE', 5000)
+    with results_export.get_export_pool().connection() as conn:
+        chunks = results_export.iter_result_chunks(conn, filters, chunk_size)
+        if file_format == 'parquet':
+            try:
+                count = results_export.write_parquet(chunks, output)
+            except RuntimeError as e:
+                raise click.ClickException(str(e))
+            click.echo(f'Exported {count} results to {output}.', err=True)
+            return
+        with click.open_file(output, 'wb') as f:
+            for text in results_export.csv_chunks(chunks):
+                f.write(text.encode('utf-8'))
+
+
+@click.command('archive-results')
+@click.option('--before', type=click.DateTime(['%Y-%m-%d']), default=None,
+              help='Archive results dated before this day (default: ARCHIVE_AFTER_DAYS ago).')
+@click.option('--days', type=int, default=None, help='Archive results older than this many days.')
+@click.option('--chunk-size', type=int, default=None, help='Results moved per transaction.')
+@with_appcontext
+def archive_results_command(before, days, chunk_size):
+    """Moves old test results to the archive database to keep the hot table small."""
+    if before is None:
+        before = dt.now() - timedelta(days=days if days is not None else current_app.config['ARCHIVE_AFTER_DAYS'])
+    chunk_size = chunk_size or current_app.config.get('ARCHIVE_CHUNK_SIZE', 5000)
+    conn = get_db()
+    if not archive.is_attached(conn):
+        raise click.ClickException('No archive database is configured (ARCHIVE_DATABASE).')
+    purged = archive.purge_orphans(conn)
+    conn.commit()
+    if purged:
+        click.echo(f'Removed {purged} archived results of deleted users or tests.')
+    moved = archive.archive_results(conn, before.isoformat(' '), chunk_size)
+    click.echo(f"Archived {moved} results dated before {before:%Y-%m-%d}.")
+
+
+def init_app(app):
+    for command in (init_db_command,
+                    rebuild_progress_command,
+                    rebuild_item_stats_command,
+                    rebuild_leaderboards_command,
+                    rebuild_search_index_command,
+                    calibrate_items_command,
+                    db_cli,
+                    grade_batch_command,
+                    questions_cli,
+                    users_cli,
+                    export_results_command,
+                    archive_results_command):
+        app.cli.add_command(command)
@@ -4,5 +4,102 @@ import os
 # تحديد المسار الحالي للملف
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
+# مفتاح توقيع الجلسات: للتطوير فقط، في الإنتاج عيّن متغير البيئة FLASK_SECRET_KEY
+# (أي إعداد هنا يمكن تجاوزه بمتغير بيئة يبدأ بـ FLASK_، مثل FLASK_DATABASE)
+SECRET_KEY = 'a_very_secret_random_key_change_this'
+
+# مجلد حفظ القوالب المترجمة لتسريع بدء العمليات الجديدة (None للتعطيل)
+JINJA_BYTECODE_CACHE_DIR = os.path.join(BASE_DIR, 'instance', 'jinja_cache')
+
 # تحديد اسم ومسار قاعدة البيانات
-DATABASE = os.path.join(BASE_DIR, 'tests_platform.db')
\ No newline at end of file
+DATABASE = os.path.join(BASE_DIR, 'tests_platform.db')
+
+# إعدادات مجمّع اتصالات SQLite (لكل عملية)
+DB_POOL_SIZE = 8                 # الحد الأقصى للاتصالات المفتوحة
+DB_POOL_TIMEOUT = 10.0           # ثوانٍ لانتظار اتصال متاح
+DB_BUSY_TIMEOUT_MS = 5000        # انتظار القفل قبل خطأ "database is locked"
+DB_SYNCHRONOUS = 'NORMAL'        # NORMAL آمن مع WAL ويقلل عمليات fsync
+DB_CACHE_SIZE = -16000           # بالقيمة السالبة: الحجم بالكيلوبايت
+DB_MMAP_SIZE = 64 * 1024 * 1024  # قراءة الملف عبر الذاكرة المعيّنة
+DB_STATEMENT_CACHE = 128         # عدد الاستعلامات المجهزة المخزنة لكل اتصال
+
+# أرشفة النتائج القديمة (flask archive-results): تُنقل إلى قاعدة بيانات منفصلة ليبقى جدول النتائج صغيراً
+ARCHIVE_DATABASE = None          # مسار قاعدة الأرشيف، مثل os.path.join(BASE_DIR, 'tests_archive.db') (None للتعطيل)
+ARCHIVE_AFTER_DAYS = 365         # تُؤرشف النتائج الأقدم من هذا العدد من الأيام
+ARCHIVE_CHUNK_SIZE = 5000        # عدد النتائج المنقولة في كل معاملة
+
+# الحد الأقصى لذاكرة تخزين بنوك الأسئلة مؤقتاً (لكل عملية)
+QUESTION_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# الكتابة المؤجلة للنتائج: تجميع عمليات الإدخال في معاملات مشتركة عبر خيط خلفي
+RESULTS_WRITE_BEHIND = False
+RESULTS_BATCH_SIZE = 200         # أقصى عدد نتائج في المعاملة الواحدة
+RESULTS_BATCH_DELAY_MS = 5       # أقصى انتظار لاكتمال الدفعة
+RESULTS_QUEUE_SIZE = 10000       # عند امتلاء الطابور تُكتب النتيجة مباشرة
+
+# قياس زمن الطلبات واستعلامات SQL وعرض القوالب (صفحة /admin/metrics)
+METRICS_ENABLED = True
+SLOW_REQUEST_MS = 500            # تسجيل تحذير للطلبات الأبطأ من هذا الحد (None للتعطيل)
+# رمز قراءة /metrics: يرسله Prometheus في الترويسة Authorization: Bearer <الرمز>
+# (عيّنه بمتغير البيئة FLASK_METRICS_TOKEN؛ None: لا يقرأ /metrics إلا المدير المسجل دخوله)
+METRICS_TOKEN = None
+
+# التخزين المؤقت لصفحات الاختبارات (ETag و 304) والملفات الثابتة
+FRAGMENT_CACHE_MAX_ENTRIES = 256 # عدد صفحات الاختبارات المعروضة المخزنة في كل عملية
+STATIC_MAX_AGE = 365 * 24 * 3600 # مدة تخزين الملفات الثابتة في المتصفح (روابطها تحمل ?v=)
+
+# واجهة JSON لتطبيق الجوال (/api/v1): ردود مخزنة لكل طالب تتجدد عند تسليمه اختباراً
+API_CACHE_MAX_ENTRIES = 5000     # عدد الردود المخزنة في كل عملية
+API_CACHE_SECONDS = 30           # أقصى عمر للوحة التحكم المخزنة (لظهور الاختبارات الجديدة وتغير ترتيب الطالب)
+
+# التحكم في قبول الطلبات عند الازدحام (بداية الاختبار ونهايته)؛ الحدود لكل عملية خادم
+ADMISSION_ENABLED = True
+ADMISSION_RETRY_AFTER = 2        # أقل مهلة قبل إعادة المحاولة التلقائية بالثواني
+ADMISSION_MAX_RETRY_AFTER = 30   # أقصى مهلة؛ تطول المهلة كلما زاد عدد الطلبات المرفوضة مقارنة بالمنجزة
+ADMISSION_LIMITS = {
+    # concurrency: الطلبات المنفذة معاً، queue: الطلبات المنتظرة بالترتيب، max_wait: أقصى انتظار بالثواني
+    # rate و burst: معدل القبول في الثانية وأكبر دفعة مسموحة
+    'take_test': {'concurrency': 4, 'queue': 256, 'max_wait': 1.0, 'rate': 300, 'burst': 300},
+    'submit_test': {'concurrency': 4, 'queue': 256, 'max_wait': 1.0, 'rate': 150, 'burst': 150},
+}
+
+# حفظ الإجابات تلقائياً أثناء الاختبار (/autosave)
+AUTOSAVE_FLUSH_MS = 1000         # كتابة الإجابات المجمّعة كل هذه المدة في معاملة واحدة (None للكتابة المباشرة)
+AUTOSAVE_MAX_PENDING = 20000     # أقصى عدد محاولات في الذاكرة؛ ما زاد يُكتب مباشرة
+AUTOSAVE_MAX_ANSWERS = 500       # أقصى عدد إجابات في طلب الحفظ الواحد
+
+# تقسيم القوائم الطويلة إلى صفحات (سجل النتائج، المستخدمون، الأسئلة)
+PAGE_SIZE = 20                   # عدد الصفوف الافتراضي في الصفحة
+MAX_PAGE_SIZE = 100              # أقصى قيمة مسموحة لـ ?per_page=
+
+# البحث في بنك الأسئلة وكشف الأسئلة المكررة عند الإضافة والاستيراد
+QUESTION_SEARCH_LIMIT = 50       # أقصى عدد نتائج البحث
+DUPLICATE_THRESHOLD = 0.8        # نسبة تشابه نص السؤال (من 0 إلى 1) التي يُعد عندها مكرراً
+
+# تصدير النتائج (صفحة /admin/export-results والأمر flask export-results)
+RESULTS_EXPORT_CHUNK_SIZE = 5000 # عدد الصفوف المقروءة في كل دفعة
+RESULTS_EXPORT_CONCURRENCY = 2   # أقصى عدد عمليات تصدير متزامنة
+
+# الاختبارات التكيفية (tests.mode = 'adaptive'): التوقف عند بلوغ دقة تقدير القدرة
+ADAPTIVE_MIN_ITEMS = 5           # أقل عدد أسئلة قبل السماح بالتوقف المبكر
+ADAPTIVE_MAX_ITEMS = 30          # أقصى عدد أسئلة في الجلسة
+ADAPTIVE_TARGET_SE = 0.35        # التوقف عندما يصبح الخطأ المعياري للقدرة أقل من هذا الحد
+
+# لوحات المتصدرين والترتيب المئوي لكل اختبار
+LEADERBOARD_SIZE = 10            # عدد المتصدرين المعروضين
+LEADERBOARD_CACHE_SECONDS = 30   # مدة تخزين لوحة المتصدرين مؤقتاً في كل عملية
+
+# استيراد قوائم الطلاب (flask users import وصفحة إدارة المستخدمين)
+USER_IMPORT_WORKERS = 4          # عدد العمليات المستخدمة لتشفير كلمات المرور في flask users import (1 = بدون عمليات إضافية)؛ صفحة الإدارة تستخدم مجمع كلمات المرور
+USER_IMPORT_MAX_ROWS = 300       # أقصى عدد صفوف في الملف المرفوع من صفحة الإدارة (نحو 15 ثانية على نواة واحدة بالتكلفة الكاملة)، وللملفات الأكبر استخدم flask users import
+
+# تشفير كلمات المرور: scrypt مع ملح عشوائي، وتُحدَّث التجزئات القديمة تلقائياً عند تسجيل الدخول
+PASSWORD_HASHER = 'scrypt'       # 'scrypt' أو 'sha256' (الصيغة القديمة)
+PASSWORD_SCRYPT_N = 2 ** 14      # معامل التكلفة؛ الذاكرة المستخدمة نحو 128 * N * R بايت
+PASSWORD_SCRYPT_R = 8
+PASSWORD_SCRYPT_P = 1
+PASSWORD_POOL_KIND = 'thread'    # 'thread' أو 'process'
+PASSWORD_POOL_WORKERS = 4        # عدد عمليات التشفير المتزامنة في كل عملية خادم
+PASSWORD_POOL_MAX_PENDING = 64   # أقصى عدد طلبات منتظرة؛ ما زاد يُرفض فوراً برمز 503
+PASSWORD_POOL_TIMEOUT = 10.0     # أقصى انتظار لنتيجة التشفير بالثواني
+PASSWORD_RETRY_AFTER = 2         # قيمة ترويسة Retry-After عند الرفض
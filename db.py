@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""Request-scoped SQLite connections backed by a bounded per-process pool."""
+import contextlib
+import os
+import queue
+import sqlite3
+import threading
+
+from flask import current_app, g
+
+import archive
+import question_search
+
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+_pool_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """A bounded pool of long-lived SQLite connections for one process.
+
+    Connections are opened lazily up to ``size``, configured once with the
+    WAL/busy-timeout pragmas and keep their prepared-statement cache between
+    requests. A worker that has to wait longer than ``timeout`` seconds for a
+    free connection gets a ``sqlite3.OperationalError`` so the existing
+    ``except sqlite3.Error`` handlers in the routes still apply.
+    """
+
+    def __init__(self, database, size=8, timeout=10.0, busy_timeout_ms=5000,
+                 synchronous='NORMAL', cache_size=-16000, mmap_size=0,
+                 cached_statements=128, factory=sqlite3.Connection, archive_database=None):
+        synchronous = str(synchronous).upper()
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"Invalid synchronous mode: {synchronous}")
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.busy_timeout_ms = int(busy_timeout_ms)
+        self.synchronous = synchronous
+        self.cache_size = int(cache_size)
+        self.mmap_size = int(mmap_size)
+        self.cached_statements = int(cached_statements)
+        self.factory = factory
+        self.archive_database = archive_database
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @classmethod
+    def from_config(cls, config):
+        factory = sqlite3.Connection
+        if config.get('METRICS_ENABLED'):
+            from metrics import InstrumentedConnection
+            factory = InstrumentedConnection
+        return cls(
+            config['DATABASE'],
+            size=config.get('DB_POOL_SIZE', 8),
+            timeout=config.get('DB_POOL_TIMEOUT', 10.0),
+            busy_timeout_ms=config.get('DB_BUSY_TIMEOUT_MS', 5000),
+            synchronous=config.get('DB_SYNCHRONOUS', 'NORMAL'),
+            cache_size=config.get('DB_CACHE_SIZE', -16000),
+            mmap_size=config.get('DB_MMAP_SIZE', 0),
+            cached_statements=config.get('DB_STATEMENT_CACHE', 128),
+            factory=factory,
+            archive_database=config.get('ARCHIVE_DATABASE'),
+        )
+
+    def _connect(self):
+        # Connections move between request threads, but only one thread uses
+        # a connection at a time, so the same-thread check is not needed.
+        conn = sqlite3.connect(
+            self.database,
+            timeout=self.busy_timeout_ms / 1000,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+            factory=self.factory,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {self.busy_timeout_ms}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        conn.execute(f"PRAGMA cache_size = {self.cache_size}")
+        conn.execute(f"PRAGMA mmap_size = {self.mmap_size}")
+        conn.execute("PRAGMA foreign_keys = ON") # Enable foreign key support for cascade delete
+        question_search.register_functions(conn) # Called by the triggers on questions
+        archive.attach(conn, self.archive_database) # Old results and the all_test_results view
+        return conn
+
+    def acquire(self):
+        """Returns an idle connection, opening a new one if the pool allows."""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError('connection pool exhausted')
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._connect()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        """Rolls back any unfinished transaction and returns ``conn`` to the pool."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+        except sqlite3.Error:
+            conn.close()
+        finally:
+            self._slots.release()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Borrows a connection outside of a request (CLI commands, threads)."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def get_pool(app=None):
+    """Returns the connection pool of ``app``, creating it on first use.
+
+    A pool inherited through ``fork()`` is discarded rather than reused, so
+    every prefork worker ends up with its own connections.
+    """
+    if app is None:
+        app = current_app._get_current_object()
+    pool = app.extensions.get('sqlite_pool')
+    if pool is None or pool.pid != os.getpid():
+        with _pool_lock:
+            pool = app.extensions.get('sqlite_pool')
+            if pool is None or pool.pid != os.getpid():
+                pool = ConnectionPool.from_config(app.config)
+                app.extensions['sqlite_pool'] = pool
+    return pool
+
+
+def get_db():
+    """Returns the connection bound to the current app context."""
+    if 'db' not in g:
+        conn = get_pool().acquire()
+        if hasattr(conn, 'reset_stats'): # Per-request SQL metrics
+            conn.reset_stats()
+        g.db = conn
+    return g.db
+
+
+def close_db(exc=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_pool().release(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""Vectorized grading of answer sheets against a compiled answer key.
+
+An answer key is compiled once per question-bank version into an array of
+correct option indexes (0-3). Answer sheets are encoded the same way, with
+``UNANSWERED`` for missing or unknown answers, so grading a single submission
+or a whole batch is one NumPy comparison.
+
+Sheets are stored next to their ``test_results`` row with ``pack_sheet``: two
+bits per question for the chosen option plus one bit for whether it was
+answered at all, and a fingerprint of the question order they were encoded
+against.
+"""
+import csv
+import hashlib
+import itertools
+import json
+
+import numpy as np
+
+from results import record_results
+
+UNANSWERED = -1
+NO_CORRECT_OPTION = -2  # correct_option text matches none of the options
+OPTION_LETTERS = {'A': 0, 'B': 1, 'C': 2, 'D': 3}
+
+
+class AnswerKey:
+    """A test's answer key as parallel arrays of question ids and option indexes."""
+
+    def __init__(self, test_id, question_ids, options, correct):
+        self.test_id = test_id
+        self.question_ids = np.asarray(question_ids, dtype=np.int64)
+        self.correct = np.asarray(correct, dtype=np.int8)
+        self.options = options
+        self.position = {qid: i for i, qid in enumerate(question_ids)}
+        self.fingerprint = fingerprint(question_ids)
+        self._option_index = [
+            {text: idx for idx, text in reversed(list(enumerate(opts)))} for opts in options
+        ]
+
+    @classmethod
+    def from_bank(cls, bank):
+        question_ids, options, correct = [], [], []
+        for q in bank.questions:
+            opts = tuple(q['options'])
+            right = bank.answer_key[q['id']]
+            question_ids.append(q['id'])
+            options.append(opts)
+            correct.append(opts.index(right) if right in opts else NO_CORRECT_OPTION)
+        return cls(bank.test_id, question_ids, options, correct)
+
+    def __len__(self):
+        return len(self.question_ids)
+
+    def option_index(self, position, value, as_index=False):
+        """Maps one submitted answer to an option index, or UNANSWERED."""
+        if value is None or value == '':
+            return UNANSWERED
+        if as_index:
+            value = str(value).strip().upper()
+            if value in OPTION_LETTERS:
+                return OPTION_LETTERS[value]
+            if value.isdigit() and 1 <= int(value) <= 4:
+                return int(value) - 1
+            return UNANSWERED
+        return self._option_index[position].get(value, UNANSWERED)
+
+    def encode(self, answers, as_index=False, ignored=None):
+        """Encodes ``{question_id: answer}`` into an int8 sheet for this key.
+
+        Question ids that are not integers (a malformed ``question_x`` column)
+        are skipped and, if given, added to the ``ignored`` set.
+        """
+        sheet = np.full(len(self), UNANSWERED, dtype=np.int8)
+        for qid, value in answers.items():
+            try:
+                position = self.position.get(int(qid))
+            except (TypeError, ValueError):
+                if ignored is not None:
+                    ignored.add(qid)
+                continue
+            if position is not None:
+                sheet[position] = self.option_index(position, value, as_index)
+        return sheet
+
+    def encode_form(self, form):
+        """Encodes a submitted test.html form (``question_<id>`` fields)."""
+        sheet = np.full(len(self), UNANSWERED, dtype=np.int8)
+        for position, qid in enumerate(self.question_ids.tolist()):
+            sheet[position] = self.option_index(position, form.get(f'question_{qid}'))
+        return sheet
+
+    def grade(self, sheets):
+        """Grades a ``(students, questions)`` matrix of encoded sheets.
+
+        Returns ``(scores, correctness)``: per-student scores and the boolean
+        per-question correctness matrix.
+        """
+        sheets = np.atleast_2d(np.asarray(sheets, dtype=np.int8))
+        correctness = sheets == self.correct
+        return correctness.sum(axis=1), correctness
+
+    def grade_one(self, sheet):
+        scores, correctness = self.grade(sheet)
+        return int(scores[0]), correctness[0]
+
+
+def fingerprint(question_ids):
+    """A signed 64-bit hash of the question order a sheet was encoded against."""
+    raw = np.asarray(question_ids, dtype='<i8').tobytes()
+    return int.from_bytes(hashlib.blake2b(raw, digest_size=8).digest(), 'little', signed=True)
+
+
+def pack_sheet(sheet):
+    """Packs an encoded sheet into ``ceil(2n/8) + ceil(n/8)`` bytes."""
+    sheet = np.asarray(sheet, dtype=np.int8)
+    answered = sheet >= 0
+    choices = np.where(answered, sheet, 0).astype(np.uint8)
+    bits = np.stack([(choices >> 1) & 1, choices & 1], axis=1).ravel()
+    return np.packbits(bits).tobytes() + np.packbits(answered).tobytes()
+
+
+def unpack_sheet(blob, question_count):
+    """Inverse of ``pack_sheet``; raises ValueError if the blob does not fit."""
+    choice_bytes = (2 * question_count + 7) // 8
+    if len(blob) != choice_bytes + (question_count + 7) // 8:
+        raise ValueError(f'Packed sheet of {len(blob)} bytes does not hold {question_count} answers')
+    raw = np.frombuffer(blob, dtype=np.uint8)
+    bits = np.unpackbits(raw[:choice_bytes])[:2 * question_count].reshape(question_count, 2)
+    answered = np.unpackbits(raw[choice_bytes:])[:question_count].astype(bool)
+    choices = (bits[:, 0] << 1) | bits[:, 1]
+    return np.where(answered, choices, UNANSWERED).astype(np.int8)
+
+
+def compiled_key(bank):
+    """Returns the compiled key of a cached bank, compiling it on first use."""
+    key = bank.compiled_key
+    if key is None:
+        key = bank.compiled_key = AnswerKey.from_bank(bank)
+    return key
+
+
+def percentage(scores, total_questions):
+    """Rounded percentages, matching submit_test's ``round(score / total * 100)``."""
+    if total_questions == 0:
+        return np.zeros_like(scores)
+    return np.rint(np.asarray(scores) / total_questions * 100).astype(np.int64)
+
+
+def read_answer_sheets(path, file_format=None):
+    """Yields ``(student, answers)`` pairs from a JSONL or CSV file.
+
+    ``student`` is ``{'user_id': ...}`` or ``{'username': ...}``. JSONL rows
+    look like ``{"username": "s1", "answers": {"12": "7", ...}}``; CSV files
+    have a ``username`` or ``user_id`` column and one ``question_<id>`` column
+    per question, as in the test.html form.
+    """
+    file_format = file_format or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if file_format == 'jsonl':
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                row = json.loads(line)
+                student = {k: row[k] for k in ('user_id', 'username') if row.get(k) is not None}
+                yield student, row.get('answers', {})
+        else:
+            for row in csv.DictReader(f):
+                student = {k: row[k] for k in ('user_id', 'username') if row.get(k)}
+                answers = {name[len('question_'):]: value for name, value in row.items()
+                           if name and name.startswith('question_')}
+                yield student, answers
+
+
+def _parse_user_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _resolve_students(conn, students):
+    """Maps each student dict to an existing user id (or None) with set-based queries.
+
+    A ``user_id`` that is not an integer resolves to None, like an unknown one.
+    """
+    usernames = sorted({s['username'] for s in students if 'username' in s and 'user_id' not in s})
+    parsed = [_parse_user_id(s['user_id']) if 'user_id' in s else None for s in students]
+    user_ids = sorted({user_id for user_id in parsed if user_id is not None})
+    by_name, known_ids = {}, set()
+    if usernames:
+        rows = conn.execute(
+            "SELECT id, username FROM users WHERE username IN (SELECT value FROM json_each(?))",
+            (json.dumps(usernames),))
+        by_name = {row['username']: row['id'] for row in rows}
+    if user_ids:
+        rows = conn.execute(
+            "SELECT id FROM users WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps(user_ids),))
+        known_ids = {row['id'] for row in rows}
+    resolved = []
+    for s, user_id in zip(students, parsed):
+        if 'user_id' in s:
+            resolved.append(user_id if user_id in known_ids else None)
+        else:
+            resolved.append(by_name.get(s.get('username')))
+    return resolved
+
+
+def grade_file(conn, bank, path, file_format=None, as_index=False, timestamp=None,
+               chunk_size=5000, report=None, dry_run=False):
+    """Grades every answer sheet in ``path`` and stores the results in bulk.
+
+    Sheets are processed ``chunk_size`` at a time: each chunk is encoded into
+    one matrix, graded in a single comparison and stored, with its
+    per-question responses, in its own transaction. ``report`` (an open CSV writer)
+    receives one row per student with the score and a 0/1 column per
+    question. Returns a summary dict; ``graded``, ``score_sum`` and
+    ``correct_per_question`` count only students that were found, and
+    ``ignored_questions`` holds question ids that were not integers.
+    """
+    key = compiled_key(bank)
+    total = len(key)
+    summary = {'graded': 0, 'stored': 0, 'unknown_students': [], 'ignored_questions': set(),
+               'score_sum': 0, 'correct_per_question': np.zeros(total, dtype=np.int64)}
+    if report is not None:
+        report.writerow(['user_id', 'score', 'total_questions', 'percentage']
+                        + [f'question_{qid}' for qid in key.question_ids.tolist()])
+
+    sheets = read_answer_sheets(path, file_format)
+    while True:
+        chunk = list(itertools.islice(sheets, chunk_size))
+        if not chunk:
+            break
+        user_ids = _resolve_students(conn, [student for student, _ in chunk])
+        matrix = np.stack([key.encode(answers, as_index, summary['ignored_questions'])
+                           for _, answers in chunk])
+        scores, correctness = key.grade(matrix)
+        percentages = percentage(scores, total)
+
+        known = np.array([user_id is not None for user_id in user_ids])
+        rows, stored_sheets = [], []
+        for i, user_id in enumerate(user_ids):
+            if user_id is None:
+                student = chunk[i][0]
+                summary['unknown_students'].append(student.get('username', student.get('user_id')))
+                continue
+            rows.append((user_id, int(scores[i]), total, int(percentages[i])))
+            stored_sheets.append(matrix[i])
+            if report is not None:
+                report.writerow([user_id, int(scores[i]), total, int(percentages[i])]
+                                + correctness[i].astype(np.int8).tolist())
+        summary['graded'] += len(rows)
+        summary['score_sum'] += int(scores[known].sum())
+        summary['correct_per_question'] += correctness[known].sum(axis=0)
+        if rows and not dry_run:
+            record_results(conn, bank, rows, timestamp, sheets=stored_sheets)
+            conn.commit()
+            summary['stored'] += len(rows)
+    return summary
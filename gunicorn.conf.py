@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""Gunicorn settings for wsgi:app, overridable through the environment.
+
+The app is loaded once in the master (``preload_app``) together with the
+numpy-backed modules, and workers fork from it sharing those pages, so
+adding a worker costs a fork rather than a full import. Connection pools,
+the result writer and the password pool are per process and are created
+lazily in each worker after the fork.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# Requests mostly wait on SQLite and the password pool, so each worker also runs a few threads
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = True
+
+# Recycle workers now and then to cap slow memory growth; the jitter keeps them from restarting together
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+# Heartbeat files on tmpfs, so a slow disk cannot make healthy workers look stuck
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+
+
+def on_starting(server):
+    # Loaded here they are shared with every worker instead of imported by each on first use
+    import adaptive  # noqa: F401
+    import grading  # noqa: F401
+    import item_analysis  # noqa: F401
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Rendered-page cache and conditional GETs for test pages, long-lived static caching.
+
+A test that serves its whole bank shows the same page to every student, so
+it is rendered, encoded and hashed once per ``(test_id, bank version)`` and
+reused until an admin edit bumps the version. Test pages carry a strong
+ETag (SHA-1 of the body) and ``Cache-Control: private, no-cache``: browsers
+revalidate on every reload and get an empty 304 when nothing changed, which
+for a cached page costs a dictionary lookup.
+
+``url_for('static', ...)`` adds a ``v`` stamp of the file's modification
+time, so stamped static files can be cached for ``STATIC_MAX_AGE`` seconds
+as immutable; editing a file changes its URL.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from flask import current_app, request
+import metrics
+
+
+class RenderedPage:
+    """An encoded HTML (or other text) body with its ETag."""
+
+    __slots__ = ('body', 'etag', 'mimetype')
+
+    def __init__(self, html, mimetype='text/html'):
+        self.body = html.encode('utf-8')
+        self.etag = hashlib.sha1(self.body).hexdigest()
+        self.mimetype = mimetype
+
+
+class FragmentCache:
+    """Rendered output by key, each entry valid for one version; least recently used entries go first."""
+
+    def __init__(self, max_entries, name='fragment_cache'):
+        self.max_entries = max_entries
+        self.name = name # Its hit/miss metric
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version, render):
+        """Returns the cached value for ``key`` at ``version``, calling ``render()`` on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+        hit = entry is not None and entry[0] == version
+        metrics.get_registry(current_app).increment(self.name, result='hit' if hit else 'miss')
+        if hit:
+            return entry[1]
+        value = render()
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+def get_fragment_cache(app=None):
+    if app is None:
+        app = current_app._get_current_object()
+    cache = app.extensions.get('fragment_cache')
+    if cache is None:
+        cache = app.extensions.setdefault(
+            'fragment_cache', FragmentCache(app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', 256)))
+    return cache
+
+
+def conditional(response, cache_control='private, no-cache'):
+    """Adds a strong ETag unless set and turns the response into a 304 if the client already has it."""
+    response.headers['Cache-Control'] = cache_control
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def page_response(page):
+    """A conditional response for a ``RenderedPage``, without re-encoding or re-hashing it."""
+    response = current_app.response_class(page.body, mimetype=page.mimetype)
+    response.set_etag(page.etag)
+    return conditional(response)
+
+
+def _stamp_static_url(endpoint, values):
+    if endpoint != 'static' or 'v' in values or not current_app.static_folder:
+        return
+    try:
+        values['v'] = int(os.stat(os.path.join(current_app.static_folder, values['filename'])).st_mtime)
+    except (KeyError, OSError):
+        pass
+
+
+def _static_cache_headers(response):
+    if request.endpoint == 'static' and 'v' in request.args and response.status_code in (200, 304):
+        response.headers['Cache-Control'] = \
+            f"public, max-age={current_app.config.get('STATIC_MAX_AGE', 31536000)}, immutable"
+    return response
+
+
+def init_app(app):
+    app.url_defaults(_stamp_static_url)
+    app.after_request(_static_cache_headers)
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""Per-question item analysis kept up to date as answers come in.
+
+Every graded attempt stores one ``answer_responses`` row per question and adds
+its contribution to the running sums in ``question_stats``: attempts, correct
+answers, how often each option was chosen, and the score sums needed for the
+point-biserial discrimination. All of these are plain sums, so a batch of
+attempts is folded in with one upsert per question and the analytics page
+reads a single row per question instead of rescanning the responses.
+"""
+import math
+
+import numpy as np
+
+_UPSERT_STATS = """
+    INSERT INTO question_stats (question_id, test_id, attempts, correct,
+                                option1_count, option2_count, option3_count, option4_count,
+                                unanswered, score_sum, score_sq_sum, correct_score_sum)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(question_id) DO UPDATE SET
+        attempts = attempts + excluded.attempts,
+        correct = correct + excluded.correct,
+        option1_count = option1_count + excluded.option1_count,
+        option2_count = option2_count + excluded.option2_count,
+        option3_count = option3_count + excluded.option3_count,
+        option4_count = option4_count + excluded.option4_count,
+        unanswered = unanswered + excluded.unanswered,
+        score_sum = score_sum + excluded.score_sum,
+        score_sq_sum = score_sq_sum + excluded.score_sq_sum,
+        correct_score_sum = correct_score_sum + excluded.correct_score_sum
+"""
+
+
+def record_responses(conn, key, result_ids, sheets, scores):
+    """Stores the answers of graded attempts and folds them into ``question_stats``.
+
+    ``sheets`` are answer sheets encoded against ``key`` (one per result id)
+    and ``scores`` the matching total scores. Runs in the caller's
+    transaction; the caller commits.
+    """
+    sheets = np.atleast_2d(np.asarray(sheets, dtype=np.int8))
+    scores = np.asarray(scores, dtype=np.int64)
+    correct = sheets == key.correct
+    question_ids = key.question_ids.tolist()
+
+    conn.executemany(
+        "INSERT INTO answer_responses (result_id, question_id, chosen_option, correct) VALUES (?, ?, ?, ?)",
+        [(result_id, qid, chosen, ok)
+         for result_id, chosen_row, ok_row in zip(result_ids, sheets.tolist(), correct.astype(np.int8).tolist())
+         for qid, chosen, ok in zip(question_ids, chosen_row, ok_row)])
+
+    attempts = len(scores)
+    option_counts = [(sheets == option).sum(axis=0) for option in range(4)]
+    unanswered = attempts - sum(option_counts)
+    score_sum = int(scores.sum())
+    score_sq_sum = int((scores * scores).sum())
+    correct_counts = correct.sum(axis=0)
+    correct_score_sums = scores @ correct
+    conn.executemany(_UPSERT_STATS, [
+        (qid, key.test_id, attempts, int(correct_counts[i]),
+         int(option_counts[0][i]), int(option_counts[1][i]), int(option_counts[2][i]), int(option_counts[3][i]),
+         int(unanswered[i]), score_sum, score_sq_sum, int(correct_score_sums[i]))
+        for i, qid in enumerate(question_ids)])
+
+
+def rebuild_question_stats(conn, test_id=None):
+    """Recomputes ``question_stats`` from ``answer_responses`` (optionally for one test).
+
+    Use it after deleting results or users, which the running sums do not
+    subtract. Returns the number of rows written; the caller commits.
+    """
+    where = "WHERE q.test_id = ?" if test_id is not None else ""
+    params = (test_id,) if test_id is not None else ()
+    conn.execute(f"DELETE FROM question_stats {'WHERE test_id = ?' if test_id is not None else ''}", params)
+    cursor = conn.execute(f"""
+        INSERT INTO question_stats (question_id, test_id, attempts, correct,
+                                    option1_count, option2_count, option3_count, option4_count,
+                                    unanswered, score_sum, score_sq_sum, correct_score_sum)
+        SELECT ar.question_id, q.test_id, COUNT(*), SUM(ar.correct),
+               SUM(ar.chosen_option = 0), SUM(ar.chosen_option = 1),
+               SUM(ar.chosen_option = 2), SUM(ar.chosen_option = 3),
+               SUM(ar.chosen_option NOT BETWEEN 0 AND 3),
+               SUM(tr.score), SUM(tr.score * tr.score), SUM(tr.score * ar.correct)
+        FROM questions q
+        JOIN all_answer_responses ar ON ar.question_id = q.id
+        JOIN all_test_results tr ON tr.id = ar.result_id
+        {where}
+        GROUP BY ar.question_id
+    """, params)
+    return cursor.rowcount
+
+
+def item_statistics(stats):
+    """Derives difficulty and discrimination from one ``question_stats`` row.
+
+    Discrimination is the corrected (item-rest) point-biserial correlation:
+    the item is correlated with the score on the *other* questions, so on
+    short tests an item does not get credit for correlating with itself.
+    """
+    n = stats['attempts']
+    n1 = stats['correct']
+    result = {
+        'attempts': n,
+        'p_value': n1 / n if n else None,
+        'option_counts': [stats[f'option{i}_count'] for i in range(1, 5)],
+        'unanswered': stats['unanswered'],
+        'discrimination': None,
+    }
+    if not n or n1 in (0, n):
+        return result
+    # Rest score R = score - item. Its sums follow from the stored ones:
+    # sum(R) = S - n1, sum(R over correct) = S1 - n1, sum(R^2) = SS - 2*S1 + n1.
+    s, ss, s1 = stats['score_sum'], stats['score_sq_sum'], stats['correct_score_sum']
+    mean_rest = (s - n1) / n
+    var_rest = (ss - 2 * s1 + n1) / n - mean_rest ** 2
+    if var_rest <= 1e-12:
+        return result
+    mean_correct = (s1 - n1) / n1
+    mean_wrong = (s - s1) / (n - n1)
+    p = n1 / n
+    result['discrimination'] = (mean_correct - mean_wrong) / math.sqrt(var_rest) * math.sqrt(p * (1 - p))
+    return result
+
+
+def test_analytics(conn, bank):
+    """Returns one analytics dict per question of a cached bank, in bank order."""
+    rows = conn.execute("SELECT * FROM question_stats WHERE test_id = ?", (bank.test_id,))
+    by_question = {row['question_id']: row for row in rows}
+    analytics = []
+    for q in bank.questions:
+        row = by_question.get(q['id'])
+        item = item_statistics(row) if row else {
+            'attempts': 0, 'p_value': None, 'option_counts': [0, 0, 0, 0],
+            'unanswered': 0, 'discrimination': None}
+        item.update(question=q, correct_option=bank.answer_key[q['id']])
+        analytics.append(item)
+    return analytics
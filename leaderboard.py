@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""Per-test score histograms, percentile ranks and leaderboards.
+
+Percentages are whole numbers from 0 to 100, so each test's score
+distribution fits in 101 counters (``score_histograms``). Every recorded
+result adds one to its bucket and raises the user's best score in
+``test_best`` if it beat it. A percentile rank then comes from at most 101
+rows instead of counting ``test_results``, and the top of a leaderboard is an
+index range scan, cached briefly per process.
+"""
+import json
+import threading
+import time
+
+from flask import current_app
+
+import queries
+
+BUCKETS = 101
+
+_UPSERT_HISTOGRAM = """
+    INSERT INTO score_histograms (test_id, percentage, count) VALUES (?, ?, ?)
+    ON CONFLICT(test_id, percentage) DO UPDATE SET count = count + excluded.count
+"""
+
+_UPSERT_BEST = """
+    INSERT INTO test_best (test_id, user_id, best_percentage, achieved_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT(test_id, user_id) DO UPDATE SET
+        best_percentage = excluded.best_percentage,
+        achieved_at = excluded.achieved_at
+    WHERE excluded.best_percentage > best_percentage
+"""
+
+
+def _bucket(percentage):
+    return min(max(int(percentage), 0), BUCKETS - 1)
+
+
+def record_scores(conn, test_id, rows):
+    """Adds ``(user_id, percentage, timestamp)`` results of one test to the histogram and bests.
+
+    Runs in the caller's transaction; the caller commits.
+    """
+    counts = {}
+    for _, percentage, _ in rows:
+        counts[_bucket(percentage)] = counts.get(_bucket(percentage), 0) + 1
+    conn.executemany(_UPSERT_HISTOGRAM, [(test_id, bucket, n) for bucket, n in counts.items()])
+    conn.executemany(_UPSERT_BEST, [(test_id, user_id, percentage, timestamp)
+                                    for user_id, percentage, timestamp in rows])
+
+
+def forget_user(conn, user_id):
+    """Takes a user's results out of the histograms before the user is deleted.
+
+    Their ``test_best`` rows go with the user through the foreign key. The
+    caller deletes the user and commits.
+    """
+    conn.execute("""
+        UPDATE score_histograms SET count = count - (
+            SELECT COUNT(*) FROM all_test_results tr
+            WHERE tr.user_id = ? AND tr.test_id = score_histograms.test_id
+              AND MIN(MAX(tr.percentage, 0), 100) = score_histograms.percentage)
+        WHERE test_id IN (SELECT DISTINCT test_id FROM all_test_results WHERE user_id = ?)
+    """, (user_id, user_id))
+    conn.execute("DELETE FROM score_histograms WHERE count <= 0")
+
+
+def rebuild_leaderboards(conn, test_id=None):
+    """Recomputes ``score_histograms`` and ``test_best`` from all results (optionally for one test).
+
+    Returns the number of ``test_best`` rows written; the caller commits.
+    """
+    where = "WHERE test_id = ?" if test_id is not None else ""
+    params = (test_id,) if test_id is not None else ()
+    conn.execute(f"DELETE FROM score_histograms {where}", params)
+    conn.execute(f"DELETE FROM test_best {where}", params)
+    conn.execute(f"""
+        INSERT INTO score_histograms (test_id, percentage, count)
+        SELECT test_id, MIN(MAX(percentage, 0), 100) AS bucket, COUNT(*)
+        FROM all_test_results {where}
+        GROUP BY test_id, bucket
+    """, params)
+    # The earliest attempt reaching a user's best score is when they achieved it
+    cursor = conn.execute(f"""
+        INSERT INTO test_best (test_id, user_id, best_percentage, achieved_at)
+        SELECT test_id, user_id, MAX(percentage), MIN(timestamp) FROM (
+            SELECT test_id, user_id, percentage, timestamp,
+                   RANK() OVER (PARTITION BY test_id, user_id ORDER BY percentage DESC) AS pos
+            FROM all_test_results {where}
+        ) WHERE pos = 1
+        GROUP BY test_id, user_id
+    """, params)
+    return cursor.rowcount
+
+
+def histograms(conn, test_ids):
+    """Returns ``{test_id: [count per percentage 0..100]}`` for the given tests."""
+    result = {}
+    if not test_ids:
+        return result
+    for test_id, percentage, count in conn.execute(queries.SCORE_HISTOGRAMS, (json.dumps(list(test_ids)),)):
+        result.setdefault(test_id, [0] * BUCKETS)[percentage] = count
+    return result
+
+
+def percentile_rank(counts, percentage):
+    """Share of attempts scoring below ``percentage``, counting ties as half, in percent."""
+    if not counts:
+        return None
+    total = sum(counts)
+    if not total:
+        return None
+    bucket = _bucket(percentage)
+    return round(100 * (sum(counts[:bucket]) + counts[bucket] / 2) / total)
+
+
+def top_scores(conn, test_id, limit):
+    return [dict(row) for row in conn.execute(queries.LEADERBOARD_TOP, (test_id, limit))]
+
+
+class LeaderboardCache:
+    """The top rows of each test's leaderboard, kept for ``ttl`` seconds."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, conn, test_id, limit):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((test_id, limit))
+        if entry is None or entry[0] <= now:
+            entry = (now + self.ttl, top_scores(conn, test_id, limit))
+            with self._lock:
+                self._entries[(test_id, limit)] = entry
+        return entry[1]
+
+
+def get_leaderboard_cache(app=None):
+    if app is None:
+        app = current_app._get_current_object()
+    cache = app.extensions.get('leaderboards')
+    if cache is None:
+        cache = app.extensions.setdefault(
+            'leaderboards', LeaderboardCache(app.config.get('LEADERBOARD_CACHE_SECONDS', 30)))
+    return cache
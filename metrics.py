@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""Per-endpoint request, SQL and template timing.
+
+Latencies go into fixed-bucket histograms (one per endpoint), so recording a
+request is a handful of additions under a lock and percentiles are estimated
+from the buckets. SQL statements are counted and timed by
+``InstrumentedConnection``, which the connection pool uses when
+``METRICS_ENABLED`` is on; template render time comes from Flask's
+``before_render_template``/``template_rendered`` signals.
+"""
+import bisect
+import sqlite3
+import threading
+import time
+
+from flask import before_render_template, current_app, g, request, template_rendered
+
+# Upper bounds in seconds; the last bucket is +Inf.
+BUCKETS = (0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.connection.record_statement(time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.connection.record_statement(time.perf_counter() - start)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Counts statements and the time spent executing them since ``reset_stats()``."""
+
+    sql_count = 0
+    sql_time = 0.0
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute() does not go through cursor(), so route it explicitly.
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def record_statement(self, elapsed):
+        self.sql_count += 1
+        self.sql_time += elapsed
+
+    def reset_stats(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, p):
+        """Estimates the p-th percentile by interpolating inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank = self.count * p / 100
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1] * 2
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-1]
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.endpoints = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, elapsed, status, sql_count, sql_time, render_time):
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats()
+            stats.latency.observe(elapsed)
+            if status >= 500:
+                stats.errors += 1
+            stats.sql_count += sql_count
+            stats.sql_time += sql_time
+            stats.render_time += render_time
+
+    def increment(self, name, amount=1, **labels):
+        """Bumps a free-form counter, e.g. ``increment('shed', route='submit_test')``."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def snapshot(self):
+        """Returns one summary dict per endpoint, slowest p95 first."""
+        rows = []
+        with self._lock:
+            for endpoint, s in self.endpoints.items():
+                n = s.latency.count
+                rows.append({
+                    'endpoint': endpoint,
+                    'count': n,
+                    'errors': s.errors,
+                    'mean_ms': s.latency.sum / n * 1000 if n else 0.0,
+                    'p50_ms': s.latency.percentile(50) * 1000,
+                    'p95_ms': s.latency.percentile(95) * 1000,
+                    'p99_ms': s.latency.percentile(99) * 1000,
+                    'sql_per_request': s.sql_count / n if n else 0.0,
+                    'sql_ms_per_request': s.sql_time / n * 1000 if n else 0.0,
+                    'render_ms_per_request': s.render_time / n * 1000 if n else 0.0,
+                })
+        rows.sort(key=lambda r: r['p95_ms'], reverse=True)
+        return rows
+
+    def counter_snapshot(self):
+        with self._lock:
+            return [(name, dict(labels), value) for (name, labels), value in sorted(self.counters.items())]
+
+    def prometheus_text(self):
+        """Renders the registry in the Prometheus text exposition format."""
+        lines = [
+            '# HELP http_request_duration_seconds Request latency by endpoint.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+            for endpoint, s in endpoints:
+                cumulative = 0
+                for bound, n in zip(BUCKETS + (float('inf'),), s.latency.counts):
+                    cumulative += n
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'http_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{le}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_sum{{endpoint="{endpoint}"}} {s.latency.sum}')
+                lines.append(f'http_request_duration_seconds_count{{endpoint="{endpoint}"}} {s.latency.count}')
+            for name, help_text, attr in (
+                    ('http_request_errors_total', 'Requests answered with a 5xx status.', 'errors'),
+                    ('sql_statements_total', 'SQL statements executed.', 'sql_count'),
+                    ('sql_duration_seconds_total', 'Time spent executing SQL.', 'sql_time'),
+                    ('template_render_seconds_total', 'Time spent rendering templates.', 'render_time')):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for endpoint, s in endpoints:
+                    lines.append(f'{name}{{endpoint="{endpoint}"}} {getattr(s, attr)}')
+            seen = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in seen:
+                    lines.append(f'# TYPE {name} counter')
+                    seen.add(name)
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def get_registry(app):
+    return app.extensions['metrics']
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_render_time = 0.0
+    g.metrics_status = 500
+
+
+def _after_request(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _teardown_request(exc=None):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    conn = g.get('db')
+    sql_count = getattr(conn, 'sql_count', 0)
+    sql_time = getattr(conn, 'sql_time', 0.0)
+    render_time = g.pop('metrics_render_time', 0.0)
+    endpoint = request.endpoint or 'unmatched'
+    app = current_app._get_current_object()
+    get_registry(app).record(endpoint, elapsed, g.pop('metrics_status', 500),
+                             sql_count, sql_time, render_time)
+    threshold = app.config.get('SLOW_REQUEST_MS')
+    if threshold is not None and elapsed * 1000 >= threshold:
+        app.logger.warning(
+            'Slow request: %s %s (%s) took %.1f ms; %d SQL statements in %.1f ms, render %.1f ms',
+            request.method, request.path, endpoint, elapsed * 1000,
+            sql_count, sql_time * 1000, render_time * 1000)
+
+
+def _render_started(sender, template, context, **extra):
+    if 'metrics_start' in g:
+        g.setdefault('metrics_render_stack', []).append(time.perf_counter())
+
+
+def _render_finished(sender, template, context, **extra):
+    stack = g.get('metrics_render_stack')
+    if stack:
+        elapsed = time.perf_counter() - stack.pop()
+        if not stack: # Count nested renders once
+            g.metrics_render_time = g.get('metrics_render_time', 0.0) + elapsed
+
+
+def init_app(app):
+    """Installs the request hooks; a no-op unless METRICS_ENABLED is set."""
+    app.extensions['metrics'] = MetricsRegistry()
+    if not app.config.get('METRICS_ENABLED'):
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
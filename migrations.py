@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+"""Versioned schema migrations tracked in ``PRAGMA user_version``.
+
+Each migration is applied in its own transaction together with the version
+bump, so an interrupted upgrade never leaves the schema half-migrated.
+Migrations only ever add to the schema; existing data is left untouched.
+"""
+import archive
+import queries
+from leaderboard import rebuild_leaderboards
+from pagination import page_sql
+from question_search import rebuild_index
+from results import rebuild_progress
+
+
+def _backfill_progress(conn):
+    rebuild_progress(conn)
+
+
+def _backfill_leaderboards(conn):
+    rebuild_leaderboards(conn)
+
+
+def _backfill_search_index(conn):
+    rebuild_index(conn)
+
+
+# (version, description, steps) - a step is an SQL string or a callable(conn).
+MIGRATIONS = [
+    (1, 'Base schema: users, tests, questions, test_results', [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS tests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            type TEXT NOT NULL CHECK(type IN ('قياس', 'تحصيلي')),
+            level INTEGER NOT NULL DEFAULT 1
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS questions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            test_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            option1 TEXT NOT NULL,
+            option2 TEXT NOT NULL,
+            option3 TEXT NOT NULL,
+            option4 TEXT NOT NULL,
+            correct_option TEXT NOT NULL,
+            FOREIGN KEY (test_id) REFERENCES tests (id) ON DELETE CASCADE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS test_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            test_id INTEGER NOT NULL,
+            score INTEGER NOT NULL,
+            total_questions INTEGER NOT NULL,
+            percentage INTEGER NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
+            FOREIGN KEY (test_id) REFERENCES tests (id) ON DELETE CASCADE
+        )
+        ''',
+    ]),
+    (2, 'Question bank versions and materialized user progress', [
+        # Bumped by the admin routes whenever a test's questions change, so every
+        # worker can tell whether its cached question bank is still current.
+        '''
+        CREATE TABLE IF NOT EXISTS question_bank_versions (
+            test_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        # One row per user and test type, maintained by submit_test, so the
+        # dashboard does not aggregate the whole attempt history on every load.
+        '''
+        CREATE TABLE IF NOT EXISTS user_progress (
+            user_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            max_level INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            best_percentage INTEGER NOT NULL DEFAULT 0,
+            last_attempt DATETIME,
+            PRIMARY KEY (user_id, type),
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+        ''',
+        _backfill_progress,
+    ]),
+    (3, 'Indexes for the hot-path queries', [
+        # Question banks are loaded by test; the rows themselves are cached.
+        'CREATE INDEX IF NOT EXISTS idx_questions_test_id ON questions (test_id, id)',
+        # Covers the dashboard history query without touching the table.
+        '''
+        CREATE INDEX IF NOT EXISTS idx_test_results_user_timestamp
+        ON test_results (user_id, timestamp, id, test_id, score, total_questions, percentage)
+        ''',
+        # Covers both the dashboard level lookup and the next-test lookup.
+        'CREATE INDEX IF NOT EXISTS idx_tests_type_level ON tests (type, level, id, name)',
+    ]),
+    (4, 'Per-answer responses and incremental per-question statistics', [
+        # One row per answered question of each attempt. chosen_option is the
+        # option index 0-3, or -1 when the question was left unanswered.
+        '''
+        CREATE TABLE IF NOT EXISTS answer_responses (
+            result_id INTEGER NOT NULL,
+            question_id INTEGER NOT NULL,
+            chosen_option INTEGER NOT NULL,
+            correct INTEGER NOT NULL,
+            PRIMARY KEY (result_id, question_id),
+            FOREIGN KEY (result_id) REFERENCES test_results (id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_answer_responses_question ON answer_responses (question_id)',
+        # Running sums per question, maintained at submit time by item_analysis.
+        '''
+        CREATE TABLE IF NOT EXISTS question_stats (
+            question_id INTEGER PRIMARY KEY,
+            test_id INTEGER NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            correct INTEGER NOT NULL DEFAULT 0,
+            option1_count INTEGER NOT NULL DEFAULT 0,
+            option2_count INTEGER NOT NULL DEFAULT 0,
+            option3_count INTEGER NOT NULL DEFAULT 0,
+            option4_count INTEGER NOT NULL DEFAULT 0,
+            unanswered INTEGER NOT NULL DEFAULT 0,
+            score_sum INTEGER NOT NULL DEFAULT 0,
+            score_sq_sum INTEGER NOT NULL DEFAULT 0,
+            correct_score_sum INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_question_stats_test ON question_stats (test_id)',
+    ]),
+    (5, 'Packed answer sheets on test results', [
+        # grading.pack_sheet(): 3 bits per question, plus the fingerprint of the
+        # question order, so a past attempt can be reviewed later.
+        'ALTER TABLE test_results ADD COLUMN answers BLOB',
+        'ALTER TABLE test_results ADD COLUMN answers_fingerprint INTEGER',
+    ]),
+    (6, 'Question pools sampled per attempt', [
+        # NULL serves every question; otherwise each attempt gets this many,
+        # drawn at random (stratified by questions.stratum) by question_pool.
+        'ALTER TABLE tests ADD COLUMN sample_size INTEGER',
+        'ALTER TABLE questions ADD COLUMN stratum TEXT',
+        # Covers the pool id index load without reading question text.
+        'CREATE INDEX IF NOT EXISTS idx_questions_test_stratum ON questions (test_id, stratum, id)',
+        # The question ids served to each attempt, as a JSON array in display order.
+        '''
+        CREATE TABLE IF NOT EXISTS attempts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            test_id INTEGER NOT NULL,
+            question_ids TEXT NOT NULL,
+            started_at DATETIME NOT NULL,
+            submitted_at DATETIME,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
+            FOREIGN KEY (test_id) REFERENCES tests (id) ON DELETE CASCADE
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_attempts_open ON attempts (user_id, test_id, submitted_at)',
+        'ALTER TABLE test_results ADD COLUMN attempt_id INTEGER',
+    ]),
+    (7, 'Adaptive tests and IRT item parameters', [
+        # NULL is a fixed form; 'adaptive' serves one question at a time (see adaptive.py).
+        'ALTER TABLE tests ADD COLUMN mode TEXT',
+        # The answers of an adaptive attempt so far, as a JSON array of
+        # [chosen_option, correct] aligned with attempts.question_ids.
+        'ALTER TABLE attempts ADD COLUMN responses TEXT',
+        # 2PL parameters written by `flask calibrate-items`.
+        '''
+        CREATE TABLE IF NOT EXISTS item_params (
+            question_id INTEGER PRIMARY KEY,
+            test_id INTEGER NOT NULL,
+            discrimination REAL NOT NULL,
+            difficulty REAL NOT NULL,
+            responses INTEGER NOT NULL,
+            FOREIGN KEY (question_id) REFERENCES questions (id) ON DELETE CASCADE
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_item_params_test ON item_params (test_id)',
+    ]),
+    (8, 'Score histograms and leaderboards', [
+        # How many results of each test scored each whole percentage (0-100).
+        '''
+        CREATE TABLE IF NOT EXISTS score_histograms (
+            test_id INTEGER NOT NULL,
+            percentage INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (test_id, percentage),
+            FOREIGN KEY (test_id) REFERENCES tests (id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+        ''',
+        # Each user's best score per test, for the leaderboards.
+        '''
+        CREATE TABLE IF NOT EXISTS test_best (
+            test_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            best_percentage INTEGER NOT NULL,
+            achieved_at DATETIME NOT NULL,
+            PRIMARY KEY (test_id, user_id),
+            FOREIGN KEY (test_id) REFERENCES tests (id) ON DELETE CASCADE,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_test_best_rank
+        ON test_best (test_id, best_percentage DESC, achieved_at, user_id)
+        ''',
+        _backfill_leaderboards,
+    ]),
+    (9, 'Autosaved answers of tests in progress', [
+        # The latest answer to each question, as a JSON object {"<question_id>": "<option>"};
+        # written by autosave.py and cleared when the test is submitted (see migration 11).
+        '''
+        CREATE TABLE IF NOT EXISTS draft_answers (
+            user_id INTEGER NOT NULL,
+            test_id INTEGER NOT NULL,
+            answers TEXT NOT NULL,
+            updated_at DATETIME NOT NULL,
+            PRIMARY KEY (user_id, test_id),
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
+            FOREIGN KEY (test_id) REFERENCES tests (id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    (10, 'Question search index and near-duplicate sketches', [
+        # Normalized text and options (see question_search.normalize); contentless,
+        # the rowid is questions.id. Prefix indexes serve search-as-you-type.
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(
+            text, options, content='', prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+        )
+        ''',
+        # The bottom-k sketch of each question's text, one row per hash.
+        '''
+        CREATE TABLE IF NOT EXISTS question_shingles (
+            hash INTEGER NOT NULL,
+            question_id INTEGER NOT NULL,
+            PRIMARY KEY (hash, question_id)
+        ) WITHOUT ROWID
+        ''',
+        # normalize_arabic and question_sketch are registered on every pooled
+        # connection by question_search.register_functions.
+        '''
+        CREATE TRIGGER IF NOT EXISTS questions_search_insert AFTER INSERT ON questions BEGIN
+            INSERT INTO questions_fts (rowid, text, options)
+            VALUES (new.id, normalize_arabic(new.text),
+                    normalize_arabic(new.option1 || ' ' || new.option2 || ' ' || new.option3 || ' ' || new.option4));
+            INSERT OR IGNORE INTO question_shingles (hash, question_id)
+            SELECT value, new.id FROM json_each(question_sketch(new.text));
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS questions_search_delete AFTER DELETE ON questions BEGIN
+            INSERT INTO questions_fts (questions_fts, rowid, text, options)
+            VALUES ('delete', old.id, normalize_arabic(old.text),
+                    normalize_arabic(old.option1 || ' ' || old.option2 || ' ' || old.option3 || ' ' || old.option4));
+            DELETE FROM question_shingles
+            WHERE question_id = old.id AND hash IN (SELECT value FROM json_each(question_sketch(old.text)));
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS questions_search_update
+        AFTER UPDATE OF text, option1, option2, option3, option4 ON questions BEGIN
+            INSERT INTO questions_fts (questions_fts, rowid, text, options)
+            VALUES ('delete', old.id, normalize_arabic(old.text),
+                    normalize_arabic(old.option1 || ' ' || old.option2 || ' ' || old.option3 || ' ' || old.option4));
+            DELETE FROM question_shingles
+            WHERE question_id = old.id AND hash IN (SELECT value FROM json_each(question_sketch(old.text)));
+            INSERT INTO questions_fts (rowid, text, options)
+            VALUES (new.id, normalize_arabic(new.text),
+                    normalize_arabic(new.option1 || ' ' || new.option2 || ' ' || new.option3 || ' ' || new.option4));
+            INSERT OR IGNORE INTO question_shingles (hash, question_id)
+            SELECT value, new.id FROM json_each(question_sketch(new.text));
+        END
+        ''',
+        _backfill_search_index,
+    ]),
+    (11, 'Tie autosaved answers to an attempt', [
+        # The attempt token the answers were saved under (autosave.new_attempt_token).
+        # Submitting a test keeps the row, emptied, with submitted = 1, so late saves
+        # from that attempt or an earlier one are turned away.
+        'ALTER TABLE draft_answers ADD COLUMN attempt INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE draft_answers ADD COLUMN submitted INTEGER NOT NULL DEFAULT 0',
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def pending_migrations(conn):
+    current = get_version(conn)
+    return [m for m in MIGRATIONS if m[0] > current]
+
+
+def upgrade(conn, target=None):
+    """Applies every pending migration up to ``target``; returns the versions applied."""
+    applied = []
+    for version, description, steps in pending_migrations(conn):
+        if target is not None and version > target:
+            break
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        archive.define_views(conn) # Pick up the columns this migration added
+        applied.append((version, description))
+    return applied
+
+
+# Queries that run on every student request, with sample parameters. The SQL
+# is the same constant the code runs (queries.py); `flask db check-plans`
+# fails if any of them scans a table.
+HOT_PATH_QUERIES = {
+    'login': (queries.LOGIN_USER, ('s',)),
+    'register_duplicate_check': (queries.REGISTER_DUPLICATE, ('s', 'e')),
+    'dashboard_progress': (queries.DASHBOARD_PROGRESS, (1,)),
+    'api_dashboard_version': (queries.DASHBOARD_VERSION, (1,)),
+    'dashboard_available_tests': (queries.AVAILABLE_TESTS, ('قياس', 2)),
+    'dashboard_history': (
+        page_sql(queries.DASHBOARD_HISTORY.format(source='test_results'), queries.DASHBOARD_HISTORY_KEY,
+                 descending=True, seek=True),
+        (1, '2100-01-01 00:00:00', 1, 21)),
+    'question_bank_version': (queries.QUESTION_BANK_VERSION, (1,)),
+    'question_bank_test': (queries.QUESTION_BANK_TEST, (1,)),
+    'question_bank_questions': (queries.QUESTION_BANK_QUESTIONS, (1,)),
+    'test_info': (queries.TEST_INFO, (1,)),
+    'pool_index': (queries.POOL_INDEX, (1,)),
+    'open_attempt': (queries.OPEN_POOLED_ATTEMPT, (1, 1)),
+    'attempt_questions': (queries.ATTEMPT_QUESTIONS, ('[1, 2]', 1)),
+    'attempt_owner': (queries.ATTEMPT_OWNER, (1, 1, 1)),
+    'claim_attempt': (queries.CLAIM_ATTEMPT, ('2100-01-01 00:00:00', 1)),
+    'open_adaptive_attempt': (queries.OPEN_ADAPTIVE_ATTEMPT, (1, 1)),
+    'adaptive_attempt': (queries.ADAPTIVE_ATTEMPT, (1, 1, 1)),
+    'score_histograms': (queries.SCORE_HISTOGRAMS, ('[1, 2]',)),
+    'leaderboard_top': (queries.LEADERBOARD_TOP, (1, 10)),
+    'draft_answers': (queries.DRAFT_ANSWERS, (1, 1)),
+    'next_test': (queries.NEXT_TEST, ('قياس', 2)),
+}
+
+
+def query_plan(conn, sql, params):
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def check_query_plans(conn):
+    """Returns ``{name: plan}`` for every hot-path query that falls back to a scan."""
+    failures = {}
+    for name, (sql, params) in HOT_PATH_QUERIES.items():
+        plan = query_plan(conn, sql, params)
+        # Scanning a json_each() virtual table walks the bound parameter, not a table
+        if any(detail.startswith('SCAN') and 'VIRTUAL TABLE' not in detail for detail in plan):
+            failures[name] = plan
+    return failures
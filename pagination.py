@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Keyset (cursor) pagination for listing pages.
+
+Instead of ``OFFSET``, each page remembers the sort key of its first and last
+row in opaque ``before``/``after`` cursors. The next query seeks straight to
+that key through the index, so the cost of a page does not depend on how many
+rows come before it.
+"""
+import base64
+import json
+
+from flask import current_app, request
+
+
+class Page:
+    def __init__(self, items, next_cursor=None, prev_cursor=None, per_page=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.per_page = per_page
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, size):
+    """Returns the cursor's key values, or None if it is missing or malformed."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if (not isinstance(values, list) or len(values) != size
+            or not all(isinstance(v, (str, int, float)) for v in values)):
+        return None
+    return tuple(values)
+
+
+def get_per_page():
+    """Reads ``per_page`` from the query string, clamped to ``MAX_PAGE_SIZE``."""
+    default = current_app.config.get('PAGE_SIZE', 20)
+    maximum = current_app.config.get('MAX_PAGE_SIZE', 100)
+    per_page = request.args.get('per_page', default, type=int)
+    return max(1, min(per_page, maximum))
+
+
+def page_sql(sql, columns, descending=False, seek=False, backwards=False):
+    """Fills in ``sql``'s ``{keyset}`` and ``{order}`` placeholders and adds ``LIMIT ?``.
+
+    With ``seek`` the query takes the cursor's key values after ``params``;
+    ``backwards`` reads the rows before the cursor instead of after it.
+    """
+    keyset = ''
+    if seek:
+        # Moving forward means "later in display order": smaller keys when descending
+        forward_op = '<' if descending else '>'
+        op = {'<': '>', '>': '<'}[forward_op] if backwards else forward_op
+        expressions = ', '.join(expr for expr, _ in columns)
+        keyset = f"AND ({expressions}) {op} ({', '.join('?' * len(columns))})"
+    direction = 'DESC' if descending != backwards else 'ASC'
+    order = ', '.join(f'{expr} {direction}' for expr, _ in columns)
+    return sql.format(keyset=keyset, order=order) + " LIMIT ?"
+
+
+def paginate(conn, sql, params, columns, descending=False):
+    """Runs one page of ``sql`` using the ``after``/``before`` request cursors.
+
+    ``sql`` must contain a ``{keyset}`` placeholder inside its WHERE clause
+    (replaced by ``AND (...) > (...)`` or an empty string) and an ``{order}``
+    placeholder after ``ORDER BY``. ``columns`` lists ``(sql_expression,
+    row_key)`` pairs forming a unique sort key, e.g.
+    ``[('tr.timestamp', 'timestamp'), ('tr.id', 'id')]``.
+    """
+    per_page = get_per_page()
+    after = decode_cursor(request.args.get('after'), len(columns))
+    before = decode_cursor(request.args.get('before'), len(columns)) if after is None else None
+    backwards = before is not None
+    key = before if backwards else after
+
+    rows = conn.execute(page_sql(sql, columns, descending, key is not None, backwards),
+                        tuple(params) + (key or ()) + (per_page + 1,)).fetchall()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    def cursor_of(row):
+        return encode_cursor(row[name] for _, name in columns)
+
+    has_next = has_more if not backwards else True
+    has_prev = has_more if backwards else key is not None
+    return Page(rows,
+                next_cursor=cursor_of(rows[-1]) if rows and has_next else None,
+                prev_cursor=cursor_of(rows[0]) if rows and has_prev else None,
+                per_page=per_page)
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""Password hashing with pluggable, versioned hash formats.
+
+Each stored hash names the scheme that produced it. ``scrypt`` hashes look
+like ``scrypt$<n>$<r>$<p>$<salt>$<key>`` (base64 salt and key), so their
+cost parameters travel with them; the original unsalted SHA-256 hashes are
+bare 64-character hex strings and are still accepted. ``verify_password``
+also reports whether a hash should be replaced: a legacy scheme or an
+outdated cost. The login route then rehashes the password it just checked.
+
+A strong KDF costs tens of milliseconds of CPU per call, so request
+threads hand hashing to a ``PasswordPool``: a fixed number of workers plus
+a bounded number of waiting requests. When it is full, new logins are
+turned away at once (``Overloaded``) instead of queueing without limit.
+A bulk job such as a roster upload takes a single one of those places
+(``PasswordPool.map``) and feeds the workers a batch at a time, so logins
+arriving meanwhile wait behind one batch rather than the whole roster.
+
+This module does not import Flask, so the bulk-import worker processes
+(see user_io) stay light.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+
+class LegacySha256Hasher:
+    """The original format: unsalted SHA-256 as hex, rehashed on login unless it is the default."""
+
+    name = 'sha256'
+
+    def identify(self, stored):
+        return len(stored) == 64 and all(c in '0123456789abcdef' for c in stored)
+
+    def hash(self, password):
+        return hashlib.sha256(password.encode('utf-8')).hexdigest()
+
+    def verify(self, password, stored):
+        return hmac.compare_digest(self.hash(password), stored)
+
+    def needs_rehash(self, stored):
+        return False
+
+
+class ScryptHasher:
+    """Salted, memory-hard scrypt (``hashlib.scrypt``); memory use is about 128 * n * r bytes."""
+
+    name = 'scrypt'
+
+    def __init__(self, n=2 ** 14, r=8, p=1, salt_size=16, key_size=32):
+        self.n, self.r, self.p = n, r, p
+        self.salt_size = salt_size
+        self.key_size = key_size
+
+    def _derive(self, password, salt, n, r, p, key_size):
+        return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                              maxmem=128 * r * (n + p + 2) + 1024 * 1024, dklen=key_size)
+
+    def identify(self, stored):
+        return stored.startswith('scrypt$')
+
+    def hash(self, password):
+        salt = os.urandom(self.salt_size)
+        key = self._derive(password, salt, self.n, self.r, self.p, self.key_size)
+        return '$'.join(['scrypt', str(self.n), str(self.r), str(self.p),
+                         base64.b64encode(salt).decode('ascii'), base64.b64encode(key).decode('ascii')])
+
+    def _parse(self, stored):
+        _, n, r, p, salt, key = stored.split('$')
+        return int(n), int(r), int(p), base64.b64decode(salt), base64.b64decode(key)
+
+    def verify(self, password, stored):
+        try:
+            n, r, p, salt, key = self._parse(stored)
+        except ValueError:
+            return False
+        return hmac.compare_digest(self._derive(password, salt, n, r, p, len(key)), key)
+
+    def needs_rehash(self, stored):
+        n, r, p, _, key = self._parse(stored)
+        return (n, r, p, len(key)) != (self.n, self.r, self.p, self.key_size)
+
+
+HASHERS = {}
+_default = None
+
+
+def register_hasher(hasher, default=False):
+    """Adds a hash format; the default one is used for new hashes."""
+    global _default
+    HASHERS[hasher.name] = hasher
+    if default or _default is None:
+        _default = hasher
+
+
+register_hasher(ScryptHasher(), default=True)
+register_hasher(LegacySha256Hasher())
+
+
+def configure(config):
+    """Applies the PASSWORD_* settings: the default scheme and the scrypt cost."""
+    register_hasher(ScryptHasher(n=config.get('PASSWORD_SCRYPT_N', 2 ** 14),
+                                 r=config.get('PASSWORD_SCRYPT_R', 8),
+                                 p=config.get('PASSWORD_SCRYPT_P', 1)))
+    register_hasher(HASHERS[config.get('PASSWORD_HASHER', 'scrypt')], default=True)
+
+
+def identify(stored):
+    """The hasher that produced ``stored``, or None."""
+    for hasher in HASHERS.values():
+        if hasher.identify(stored):
+            return hasher
+    return None
+
+
+def hash_password(password):
+    return _default.hash(password)
+
+
+def verify_password(password, stored):
+    """Returns ``(matches, needs_rehash)`` for a password against a stored hash."""
+    hasher = identify(stored or '')
+    if hasher is None or not hasher.verify(password, stored):
+        return False, False
+    return True, hasher is not _default or hasher.needs_rehash(stored)
+
+
+_dummy_hashes = {}
+
+
+def dummy_hash():
+    """A hash in the default format and cost, to verify against when the username is unknown.
+
+    Checking it costs as much as checking a real account, so the time a
+    failed login takes does not tell whether the username exists.
+    """
+    stored = _dummy_hashes.get(_default)
+    if stored is None:
+        stored = _dummy_hashes[_default] = _default.hash(os.urandom(16).hex())
+    return stored
+
+
+class Overloaded(Exception):
+    """Raised when the password pool has no room for another request."""
+
+
+class PasswordPool:
+    """Runs hashing on ``workers`` threads (or processes) with at most ``max_pending`` calls admitted."""
+
+    def __init__(self, workers=4, max_pending=64, timeout=10.0, kind='thread'):
+        if kind == 'process':
+            self.executor = ProcessPoolExecutor(workers)
+        else:
+            self.executor = ThreadPoolExecutor(workers, thread_name_prefix='password')
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self.rejected = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(workers=config.get('PASSWORD_POOL_WORKERS', 4),
+                   max_pending=config.get('PASSWORD_POOL_MAX_PENDING', 64),
+                   timeout=config.get('PASSWORD_POOL_TIMEOUT', 10.0),
+                   kind=config.get('PASSWORD_POOL_KIND', 'thread'))
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise Overloaded()
+        try:
+            return self.executor.submit(fn, *args).result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise Overloaded()
+        finally:
+            self._slots.release()
+
+    def map(self, fn, items):
+        """Applies ``fn`` to every item, ``workers`` at a time, holding one admission slot throughout."""
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise Overloaded()
+        try:
+            results = []
+            for start in range(0, len(items), self.workers):
+                futures = [self.executor.submit(fn, item) for item in items[start:start + self.workers]]
+                results.extend(future.result(timeout=self.timeout) for future in futures)
+            return results
+        except FutureTimeoutError:
+            raise Overloaded()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self.run(hash_password, password)
+
+    def verify(self, password, stored):
+        return self.run(verify_password, password, stored)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+_pool_lock = threading.Lock()
+
+
+def get_password_pool(app=None):
+    """Returns this process's password pool, created on first use."""
+    if app is None:
+        from flask import current_app
+        app = current_app._get_current_object()
+    pool = app.extensions.get('password_pool')
+    if pool is None or pool.pid != os.getpid():
+        with _pool_lock:
+            pool = app.extensions.get('password_pool')
+            if pool is None or pool.pid != os.getpid():
+                pool = PasswordPool.from_config(app.config)
+                app.extensions['password_pool'] = pool
+    return pool
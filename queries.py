@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""SQL of the queries that run on every student request.
+
+The modules that run these statements import them from here, and so does
+``migrations.HOT_PATH_QUERIES``, so `flask db check-plans` explains the
+statements the application actually executes. Change a hot-path query here,
+not at its call site. This module imports nothing, so any module can use it.
+"""
+
+LOGIN_USER = "SELECT id, username, password_hash FROM users WHERE username = ?"
+
+REGISTER_DUPLICATE = "SELECT id FROM users WHERE username = ? OR email = ?"
+
+DASHBOARD_PROGRESS = "SELECT type, max_level FROM user_progress WHERE user_id = ?"
+
+# The JSON dashboard's cache version: changes whenever a result is recorded
+DASHBOARD_VERSION = "SELECT COALESCE(SUM(attempts), 0), MAX(last_attempt) FROM user_progress WHERE user_id = ?"
+
+AVAILABLE_TESTS = "SELECT id, name, level FROM tests WHERE type = ? AND (level = 1 OR level = ?) ORDER BY level, name"
+
+# A template for pagination.paginate once {source} is filled in with
+# test_results or all_test_results (which adds the archived ones)
+DASHBOARD_HISTORY = """
+    SELECT tr.id, tr.test_id, tr.score, tr.total_questions, tr.percentage, tr.timestamp, t.name as test_name
+    FROM {source} tr JOIN tests t ON tr.test_id = t.id
+    WHERE tr.user_id = ? {{keyset}} ORDER BY {{order}}
+"""
+DASHBOARD_HISTORY_KEY = [('tr.timestamp', 'timestamp'), ('tr.id', 'id')]
+
+TEST_INFO = "SELECT id, name, type, level, sample_size, mode FROM tests WHERE id = ?"
+
+NEXT_TEST = "SELECT id FROM tests WHERE type = ? AND level = ? ORDER BY id LIMIT 1"
+
+QUESTION_BANK_VERSION = "SELECT version FROM question_bank_versions WHERE test_id = ?"
+
+QUESTION_BANK_TEST = "SELECT id, name, type, level FROM tests WHERE id = ?"
+
+QUESTION_BANK_QUESTIONS = """
+    SELECT id, text, option1, option2, option3, option4, correct_option
+    FROM questions WHERE test_id = ? ORDER BY id
+"""
+
+POOL_INDEX = "SELECT stratum, id FROM questions WHERE test_id = ? ORDER BY stratum, id"
+
+# Pooled and fixed attempts have no responses; adaptive ones always do
+OPEN_POOLED_ATTEMPT = """
+    SELECT id, question_ids FROM attempts
+    WHERE user_id = ? AND test_id = ? AND submitted_at IS NULL AND responses IS NULL
+    ORDER BY id DESC LIMIT 1
+"""
+
+ATTEMPT_QUESTIONS = """
+    SELECT id, text, option1, option2, option3, option4, correct_option
+    FROM questions WHERE id IN (SELECT value FROM json_each(?)) AND test_id = ?
+"""
+
+ATTEMPT_OWNER = "SELECT question_ids FROM attempts WHERE id = ? AND user_id = ? AND test_id = ?"
+
+CLAIM_ATTEMPT = "UPDATE attempts SET submitted_at = ? WHERE id = ? AND submitted_at IS NULL"
+
+OPEN_ADAPTIVE_ATTEMPT = """
+    SELECT id, question_ids, responses FROM attempts
+    WHERE user_id = ? AND test_id = ? AND submitted_at IS NULL AND responses IS NOT NULL
+    ORDER BY id DESC LIMIT 1
+"""
+
+ADAPTIVE_ATTEMPT = """
+    SELECT id, question_ids, responses FROM attempts
+    WHERE id = ? AND user_id = ? AND test_id = ? AND submitted_at IS NULL AND responses IS NOT NULL
+"""
+
+SCORE_HISTOGRAMS = """
+    SELECT test_id, percentage, count FROM score_histograms
+    WHERE test_id IN (SELECT value FROM json_each(?))
+"""
+
+LEADERBOARD_TOP = """
+    SELECT u.username, tb.best_percentage, tb.achieved_at
+    FROM test_best tb JOIN users u ON u.id = tb.user_id
+    WHERE tb.test_id = ?
+    ORDER BY tb.best_percentage DESC, tb.achieved_at
+    LIMIT ?
+"""
+
+DRAFT_ANSWERS = "SELECT attempt, submitted, answers FROM draft_answers WHERE user_id = ? AND test_id = ?"
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""Per-process cache of each test's questions and answer key.
+
+Every cached bank carries the version stamp it was loaded at. The stamp lives
+in the ``question_bank_versions`` table and is bumped by the admin routes in
+the same transaction as the change, so each worker only pays for a primary-key
+lookup per request and reloads a bank as soon as any worker edits it.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+import queries
+
+
+class QuestionBank:
+    """An immutable snapshot of one test, its questions and answer key."""
+
+    __slots__ = ('test_id', 'name', 'type', 'level', 'version',
+                 'questions', 'answer_key', 'size', 'compiled_key')
+
+    def __init__(self, test_id, name, type, level, version, questions, answer_key):
+        self.test_id = test_id
+        self.name = name
+        self.type = type
+        self.level = level
+        self.version = version
+        self.questions = questions
+        self.answer_key = answer_key
+        self.size = _estimate_size(name, questions, answer_key)
+        self.compiled_key = None # Filled in lazily by grading.compiled_key()
+
+
+def _estimate_size(name, questions, answer_key):
+    size = sys.getsizeof(name) + sys.getsizeof(questions) + sys.getsizeof(answer_key)
+    for q in questions:
+        size += sys.getsizeof(q) + sys.getsizeof(q['options'])
+        size += sum(sys.getsizeof(v) for v in q.values())
+    size += sum(sys.getsizeof(v) for v in answer_key.values())
+    return size
+
+
+def current_version(conn, test_id):
+    row = conn.execute(queries.QUESTION_BANK_VERSION, (test_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def bump_version(conn, test_id):
+    """Marks the bank of ``test_id`` as changed; call before ``commit()``."""
+    conn.execute("""
+        INSERT INTO question_bank_versions (test_id, version) VALUES (?, 1)
+        ON CONFLICT(test_id) DO UPDATE SET version = version + 1
+    """, (test_id,))
+
+
+def load_bank(conn, test_id, version):
+    test_info = conn.execute(queries.QUESTION_BANK_TEST, (test_id,)).fetchone()
+    if not test_info:
+        return None
+    rows = conn.execute(queries.QUESTION_BANK_QUESTIONS, (test_id,)).fetchall()
+    questions = []
+    answer_key = {}
+    for row in rows:
+        q = {'id': row['id'], 'text': row['text'],
+             'option1': row['option1'], 'option2': row['option2'],
+             'option3': row['option3'], 'option4': row['option4']}
+        q['options'] = [q['option1'], q['option2'], q['option3'], q['option4']]
+        questions.append(q)
+        answer_key[row['id']] = row['correct_option']
+    return QuestionBank(test_info['id'], test_info['name'], test_info['type'],
+                        test_info['level'], version, tuple(questions), answer_key)
+
+
+class QuestionCache:
+    """LRU cache of ``QuestionBank`` objects bounded by estimated memory size.
+
+    Concurrent misses for the same test are collapsed into one query: the
+    first request loads the bank while the others wait on a per-test lock.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._banks = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def _lookup(self, test_id, version):
+        with self._lock:
+            bank = self._banks.get(test_id)
+            if bank is not None and bank.version == version:
+                self._banks.move_to_end(test_id)
+                self.hits += 1
+                return bank
+        return None
+
+    def _store(self, bank):
+        with self._lock:
+            old = self._banks.pop(bank.test_id, None)
+            if old is not None:
+                self.current_bytes -= old.size
+            if bank.size > self.max_bytes:
+                return
+            self._banks[bank.test_id] = bank
+            self.current_bytes += bank.size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._banks.popitem(last=False)
+                self.current_bytes -= evicted.size
+
+    def get(self, conn, test_id):
+        """Returns the current bank for ``test_id``, or None if the test is gone."""
+        version = current_version(conn, test_id)
+        bank = self._lookup(test_id, version)
+        if bank is not None:
+            return bank
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(test_id, threading.Lock())
+        with load_lock:
+            bank = self._lookup(test_id, version)
+            if bank is not None:
+                return bank
+            with self._lock:
+                self.misses += 1
+            # The version is read before the questions, so a concurrent edit can
+            # only make this entry look older than it is, never newer.
+            bank = load_bank(conn, test_id, version)
+            if bank is None:
+                self.invalidate(test_id)
+            else:
+                self._store(bank)
+            return bank
+
+    def invalidate(self, test_id):
+        with self._lock:
+            bank = self._banks.pop(test_id, None)
+            if bank is not None:
+                self.current_bytes -= bank.size
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._banks), 'bytes': self.current_bytes,
+                    'max_bytes': self.max_bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+def get_question_cache(app=None):
+    if app is None:
+        app = current_app._get_current_object()
+    cache = app.extensions.get('question_cache')
+    if cache is None:
+        cache = app.extensions.setdefault(
+            'question_cache',
+            QuestionCache(app.config.get('QUESTION_CACHE_MAX_BYTES', 32 * 1024 * 1024)))
+    return cache
+
+
+def get_question_bank(conn, test_id):
+    return get_question_cache().get(conn, test_id)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""Bulk import and export of question banks as CSV or JSONL.
+
+Imports are validated row by row with the same rules as the
+admin.manage_questions form and inserted with ``executemany``, one
+transaction per chunk. Exports are generators that read the bank through a
+cursor and yield text a few hundred rows at a time, so a whole bank never has
+to sit in memory.
+"""
+import csv
+import io
+import itertools
+import json
+
+import question_search
+from question_cache import bump_version
+
+FIELDS = ('text', 'option1', 'option2', 'option3', 'option4', 'correct_option')
+EXPORT_FIELDS = ('id',) + FIELDS + ('stratum',)
+
+
+def validate_question(text, option1, option2, option3, option4, correct_option):
+    """Returns an error message for an invalid question, or None."""
+    if not all([text, option1, option2, option3, option4, correct_option]):
+        return 'الرجاء ملء جميع حقول السؤال.'
+    if correct_option not in [option1, option2, option3, option4]:
+        return 'الإجابة الصحيحة يجب أن تكون مطابقة تماماً لأحد الخيارات الأربعة.'
+    return None
+
+
+def guess_format(filename, default='csv'):
+    name = (filename or '').lower()
+    if name.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def read_rows(stream, file_format):
+    """Yields ``(line_number, row)`` from a text stream; ``row`` is a dict or an error string."""
+    if file_format == 'jsonl':
+        for line_number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, f'JSON غير صالح: {e}'
+                continue
+            yield line_number, row if isinstance(row, dict) else 'يجب أن يكون كل سطر كائن JSON.'
+    else:
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def _clean(row):
+    # 'question_text' is the form's field name, accept it as well as 'text'
+    if 'text' not in row and 'question_text' in row:
+        row = dict(row, text=row['question_text'])
+    return tuple(str(row.get(f) or '').strip() for f in FIELDS)
+
+
+def import_questions(conn, test_id, stream, file_format='csv', chunk_size=500, dry_run=False,
+                     duplicate_threshold=None):
+    """Validates and inserts the questions in ``stream`` into a test.
+
+    Valid rows are inserted ``chunk_size`` at a time, each chunk in its own
+    transaction that also bumps the bank version; invalid rows are skipped.
+    With a ``duplicate_threshold``, rows at least that similar to a question
+    already in the bank (see question_search) are skipped as well.
+    The caller invalidates the question cache afterwards. Returns
+    ``{'imported': n, 'errors': [(line_number, message), ...]}``.
+    """
+    summary = {'imported': 0, 'errors': []}
+    rows = read_rows(stream, file_format)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+        valid = []
+        for line_number, row in chunk:
+            if isinstance(row, str):
+                summary['errors'].append((line_number, row))
+                continue
+            values = _clean(row)
+            error = validate_question(*values)
+            if not error and duplicate_threshold is not None:
+                duplicates = question_search.find_duplicates(conn, values[0], duplicate_threshold, limit=1)
+                if duplicates:
+                    error = f"سؤال مكرر، يشبه السؤال رقم {duplicates[0]['id']} في \"{duplicates[0]['test_name']}\"."
+            if error:
+                summary['errors'].append((line_number, error))
+            else: # An optional 'stratum' column groups questions for pool sampling
+                valid.append((test_id,) + values + (str(row.get('stratum') or '').strip() or None,))
+        if valid and not dry_run:
+            try:
+                conn.executemany("""
+                    INSERT INTO questions (test_id, text, option1, option2, option3, option4, correct_option, stratum)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, valid)
+                bump_version(conn, test_id)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        summary['imported'] += len(valid)
+    return summary
+
+
+def export_questions(conn, test_id, file_format='csv', chunk_size=500):
+    """Yields a test's questions as CSV or JSONL text, ``chunk_size`` rows at a time."""
+    cursor = conn.execute("""
+        SELECT id, text, option1, option2, option3, option4, correct_option, stratum
+        FROM questions WHERE test_id = ? ORDER BY id
+    """, (test_id,))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if file_format == 'csv' else None
+    if writer:
+        writer.writerow(EXPORT_FIELDS)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        for row in rows:
+            if writer:
+                writer.writerow(tuple(row))
+            else:
+                buffer.write(json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + '\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell(): # CSV header of an empty bank
+        yield buffer.getvalue()
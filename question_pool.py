@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""Tests backed by a large question pool, sampled per attempt.
+
+A test with ``tests.sample_size`` set serves each attempt a random subset of
+that many questions instead of the whole bank. Each worker keeps an index of
+the pool's question ids, grouped by ``questions.stratum`` and stamped with
+the bank version, so sampling costs O(K) and never loads question text. The
+ids served are recorded in ``attempts``; take_test shows exactly those
+questions and submit_test grades exactly them, fetching only their K rows.
+"""
+import json
+import random
+import threading
+
+from flask import current_app
+
+import queries
+from question_cache import QuestionBank, current_version
+
+_random = random.SystemRandom()
+
+
+class PoolIndex:
+    """The question ids of one test's pool, grouped by stratum."""
+
+    __slots__ = ('test_id', 'version', 'strata', 'size')
+
+    def __init__(self, test_id, version, strata):
+        self.test_id = test_id
+        self.version = version
+        self.strata = strata
+        self.size = sum(len(ids) for ids in strata.values())
+
+
+def load_pool_index(conn, test_id, version):
+    strata = {}
+    for row in conn.execute(queries.POOL_INDEX, (test_id,)):
+        strata.setdefault(row[0], []).append(row[1])
+    return PoolIndex(test_id, version, {stratum: tuple(ids) for stratum, ids in strata.items()})
+
+
+class PoolIndexCache:
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get(self, conn, test_id):
+        version = current_version(conn, test_id)
+        with self._lock:
+            index = self._indexes.get(test_id)
+        if index is None or index.version != version:
+            index = load_pool_index(conn, test_id, version)
+            with self._lock:
+                self._indexes[test_id] = index
+        return index
+
+    def invalidate(self, test_id):
+        with self._lock:
+            self._indexes.pop(test_id, None)
+
+
+def get_pool_index_cache(app=None):
+    if app is None:
+        app = current_app._get_current_object()
+    cache = app.extensions.get('question_pools')
+    if cache is None:
+        cache = app.extensions.setdefault('question_pools', PoolIndexCache())
+    return cache
+
+
+def allocate(strata_sizes, k):
+    """Splits ``k`` across strata in proportion to their size (largest remainder)."""
+    if k <= 0:
+        return {}
+    total = sum(strata_sizes.values())
+    if k >= total:
+        return dict(strata_sizes)
+    quotas = {s: k * n / total for s, n in strata_sizes.items()}
+    counts = {s: int(q) for s, q in quotas.items()}
+    leftover = k - sum(counts.values())
+    for s in sorted(quotas, key=lambda s: quotas[s] - counts[s], reverse=True)[:leftover]:
+        counts[s] += 1
+    return counts
+
+
+def sample_ids(index, k, rng=_random):
+    """Draws ``k`` distinct question ids, stratified when the pool has strata.
+
+    ``random.sample`` over a tuple picks by index, so the cost grows with
+    ``k`` rather than with the pool size. ``k`` <= 0 draws nothing.
+    """
+    counts = allocate({s: len(ids) for s, ids in index.strata.items()}, k)
+    sampled = []
+    for stratum, n in counts.items():
+        sampled.extend(rng.sample(index.strata[stratum], n))
+    rng.shuffle(sampled)
+    return sampled
+
+
+def fetch_questions(conn, test_id, question_ids):
+    """Loads only the given questions, in the given order, as ``(questions, answer_key)``."""
+    rows = conn.execute(queries.ATTEMPT_QUESTIONS, (json.dumps(question_ids), test_id)).fetchall()
+    by_id = {row['id']: row for row in rows}
+    questions, answer_key = [], {}
+    for qid in question_ids:
+        row = by_id.get(qid)
+        if row is None: # Deleted since the attempt started
+            continue
+        q = {'id': row['id'], 'text': row['text'],
+             'option1': row['option1'], 'option2': row['option2'],
+             'option3': row['option3'], 'option4': row['option4']}
+        q['options'] = [q['option1'], q['option2'], q['option3'], q['option4']]
+        questions.append(q)
+        answer_key[row['id']] = row['correct_option']
+    return tuple(questions), answer_key
+
+
+def attempt_bank(conn, test, question_ids):
+    """A transient ``QuestionBank`` holding just the questions of one attempt."""
+    questions, answer_key = fetch_questions(conn, test['id'], question_ids)
+    return QuestionBank(test['id'], test['name'], test['type'], test['level'],
+                        current_version(conn, test['id']), questions, answer_key)
+
+
+def start_attempt(conn, user_id, test, timestamp):
+    """Returns ``(attempt_id, bank)`` for the user's open attempt, sampling a new one if needed.
+
+    Reloading the test page returns the same questions rather than a fresh
+    draw; an adaptive attempt left open before the test's mode changed is
+    not resumed. Returns ``(None, None)`` without opening an attempt when the draw
+    is empty (an empty pool, or a sample size below 1). The caller commits.
+    """
+    row = conn.execute(queries.OPEN_POOLED_ATTEMPT, (user_id, test['id'])).fetchone()
+    if row:
+        return row['id'], attempt_bank(conn, test, json.loads(row['question_ids']))
+    index = get_pool_index_cache().get(conn, test['id'])
+    question_ids = sample_ids(index, test['sample_size'])
+    if not question_ids:
+        return None, None
+    cursor = conn.execute(
+        "INSERT INTO attempts (user_id, test_id, question_ids, started_at) VALUES (?, ?, ?, ?)",
+        (user_id, test['id'], json.dumps(question_ids), timestamp))
+    return cursor.lastrowid, attempt_bank(conn, test, question_ids)
+
+
+def claim_attempt(conn, attempt_id, user_id, test, timestamp):
+    """Marks an open attempt as submitted and returns its bank, or None.
+
+    Returns None when the attempt does not exist, belongs to someone else or
+    another test, or was already submitted. The caller commits.
+    """
+    row = conn.execute(queries.ATTEMPT_OWNER, (attempt_id, user_id, test['id'])).fetchone()
+    if not row:
+        return None
+    claimed = conn.execute(queries.CLAIM_ATTEMPT, (timestamp, attempt_id)).rowcount
+    if not claimed:
+        return None
+    return attempt_bank(conn, test, json.loads(row['question_ids']))
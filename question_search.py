@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""Full-text search over the question bank and near-duplicate detection.
+
+``questions_fts`` is a contentless FTS5 index of each question's text and
+options, and ``question_shingles`` maps the hashes in each question's sketch
+to the question. Triggers on ``questions`` keep both in sync, so every insert
+path (the admin form, bulk imports, seeding) is covered. The triggers call
+two SQL functions defined here, which every pooled connection registers
+(``register_functions``); a connection without them cannot write questions.
+
+Text is normalized before it is indexed or searched: Arabic diacritics and
+tatweel are removed, alef, yaa, taa marbuta and hamza-seat variants are
+folded to one letter, Arabic-Indic digits become ASCII, and Latin letters
+are case-folded. Changing ``normalize`` or the sketch parameters means
+running ``flask rebuild-search-index``, since the contentless index deletes
+rows by re-normalizing their old values.
+
+Near duplicates are found with bottom-k sketches: the ``SKETCH_SIZE``
+smallest 64-bit hashes of a text's character shingles. Questions sharing
+enough sketch hashes with a new text are candidates; their exact shingle
+Jaccard similarity decides.
+"""
+import hashlib
+import json
+import re
+
+SHINGLE_SIZE = 4  # Characters per shingle
+SKETCH_SIZE = 16  # Hashes kept per question
+
+_DIACRITICS = [*range(0x0610, 0x061B), *range(0x064B, 0x0660), 0x0670, *range(0x06D6, 0x06EE), 0x0640]
+_FOLD = str.maketrans({
+    **{code: None for code in _DIACRITICS},
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي', 'ؤ': 'و', 'ة': 'ه',
+    **{chr(0x0660 + d): str(d) for d in range(10)},
+    **{chr(0x06F0 + d): str(d) for d in range(10)},
+})
+_WORD = re.compile(r'\w+')
+_SPACE = re.compile(r'\s+')
+
+
+def normalize(text):
+    """Folds Arabic spelling variants and drops diacritics, for indexing and queries alike."""
+    if text is None:
+        return None
+    return _SPACE.sub(' ', str(text).translate(_FOLD).casefold()).strip()
+
+
+def shingles(text):
+    """The set of ``SHINGLE_SIZE``-character shingles of the normalized text."""
+    text = normalize(text) or ''
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def _hash(shingle):
+    return int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+
+def sketch(text):
+    """The bottom-k sketch of a text: its ``SKETCH_SIZE`` smallest shingle hashes."""
+    return sorted(_hash(s) for s in shingles(text))[:SKETCH_SIZE]
+
+
+def _sketch_json(text):
+    return json.dumps(sketch(text))
+
+
+def register_functions(conn):
+    """Defines the SQL functions the ``questions`` triggers call."""
+    conn.create_function('normalize_arabic', 1, normalize, deterministic=True)
+    conn.create_function('question_sketch', 1, _sketch_json, deterministic=True)
+
+
+def similarity(a, b):
+    """Jaccard similarity of two texts' shingle sets."""
+    a, b = shingles(a), shingles(b)
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def match_query(text):
+    """Builds an FTS5 query matching every word of ``text``, the last one as a prefix.
+
+    Returns None when ``text`` has no words.
+    """
+    words = _WORD.findall(normalize(text) or '')
+    if not words:
+        return None
+    return ' '.join(f'"{word}"' for word in words) + '*'
+
+
+def search(conn, text, test_id=None, limit=50):
+    """Returns the best-matching questions for ``text`` as dicts, by BM25 rank."""
+    query = match_query(text)
+    if query is None:
+        return []
+    where = "AND q.test_id = ?" if test_id is not None else ""
+    params = (query,) + ((test_id,) if test_id is not None else ()) + (limit,)
+    return [dict(row) for row in conn.execute(f"""
+        SELECT q.id, q.test_id, t.name AS test_name, q.text, q.correct_option
+        FROM questions_fts f
+        JOIN questions q ON q.id = f.rowid
+        JOIN tests t ON t.id = q.test_id
+        WHERE questions_fts MATCH ? {where}
+        ORDER BY f.rank
+        LIMIT ?
+    """, params)]
+
+
+def find_duplicates(conn, text, threshold=0.8, exclude_id=None, limit=5):
+    """Returns existing questions whose text is at least ``threshold`` similar to ``text``.
+
+    Each match is a dict with the question, its test and ``similarity``,
+    most similar first.
+    """
+    hashes = sketch(text)
+    if not hashes:
+        return []
+    # Texts this similar share most of their sketch; fewer shared hashes are not worth checking
+    min_shared = max(1, min(len(hashes), int(SKETCH_SIZE * threshold / 2)))
+    candidates = conn.execute("""
+        SELECT q.id, q.test_id, t.name AS test_name, q.text, q.correct_option
+        FROM (SELECT question_id FROM question_shingles
+              WHERE hash IN (SELECT value FROM json_each(?))
+              GROUP BY question_id HAVING COUNT(*) >= ?
+              ORDER BY COUNT(*) DESC LIMIT 50) c
+        JOIN questions q ON q.id = c.question_id
+        JOIN tests t ON t.id = q.test_id
+    """, (json.dumps(hashes), min_shared)).fetchall()
+    matches = []
+    for row in candidates:
+        if row['id'] == exclude_id:
+            continue
+        score = similarity(text, row['text'])
+        if score >= threshold:
+            matches.append(dict(row, similarity=round(score, 2)))
+    matches.sort(key=lambda m: -m['similarity'])
+    return matches[:limit]
+
+
+def rebuild_index(conn):
+    """Rebuilds ``questions_fts`` and ``question_shingles`` from ``questions``.
+
+    Returns the number of questions indexed; the caller commits.
+    """
+    conn.execute("INSERT INTO questions_fts (questions_fts) VALUES ('delete-all')")
+    conn.execute("DELETE FROM question_shingles")
+    cursor = conn.execute("""
+        INSERT INTO questions_fts (rowid, text, options)
+        SELECT id, normalize_arabic(text),
+               normalize_arabic(option1 || ' ' || option2 || ' ' || option3 || ' ' || option4)
+        FROM questions
+    """)
+    conn.execute("""
+        INSERT OR IGNORE INTO question_shingles (hash, question_id)
+        SELECT s.value, q.id FROM questions q, json_each(question_sketch(q.text)) s
+    """)
+    return cursor.rowcount
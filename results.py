@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Recording graded attempts and the per-user progress and leaderboards derived from them."""
+from leaderboard import record_scores
+
+_INSERT_RESULT = """
+    INSERT INTO test_results (user_id, test_id, score, total_questions, percentage, timestamp,
+                              answers, answers_fingerprint, attempt_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_UPSERT_PROGRESS = """
+    INSERT INTO user_progress (user_id, type, max_level, attempts, best_percentage, last_attempt)
+    VALUES (?, ?, ?, 1, ?, ?)
+    ON CONFLICT(user_id, type) DO UPDATE SET
+        max_level = MAX(max_level, excluded.max_level),
+        attempts = attempts + 1,
+        best_percentage = MAX(best_percentage, excluded.best_percentage),
+        last_attempt = MAX(last_attempt, excluded.last_attempt)
+"""
+
+
+def record_result(conn, user_id, bank, score, total_questions, percentage, timestamp, sheet=None,
+                  attempt_id=None, responses=True):
+    """Inserts a test result and updates the user's progress row.
+
+    ``sheet``, the answer sheet encoded against the bank's compiled key, is
+    stored packed with the result, stored per question and added to the item
+    statistics when given; with ``responses=False`` the last two steps are
+    left to the caller, to be done for a whole batch. All statements run in
+    the caller's transaction; the caller commits. Returns the id of the new
+    ``test_results`` row. ``attempt_id`` links a pooled test's result to
+    the attempt that recorded which questions were served.
+    """
+    cursor = conn.execute(_INSERT_RESULT, (user_id, bank.test_id, score, total_questions, percentage, timestamp)
+                          + _packed(bank, sheet) + (attempt_id,))
+    conn.execute(_UPSERT_PROGRESS, (user_id, bank.type, bank.level, percentage, timestamp))
+    record_scores(conn, bank.test_id, [(user_id, percentage, timestamp)])
+    if sheet is not None and responses:
+        from item_analysis import record_responses  # numpy, loaded on first use
+        record_responses(conn, bank.compiled_key, [cursor.lastrowid], [sheet], [score])
+    return cursor.lastrowid
+
+
+def record_results(conn, bank, rows, timestamp, sheets=None):
+    """Bulk version of ``record_result`` for ``(user_id, score, total_questions, percentage)`` rows.
+
+    ``sheets``, if given, holds the encoded answer sheet of each row.
+    """
+    params = [(user_id, bank.test_id, score, total, pct, timestamp) for user_id, score, total, pct in rows]
+    if sheets is None:
+        conn.executemany(_INSERT_RESULT, [p + (None, None, None) for p in params])
+    else: # The responses need each result's id
+        result_ids = [conn.execute(_INSERT_RESULT, p + _packed(bank, sheet) + (None,)).lastrowid
+                      for p, sheet in zip(params, sheets)]
+        from item_analysis import record_responses
+        record_responses(conn, bank.compiled_key, result_ids, sheets, [score for _, score, _, _ in rows])
+    conn.executemany(_UPSERT_PROGRESS, [(user_id, bank.type, bank.level, pct, timestamp)
+                                        for user_id, _, _, pct in rows])
+    record_scores(conn, bank.test_id, [(user_id, pct, timestamp) for user_id, _, _, pct in rows])
+
+
+def _packed(bank, sheet):
+    """The ``(answers, answers_fingerprint)`` columns for a result."""
+    if sheet is None:
+        return (None, None)
+    from grading import pack_sheet # grading imports this module
+    return (pack_sheet(sheet), bank.compiled_key.fingerprint)
+
+
+def rebuild_progress(conn, test_type=None):
+    """Recomputes ``user_progress`` from all results, archived ones included (optionally for one type).
+
+    Returns the number of progress rows written; the caller commits.
+    """
+    where = "WHERE t.type = ?" if test_type else ""
+    params = (test_type,) if test_type else ()
+    conn.execute(f"DELETE FROM user_progress {'WHERE type = ?' if test_type else ''}", params)
+    cursor = conn.execute(f"""
+        INSERT INTO user_progress (user_id, type, max_level, attempts, best_percentage, last_attempt)
+        SELECT tr.user_id, t.type, MAX(t.level), COUNT(*), MAX(tr.percentage), MAX(tr.timestamp)
+        FROM all_test_results tr JOIN tests t ON tr.test_id = t.id
+        {where}
+        GROUP BY tr.user_id, t.type
+    """, params)
+    return cursor.rowcount
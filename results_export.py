@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""Bulk export of test results joined with users and tests.
+
+Exports run on a small dedicated connection pool, so a long download never
+holds one of the request connections. Each export reads inside a single
+deferred read transaction: in WAL mode that pins a consistent snapshot
+without taking a lock that would block ``submit_test`` writers. Rows are
+pulled with ``fetchmany`` and written out chunk by chunk, so memory stays
+bounded whatever the number of results.
+"""
+import csv
+import io
+import os
+import threading
+from datetime import date, timedelta
+
+from flask import current_app
+
+from db import ConnectionPool
+
+COLUMNS = ('result_id', 'user_id', 'username', 'test_id', 'test_name', 'test_type', 'test_level',
+           'score', 'total_questions', 'percentage', 'timestamp')
+
+_export_pool_lock = threading.Lock()
+
+
+class ExportFilters:
+    def __init__(self, test_id=None, test_type=None, level=None, date_from=None, date_to=None):
+        self.test_id = test_id
+        self.test_type = test_type or None
+        self.level = level
+        self.date_from = date_from
+        self.date_to = date_to
+
+    @classmethod
+    def from_args(cls, args):
+        """Builds filters from a query string; raises ValueError on bad values."""
+        def optional(name, convert):
+            value = (args.get(name) or '').strip()
+            return convert(value) if value else None
+        return cls(test_id=optional('test_id', int),
+                   test_type=optional('test_type', str),
+                   level=optional('level', int),
+                   date_from=optional('date_from', date.fromisoformat),
+                   date_to=optional('date_to', date.fromisoformat))
+
+    def where(self):
+        clauses, params = [], []
+        if self.test_id is not None:
+            clauses.append("tr.test_id = ?")
+            params.append(self.test_id)
+        if self.test_type is not None:
+            clauses.append("t.type = ?")
+            params.append(self.test_type)
+        if self.level is not None:
+            clauses.append("t.level = ?")
+            params.append(self.level)
+        # Timestamps are stored as 'YYYY-MM-DD HH:MM:SS[.ffffff]' text, so
+        # whole-day bounds compare correctly as strings; date_to is inclusive.
+        if self.date_from is not None:
+            clauses.append("tr.timestamp >= ?")
+            params.append(self.date_from.isoformat())
+        if self.date_to is not None:
+            clauses.append("tr.timestamp < ?")
+            params.append((self.date_to + timedelta(days=1)).isoformat())
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+
+def iter_result_chunks(conn, filters, chunk_size=5000):
+    """Yields lists of result rows (tuples in ``COLUMNS`` order) from one snapshot.
+
+    The read transaction ends when the rows run out. An export abandoned
+    half-way leaves it open; returning ``conn`` to its pool rolls it back.
+    """
+    where, params = filters.where()
+    conn.execute("BEGIN") # Deferred: the first SELECT pins the snapshot
+    cursor = conn.execute(f"""
+        SELECT tr.id, tr.user_id, u.username, tr.test_id, t.name, t.type, t.level,
+               tr.score, tr.total_questions, tr.percentage, tr.timestamp
+        FROM all_test_results tr
+        JOIN users u ON u.id = tr.user_id
+        JOIN tests t ON t.id = tr.test_id
+        {where}
+        ORDER BY tr.id
+    """, params)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield [tuple(row) for row in rows]
+    conn.rollback()
+
+
+def csv_chunks(chunks):
+    """Turns row chunks into CSV text, one string per chunk after the header."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    yield buffer.getvalue()
+    for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+def write_parquet(chunks, sink):
+    """Writes row chunks to ``sink`` as Parquet, one row group per chunk.
+
+    Needs pyarrow, which is imported here so the app does not pay for it at
+    start-up; raises RuntimeError if it is not installed.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError('Parquet export needs pyarrow (pip install pyarrow).')
+    schema = pa.schema([
+        ('result_id', pa.int64()), ('user_id', pa.int64()), ('username', pa.string()),
+        ('test_id', pa.int64()), ('test_name', pa.string()), ('test_type', pa.string()),
+        ('test_level', pa.int32()), ('score', pa.int32()), ('total_questions', pa.int32()),
+        ('percentage', pa.int32()), ('timestamp', pa.string()),
+    ])
+    count = 0
+    with pq.ParquetWriter(sink, schema, compression='zstd',
+                          use_dictionary=['username', 'test_name', 'test_type']) as writer:
+        for rows in chunks:
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema))
+            count += len(rows)
+    return count
+
+
+def get_export_pool(app=None):
+    """Returns the export pool; its size caps how many exports run at once."""
+    if app is None:
+        app = current_app._get_current_object()
+    pool = app.extensions.get('export_pool')
+    if pool is None or pool.pid != os.getpid():
+        with _export_pool_lock:
+            pool = app.extensions.get('export_pool')
+            if pool is None or pool.pid != os.getpid():
+                config = dict(app.config, DB_POOL_SIZE=app.config.get('RESULTS_EXPORT_CONCURRENCY', 2),
+                              DB_POOL_TIMEOUT=0.5, METRICS_ENABLED=False)
+                pool = ConnectionPool.from_config(config)
+                app.extensions['export_pool'] = pool
+    return pool
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""Optional write-behind queue for graded test results.
+
+With ``RESULTS_WRITE_BEHIND`` enabled, submit_test hands each result to an
+in-process queue and returns immediately. A background thread drains the
+queue and commits the results in group transactions of up to
+``RESULTS_BATCH_SIZE`` rows, waiting at most ``RESULTS_BATCH_DELAY_MS`` for a
+batch to fill, so a burst of submissions pays for one fsync per batch instead
+of one per student. The queue is flushed on interpreter exit.
+
+Results in the queue have already been shown to their students, so the
+thread must outlive any error: a batch that fails is retried row by row,
+and a row that still fails is logged and counted in ``failed``.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from flask import current_app
+
+from db import ConnectionPool
+from results import record_result
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+_writer_lock = threading.Lock()
+
+
+class ResultWriter:
+    """Background thread that commits queued results in batches."""
+
+    def __init__(self, pool, batch_size=200, max_delay_ms=5, queue_size=10000):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.max_delay = max_delay_ms / 1000
+        self.pid = os.getpid()
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name='result-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, user_id, bank, score, total_questions, percentage, timestamp, sheet=None,
+               attempt_id=None):
+        """Queues a result; returns False if the queue is full or closed."""
+        if not self._thread.is_alive():
+            return False
+        try:
+            self._queue.put_nowait((user_id, bank, score, total_questions, percentage, timestamp, sheet,
+                                    attempt_id))
+        except queue.Full:
+            return False
+        return True
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def flush(self):
+        """Blocks until everything queued so far has been committed."""
+        self._queue.join()
+
+    def close(self):
+        """Stops the thread after committing everything still queued."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self.pool.close()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                self._write(batch)
+            except Exception: # E.g. no connection available; keep the thread alive for the next batch
+                self.failed += len(batch)
+                logger.exception("Dropped a batch of %d results", len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        with self.pool.connection() as conn:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                responses = {} # compiled key -> (key, result_ids, sheets, scores)
+                for item in batch:
+                    result_id = record_result(conn, *item, responses=False)
+                    sheet = item[6]
+                    if sheet is not None:
+                        bank, score = item[1], item[2]
+                        entry = responses.setdefault(bank.compiled_key, (bank.compiled_key, [], [], []))
+                        entry[1].append(result_id)
+                        entry[2].append(sheet)
+                        entry[3].append(score)
+                # One statistics upsert per question for the whole batch
+                from item_analysis import record_responses  # numpy, loaded on first use
+                for key, result_ids, sheets, scores in responses.values():
+                    record_responses(conn, key, result_ids, sheets, scores)
+                conn.commit()
+                self.batches += 1
+                self.written += len(batch)
+                return
+            except Exception as e: # Not only sqlite3.Error: grading data can fail in numpy too
+                conn.rollback()
+                logger.warning("Error writing batch of %d results, retrying one by one: %s", len(batch), e)
+            # Isolate the rows that fail (e.g. the user was deleted meanwhile)
+            for item in batch:
+                try:
+                    record_result(conn, *item)
+                    conn.commit()
+                    self.written += 1
+                except Exception:
+                    conn.rollback()
+                    self.failed += 1
+                    logger.exception("Dropped result for user %s on test %s", item[0], item[1].test_id)
+
+
+def get_result_writer(app=None):
+    """Returns this process's writer, or None when write-behind is disabled."""
+    if app is None:
+        app = current_app._get_current_object()
+    if not app.config.get('RESULTS_WRITE_BEHIND'):
+        return None
+    writer = app.extensions.get('result_writer')
+    if writer is None or writer.pid != os.getpid():
+        with _writer_lock:
+            writer = app.extensions.get('result_writer')
+            if writer is None or writer.pid != os.getpid():
+                # A dedicated connection with a full fsync per commit: batches
+                # are durable once committed, and there is only one per batch.
+                config = dict(app.config, DB_POOL_SIZE=1, DB_SYNCHRONOUS='FULL')
+                writer = ResultWriter(
+                    ConnectionPool.from_config(config),
+                    batch_size=app.config.get('RESULTS_BATCH_SIZE', 200),
+                    max_delay_ms=app.config.get('RESULTS_BATCH_DELAY_MS', 5),
+                    queue_size=app.config.get('RESULTS_QUEUE_SIZE', 10000),
+                )
+                app.extensions['result_writer'] = writer
+                atexit.register(writer.close)
+    return writer
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Fixtures: an application on a freshly migrated database in a temp dir."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from commands import init_db  # noqa: E402
+from db import get_db  # noqa: E402
+
+
+@pytest.fixture
+def app_config():
+    """Settings on top of the test defaults; override in a module to change them."""
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, app_config):
+    app = create_app({
+        'TESTING': True,
+        'DATABASE': str(tmp_path / 'test.db'),
+        'JINJA_BYTECODE_CACHE_DIR': None,
+        'AUTOSAVE_FLUSH_MS': None,
+        'ADMISSION_ENABLED': False,
+        'METRICS_ENABLED': False,
+        **app_config,
+    })
+    with app.app_context():
+        init_db()
+    yield app
+    buffer = app.extensions.get('autosave')
+    if buffer is not None:
+        buffer.close()
+
+
+@pytest.fixture
+def conn(app):
+    with app.app_context():
+        yield get_db()
+
+
+def add_test(conn, correct_options, name='اختبار'):
+    """Adds a test with one question per entry of ``correct_options``; returns its id."""
+    test_id = conn.execute("INSERT INTO tests (name, type, level) VALUES (?, 'قياس', 9)",
+                           (name,)).lastrowid
+    conn.executemany("""
+        INSERT INTO questions (test_id, text, option1, option2, option3, option4, correct_option)
+        VALUES (?, ?, 'أ', 'ب', 'ج', 'د', ?)
+    """, [(test_id, f'سؤال {i}', option) for i, option in enumerate(correct_options)])
+    conn.commit()
+    return test_id
+
+
+def add_user(conn, username):
+    user_id = conn.execute("INSERT INTO users (username, email, password_hash) VALUES (?, ?, 'x')",
+                           (username, f'{username}@example.com')).lastrowid
+    conn.commit()
+    return user_id
+
+
+def question_ids(conn, test_id):
+    return [row['id'] for row in conn.execute(
+        "SELECT id FROM questions WHERE test_id = ? ORDER BY id", (test_id,))]
+
+
+
+def login(client, user_id, username):
+    """Starts a session for ``username`` without going through the login form."""
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['username'] = username
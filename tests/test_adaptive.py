@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+
+import adaptive
+import question_pool
+from conftest import add_test, add_user, login
+
+
+def test_adaptive_attempt_does_not_load_a_pooled_one(app, conn):
+    test_id = add_test(conn, ['أ', 'ب', 'ج', 'د'])
+    user_id = add_user(conn, 'student')
+    conn.execute("UPDATE tests SET sample_size = 2 WHERE id = ?", (test_id,))
+    test = conn.execute("SELECT * FROM tests WHERE id = ?", (test_id,)).fetchone()
+    pooled_id, _ = question_pool.start_attempt(conn, user_id, test, datetime.now())
+    conn.execute("UPDATE tests SET mode = 'adaptive' WHERE id = ?", (test_id,))
+    conn.commit()
+
+    assert adaptive.load_attempt(conn, pooled_id, user_id, test_id) is None
+    attempt = adaptive.open_attempt(conn, user_id, test_id, datetime.now())
+    assert attempt.id != pooled_id
+    assert adaptive.load_attempt(conn, attempt.id, user_id, test_id).question_ids == attempt.question_ids
+
+
+def test_answering_with_a_pooled_attempt_is_rejected(app, conn):
+    test_id = add_test(conn, ['أ', 'ب', 'ج'])
+    user_id = add_user(conn, 'student')
+    conn.execute("UPDATE tests SET sample_size = 2 WHERE id = ?", (test_id,))
+    test = conn.execute("SELECT * FROM tests WHERE id = ?", (test_id,)).fetchone()
+    pooled_id, bank = question_pool.start_attempt(conn, user_id, test, datetime.now())
+    conn.execute("UPDATE tests SET mode = 'adaptive' WHERE id = ?", (test_id,))
+    conn.commit()
+
+    client = app.test_client()
+    login(client, user_id, 'student')
+    question_id = bank.questions[0]['id']
+    client.post(f'/submit/{test_id}', data={'attempt_id': pooled_id, 'question_id': question_id,
+                                            f'question_{question_id}': 'أ'})
+    row = conn.execute("SELECT responses, submitted_at FROM attempts WHERE id = ?", (pooled_id,)).fetchone()
+    assert tuple(row) == (None, None)
+    assert conn.execute("SELECT COUNT(*) FROM test_results WHERE test_id = ?", (test_id,)).fetchone()[0] == 0
+
+
+def test_attempt_moves_past_a_deleted_question(app, conn):
+    test_id = add_test(conn, ['أ', 'ب', 'ج'])
+    user_id = add_user(conn, 'student')
+    conn.execute("UPDATE tests SET mode = 'adaptive' WHERE id = ?", (test_id,))
+    conn.commit()
+    attempt = adaptive.open_attempt(conn, user_id, test_id, datetime.now())
+    conn.commit()
+
+    client = app.test_client()
+    login(client, add_user(conn, 'admin'), 'admin')
+    client.get(f'/admin/delete-question/{attempt.current_question}/{test_id}')
+    moved = adaptive.open_attempt(conn, user_id, test_id, datetime.now())
+    assert moved.id == attempt.id
+    assert moved.current_question not in (None, attempt.current_question)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+import admission
+from conftest import add_test, add_user, login
+
+
+def test_token_bucket_allows_a_burst_then_the_rate():
+    bucket = admission.TokenBucket(rate=10, burst=2)
+    assert bucket.take() == 0 and bucket.take() == 0
+    wait = bucket.take()
+    assert 0 < wait <= 0.1
+    assert bucket.take() == pytest.approx(wait, abs=0.01) # A refused take spends nothing
+    bucket.charge()
+    assert bucket.tokens < 0
+
+
+def test_gate_sheds_beyond_concurrency_and_queue():
+    gate = admission.Gate(concurrency=1, queue=0)
+    assert gate.acquire() == (None, 0)
+    assert gate.acquire() == ('queue_full', 0.0)
+    gate.release()
+    assert gate.active == 0
+    assert gate.acquire() == (None, 0)
+
+
+def wait_in_queue(gate, key, results):
+    thread = threading.Thread(target=lambda: results.append(gate.acquire(key)))
+    thread.start()
+    while gate.waiting == 0 and thread.is_alive():
+        time.sleep(0.001)
+    return thread
+
+
+def test_release_hands_the_slot_to_the_longest_waiter():
+    gate = admission.Gate(concurrency=1, queue=2, max_wait=5)
+    assert gate.acquire('a') == (None, 0)
+    results = []
+    thread = wait_in_queue(gate, 'b', results)
+    assert gate.acquire('b') == ('duplicate', 0.0) # The same student reloading
+    gate.release()
+    thread.join()
+    assert results[0][0] is None and results[0][1] > 0
+    assert gate.active == 1 and gate.waiting == 0
+
+
+def test_waiter_is_shed_after_max_wait():
+    gate = admission.Gate(concurrency=1, queue=1, max_wait=0.02)
+    gate.acquire()
+    assert gate.acquire('b') == ('timeout', 0.0)
+    assert gate.waiting == 0
+    assert gate.acquire('b') == ('timeout', 0.0) # The key is free to queue again
+
+
+def test_only_admitted_requests_spend_rate_tokens():
+    gate = admission.Gate(concurrency=1, queue=0, rate=1, burst=1)
+    assert gate.acquire() == (None, 0)
+    assert gate.acquire()[0] == 'queue_full'
+    gate.release()
+    assert gate.bucket.tokens == pytest.approx(0, abs=0.01)
+    reason, wait = gate.acquire()
+    assert reason == 'rate' and 0 < wait <= 1
+
+
+def test_queued_request_is_charged_when_let_in():
+    gate = admission.Gate(concurrency=1, queue=1, max_wait=5, rate=100, burst=1)
+    gate.acquire('a')
+    results = []
+    thread = wait_in_queue(gate, 'b', results)
+    gate.release()
+    thread.join()
+    assert results[0][0] is None
+    assert gate.bucket.tokens < 0
+
+
+@pytest.fixture
+def closed_gates(app):
+    """Every limited route sheds every request."""
+    app.config.update(ADMISSION_ENABLED=True, ADMISSION_RETRY_AFTER=2, ADMISSION_MAX_RETRY_AFTER=3,
+                      ADMISSION_LIMITS={'take_test': {'concurrency': 0}, 'submit_test': {'concurrency': 0}})
+    app.extensions.pop('admission', None)
+    yield
+    app.extensions.pop('admission', None)
+
+
+def test_shed_submission_page_reposts_the_answers(app, conn, closed_gates):
+    test_id = add_test(conn, ['أ'])
+    client = app.test_client()
+    login(client, add_user(conn, 'student'), 'student')
+    response = client.post(f'/submit/{test_id}', data={'question_1': 'أ'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] in ('2', '3')
+    assert response.headers['Cache-Control'] == 'no-store'
+    body = response.get_data(as_text=True)
+    assert f'action="/submit/{test_id}"' in body
+    assert 'name="question_1" value="أ"' in body
+    assert conn.execute("SELECT COUNT(*) FROM test_results").fetchone()[0] == 0
+
+
+def test_shed_api_request_gets_json(app, conn, closed_gates):
+    test_id = add_test(conn, ['أ'])
+    client = app.test_client()
+    login(client, add_user(conn, 'student'), 'student')
+    response = client.get(f'/api/v1/tests/{test_id}')
+    assert response.status_code == 503
+    assert response.get_json() == {'error': 'busy', 'retry_after': int(response.headers['Retry-After'])}
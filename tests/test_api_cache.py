@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+
+import pytest
+
+import http_cache
+from api import routes
+from conftest import add_test, add_user, login
+from question_cache import bump_version
+
+
+@pytest.fixture
+def student(app, conn):
+    client = app.test_client()
+    user_id = add_user(conn, 'student')
+    login(client, user_id, 'student')
+    return client
+
+
+def test_unchanged_dashboard_is_a_304(student):
+    first = student.get('/api/v1/dashboard')
+    assert first.status_code == 200 and first.headers['ETag']
+    again = student.get('/api/v1/dashboard', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.get_data() == b''
+
+
+def test_a_recorded_result_invalidates_the_dashboard(student, conn):
+    test_id = add_test(conn, ['أ'])
+    before = student.get('/api/v1/dashboard')
+    student.post(f'/api/v1/tests/{test_id}/submit', json={'answers': {}})
+    after = student.get('/api/v1/dashboard', headers={'If-None-Match': before.headers['ETag']})
+    assert after.status_code == 200
+    assert len(after.get_json()['history']) == len(before.get_json()['history']) + 1
+
+
+def test_other_changes_show_once_the_cache_period_ends(app, student, conn, monkeypatch):
+    now = [1000.0 * app.config['API_CACHE_SECONDS']]
+    monkeypatch.setattr(routes, 'time', SimpleNamespace(time=lambda: now[0]))
+    before = student.get('/api/v1/dashboard').get_json()
+    add_test(conn, ['أ'], name='اختبار جديد')
+    conn.execute("UPDATE tests SET level = 1 WHERE name = 'اختبار جديد'") # Unlocked for everyone
+    conn.commit()
+    assert student.get('/api/v1/dashboard').get_json() == before
+    now[0] += app.config['API_CACHE_SECONDS']
+    names = [test['name'] for test in student.get('/api/v1/dashboard').get_json()['tests']]
+    assert 'اختبار جديد' in names
+
+
+def test_a_bank_change_invalidates_the_shared_test(student, conn):
+    test_id = add_test(conn, ['أ'])
+    first = student.get(f'/api/v1/tests/{test_id}').get_json()
+    assert all(set(q) == {'id', 'text', 'options'} for q in first['questions'])
+    conn.execute("""
+        INSERT INTO questions (test_id, text, option1, option2, option3, option4, correct_option)
+        VALUES (?, 'سؤال جديد', 'أ', 'ب', 'ج', 'د', 'ب')
+    """, (test_id,))
+    assert len(student.get(f'/api/v1/tests/{test_id}').get_json()['questions']) == 1 # Not bumped yet
+    bump_version(conn, test_id)
+    conn.commit()
+    assert len(student.get(f'/api/v1/tests/{test_id}').get_json()['questions']) == 2
+
+
+def test_pooled_tests_are_not_shared_between_students(app, student, conn):
+    test_id = add_test(conn, ['أ'] * 6)
+    conn.execute("UPDATE tests SET sample_size = 2 WHERE id = ?", (test_id,))
+    conn.commit()
+    other = app.test_client()
+    login(other, add_user(conn, 'other'), 'other')
+    mine = student.get(f'/api/v1/tests/{test_id}').get_json()
+    theirs = other.get(f'/api/v1/tests/{test_id}').get_json()
+    assert mine['attempt_id'] != theirs['attempt_id']
+    assert ('test', test_id) not in routes.get_api_cache(app)._entries
+
+
+def test_fragment_cache_drops_the_least_recently_used(app):
+    cache = http_cache.FragmentCache(2)
+    with app.app_context():
+        cache.get('a', 1, lambda: 'A')
+        cache.get('b', 1, lambda: 'B')
+        cache.get('a', 1, lambda: 'stale')
+        cache.get('c', 1, lambda: 'C')
+        assert cache.get('a', 1, lambda: 'new') == 'A'
+        assert cache.get('b', 1, lambda: 'new') == 'new'
+        assert cache.get('a', 2, lambda: 'A2') == 'A2'
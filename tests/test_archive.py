@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import archive
+import leaderboard
+from conftest import add_test, add_user, login
+from grading import compiled_key
+from question_cache import get_question_bank
+from results import record_results
+
+OLD = datetime(2020, 1, 1)
+NEW = datetime(2024, 1, 1)
+CUTOFF = datetime(2023, 1, 1)
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    return {'ARCHIVE_DATABASE': str(tmp_path / 'archive.db')}
+
+
+@pytest.fixture
+def results(conn):
+    """Two old results and one recent one, each with its answer responses."""
+    bank = get_question_bank(conn, add_test(conn, ['أ', 'ب']))
+    compiled_key(bank)
+    users = [add_user(conn, name) for name in ('s1', 's2')]
+    sheet = np.array([0, 0], dtype=np.int8)
+    record_results(conn, bank, [(users[0], 1, 2, 50), (users[1], 1, 2, 50)], OLD, sheets=[sheet, sheet])
+    record_results(conn, bank, [(users[0], 1, 2, 50)], NEW, sheets=[sheet])
+    conn.commit()
+    return bank, users
+
+
+def count(conn, table):
+    return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_old_results_move_with_their_responses(conn, results):
+    assert archive.archive_results(conn, CUTOFF, chunk_size=1) == 2
+    assert (count(conn, 'main.test_results'), count(conn, 'archive.test_results')) == (1, 2)
+    assert (count(conn, 'main.answer_responses'), count(conn, 'archive.answer_responses')) == (2, 4)
+    assert (count(conn, 'all_test_results'), count(conn, 'all_answer_responses')) == (3, 6)
+    assert archive.archive_results(conn, CUTOFF) == 0
+
+
+def test_an_interrupted_move_is_finished_without_duplicates(conn, results):
+    old_id = conn.execute("SELECT MIN(id) FROM test_results").fetchone()[0]
+    conn.execute("INSERT INTO archive.test_results SELECT * FROM main.test_results WHERE id = ?", (old_id,))
+    conn.commit() # Copied, not yet deleted
+    assert archive.archive_results(conn, CUTOFF) == 2
+    assert count(conn, 'all_test_results') == 3
+    assert count(conn, 'archive.answer_responses') == 4
+
+
+def test_summaries_still_count_archived_results(conn, results):
+    bank, _ = results
+    before = leaderboard.histograms(conn, [bank.test_id])
+    archive.archive_results(conn, CUTOFF)
+    leaderboard.rebuild_leaderboards(conn)
+    conn.commit()
+    assert leaderboard.histograms(conn, [bank.test_id]) == before
+
+
+def test_deleting_a_user_deletes_their_archived_results(app, conn, results):
+    _, users = results
+    archive.archive_results(conn, CUTOFF)
+    client = app.test_client()
+    login(client, add_user(conn, 'admin'), 'admin')
+    client.get(f'/admin/delete-user/{users[0]}')
+    assert [row[0] for row in conn.execute("SELECT DISTINCT user_id FROM all_test_results")] == [users[1]]
+    assert count(conn, 'archive.answer_responses') == 2
+
+
+def test_full_history_includes_archived_attempts(app, conn, results):
+    _, users = results
+    archive.archive_results(conn, CUTOFF)
+    client = app.test_client()
+    login(client, users[0], 's1')
+    assert len(client.get('/api/v1/dashboard').get_json()['history']) == 1
+    assert len(client.get('/api/v1/dashboard?history=all').get_json()['history']) == 2
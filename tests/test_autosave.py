@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import autosave
+from conftest import add_test, add_user, question_ids
+from db import get_db
+
+
+@pytest.fixture
+def student(app, conn):
+    """Logs a student in; returns ``(client, user_id, test_id, full_marks_answers)``."""
+    test_id = add_test(conn, ['أ', 'ب', 'ج'])
+    user_id = add_user(conn, 'student')
+    answers = {str(qid): option for qid, option in zip(question_ids(conn, test_id), 'أبج')}
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['username'] = 'student'
+    return client, user_id, test_id, answers
+
+
+def scores(app, user_id, test_id):
+    with app.app_context():
+        return [row['score'] for row in get_db().execute(
+            "SELECT score FROM test_results WHERE user_id = ? AND test_id = ? ORDER BY id",
+            (user_id, test_id))]
+
+
+def test_accepts():
+    assert autosave.accepts(None, 1)
+    assert autosave.accepts(autosave.Draft(5, 0, {}), 5)
+    assert not autosave.accepts(autosave.Draft(5, 1, {}), 5)
+    assert not autosave.accepts(autosave.Draft(5, 1, {}), 4)
+    assert autosave.accepts(autosave.Draft(5, 1, {}), 6)
+
+
+def test_saved_answers_fill_in_the_submitted_form(app, student):
+    client, user_id, test_id, answers = student
+    attempt = client.get(f'/autosave/{test_id}').get_json()['attempt']
+    assert client.post(f'/autosave/{test_id}', json={'attempt': attempt, 'answers': answers}).status_code == 200
+    assert client.get(f'/autosave/{test_id}').get_json() == {'attempt': attempt, 'answers': answers}
+
+    client.post(f'/submit/{test_id}', data={'draft_attempt': attempt})
+    assert scores(app, user_id, test_id) == [3]
+
+
+def test_late_save_after_submit_is_rejected(app, student):
+    client, user_id, test_id, answers = student
+    attempt = client.get(f'/autosave/{test_id}').get_json()['attempt']
+    client.post(f'/autosave/{test_id}', json={'attempt': attempt, 'answers': answers})
+    client.post(f'/submit/{test_id}', data={'draft_attempt': attempt})
+
+    response = client.post(f'/autosave/{test_id}', json={'attempt': attempt, 'answers': answers})
+    assert response.status_code == 409
+    retake = client.get(f'/autosave/{test_id}').get_json()
+    assert retake['answers'] == {}
+    assert retake['attempt'] > attempt
+
+
+def test_retake_is_graded_from_its_own_answers(app, student):
+    client, user_id, test_id, answers = student
+    attempt = client.get(f'/autosave/{test_id}').get_json()['attempt']
+    client.post(f'/autosave/{test_id}', json={'attempt': attempt, 'answers': answers})
+    client.post(f'/submit/{test_id}', data={'draft_attempt': attempt})
+
+    client.post(f'/submit/{test_id}', data={})
+    assert scores(app, user_id, test_id) == [3, 0]
+
+
+def test_buffered_save_of_a_submitted_attempt_is_not_written(app, student):
+    app.config['AUTOSAVE_FLUSH_MS'] = 60000
+    client, user_id, test_id, answers = student
+    attempt = client.get(f'/autosave/{test_id}').get_json()['attempt']
+    client.post(f'/autosave/{test_id}', json={'attempt': attempt, 'answers': answers})
+    client.post(f'/submit/{test_id}', data={'draft_attempt': attempt})
+    assert scores(app, user_id, test_id) == [3]
+
+    buffer = autosave.get_autosave_buffer(app)
+    buffer.save(user_id, test_id, attempt, answers) # A save still waiting in another worker's buffer
+    buffer.flush()
+    with app.app_context():
+        draft = autosave.load_draft(get_db(), user_id, test_id)
+    assert draft.submitted
+    assert draft.answers == {}
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import csv
+import json
+from datetime import datetime
+
+import numpy as np
+
+import grading
+from conftest import add_test, add_user, question_ids
+from question_cache import get_question_bank
+
+OPTIONS = ('أ', 'ب', 'ج', 'د')
+
+
+def make_key():
+    return grading.AnswerKey(1, [10, 11, 12], [OPTIONS] * 3, [0, 1, 2])
+
+
+def test_encode_maps_option_text_and_indexes():
+    key = make_key()
+    assert key.encode({'10': 'أ', '11': 'د', '99': 'ب'}).tolist() == [0, 3, grading.UNANSWERED]
+    assert key.encode({10: 'A', 11: '2', 12: 'x'}, as_index=True).tolist() == [0, 1, grading.UNANSWERED]
+
+
+def test_encode_skips_malformed_question_ids():
+    key = make_key()
+    ignored = set()
+    sheet = key.encode({'x': 'أ', '': 'ب', '12': 'ج'}, ignored=ignored)
+    assert sheet.tolist() == [grading.UNANSWERED, grading.UNANSWERED, 2]
+    assert ignored == {'x', ''}
+
+
+def test_grade_scores_each_sheet():
+    key = make_key()
+    scores, correctness = key.grade([[0, 1, 2], [0, 0, grading.UNANSWERED]])
+    assert scores.tolist() == [3, 1]
+    assert correctness.tolist() == [[True, True, True], [True, False, False]]
+
+
+def test_pack_sheet_round_trips():
+    sheet = np.array([0, 1, 2, 3, grading.UNANSWERED, 3, 0, grading.UNANSWERED, 1], dtype=np.int8)
+    blob = grading.pack_sheet(sheet)
+    assert len(blob) == 3 + 2
+    assert grading.unpack_sheet(blob, len(sheet)).tolist() == sheet.tolist()
+
+
+def test_grade_file_counts_only_known_students(conn, tmp_path):
+    test_id = add_test(conn, ['أ', 'ب', 'ج'])
+    add_user(conn, 'student')
+    bank = get_question_bank(conn, test_id)
+    qids = question_ids(conn, test_id)
+    path = tmp_path / 'answers.csv'
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['username'] + [f'question_{qid}' for qid in qids] + ['question_x'])
+        writer.writerow(['student', 'أ', 'د', 'ج', 'أ'])
+        writer.writerow(['nobody', 'أ', 'ب', 'ج', 'أ'])
+
+    summary = grading.grade_file(conn, bank, str(path), timestamp=datetime.now())
+    assert summary['graded'] == 1
+    assert summary['stored'] == 1
+    assert summary['score_sum'] == 2
+    assert summary['correct_per_question'].tolist() == [1, 0, 1]
+    assert summary['unknown_students'] == ['nobody']
+    assert summary['ignored_questions'] == {'x'}
+    row = conn.execute("SELECT score, total_questions FROM test_results WHERE test_id = ?",
+                       (test_id,)).fetchone()
+    assert tuple(row) == (2, 3)
+
+
+def test_grade_file_reports_malformed_user_ids_as_unknown(conn, tmp_path):
+    test_id = add_test(conn, ['أ', 'ب'])
+    user_id = add_user(conn, 'student')
+    bank = get_question_bank(conn, test_id)
+    qids = question_ids(conn, test_id)
+    path = tmp_path / 'answers.jsonl'
+    path.write_text('\n'.join([
+        json.dumps({'user_id': user_id, 'answers': {str(qids[0]): 'أ'}}),
+        json.dumps({'user_id': 'abc', 'answers': {str(qids[0]): 'أ'}}),
+        json.dumps({'user_id': [1], 'answers': {}}),
+    ]), encoding='utf-8')
+
+    summary = grading.grade_file(conn, bank, str(path), timestamp=datetime.now())
+    assert summary['graded'] == 1
+    assert summary['score_sum'] == 1
+    assert summary['unknown_students'] == ['abc', [1]]
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+
+import pytest
+
+import leaderboard
+from conftest import add_test, add_user, login
+from question_cache import get_question_bank
+from results import record_results
+
+T0 = datetime(2024, 1, 1, 9, 0)
+
+
+@pytest.fixture
+def bank(conn):
+    return get_question_bank(conn, add_test(conn, ['أ', 'ب', 'ج', 'د']))
+
+
+def record(conn, bank, user_id, percentage, minutes):
+    record_results(conn, bank, [(user_id, percentage // 25, 4, percentage)], T0 + timedelta(minutes=minutes))
+    conn.commit()
+
+
+def snapshot(conn, test_id):
+    histogram = leaderboard.histograms(conn, [test_id]).get(test_id)
+    best = conn.execute("SELECT user_id, best_percentage, achieved_at FROM test_best WHERE test_id = ? ORDER BY user_id",
+                        (test_id,)).fetchall()
+    return histogram, [tuple(row) for row in best]
+
+
+def test_best_score_only_rises(conn, bank):
+    user_id = add_user(conn, 'student')
+    record(conn, bank, user_id, 50, 0)
+    record(conn, bank, user_id, 75, 1)
+    record(conn, bank, user_id, 25, 2)
+    record(conn, bank, user_id, 75, 3)
+    best = conn.execute("SELECT best_percentage, achieved_at FROM test_best WHERE user_id = ?", (user_id,)).fetchone()
+    assert best[0] == 75
+    assert str(best[1]).startswith('2024-01-01 09:01')
+
+
+def test_histograms_and_percentile_rank(conn, bank):
+    for i, percentage in enumerate([0, 50, 50, 100]):
+        record(conn, bank, add_user(conn, f's{i}'), percentage, i)
+    counts = leaderboard.histograms(conn, [bank.test_id, 999])
+    assert list(counts) == [bank.test_id]
+    assert (counts[bank.test_id][0], counts[bank.test_id][50], counts[bank.test_id][100]) == (1, 2, 1)
+    assert sum(counts[bank.test_id]) == 4
+    assert leaderboard.percentile_rank(counts[bank.test_id], 50) == 50
+    assert leaderboard.percentile_rank(counts[bank.test_id], 100) == 88
+    assert leaderboard.percentile_rank(None, 50) is None
+
+
+def test_top_scores_break_ties_by_who_got_there_first(conn, bank):
+    first, second, third = (add_user(conn, name) for name in ('first', 'second', 'third'))
+    record(conn, bank, second, 100, 5)
+    record(conn, bank, first, 100, 1)
+    record(conn, bank, third, 75, 0)
+    assert [row['username'] for row in leaderboard.top_scores(conn, bank.test_id, 10)] == ['first', 'second', 'third']
+    assert len(leaderboard.top_scores(conn, bank.test_id, 2)) == 2
+
+
+def test_incremental_upserts_match_a_rebuild(conn, bank):
+    for i, percentages in enumerate([[25, 75], [100], [50, 50, 0]]):
+        user_id = add_user(conn, f's{i}')
+        for minute, percentage in enumerate(percentages):
+            record(conn, bank, user_id, percentage, 10 * i + minute)
+    incremental = snapshot(conn, bank.test_id)
+    leaderboard.rebuild_leaderboards(conn)
+    conn.commit()
+    assert snapshot(conn, bank.test_id) == incremental
+
+
+def test_deleting_a_user_takes_their_results_out(app, conn, bank):
+    keep, gone = add_user(conn, 'keep'), add_user(conn, 'gone')
+    record(conn, bank, keep, 50, 0)
+    record(conn, bank, gone, 50, 1)
+    record(conn, bank, gone, 100, 2)
+
+    client = app.test_client()
+    login(client, add_user(conn, 'admin'), 'admin')
+    client.get(f'/admin/delete-user/{gone}')
+    histogram, best = snapshot(conn, bank.test_id)
+    assert (histogram[50], histogram[100], sum(histogram)) == (1, 0, 1)
+    assert [row[0] for row in best] == [keep]
+    assert conn.execute("SELECT COUNT(*) FROM score_histograms WHERE count <= 0").fetchone()[0] == 0
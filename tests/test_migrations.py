@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+import migrations
+
+
+def test_upgrade_reaches_latest_version(conn):
+    assert migrations.get_version(conn) == migrations.MIGRATIONS[-1][0]
+    assert migrations.upgrade(conn) == []
+
+
+def test_hot_path_queries_use_an_index(conn):
+    assert migrations.check_query_plans(conn) == {}
+
+
+def test_a_query_that_scans_is_reported(conn, monkeypatch):
+    scan = "SELECT id FROM users WHERE email LIKE ?"
+    monkeypatch.setitem(migrations.HOT_PATH_QUERIES, 'email_search', (scan, ('%@example.com',)))
+    assert list(migrations.check_query_plans(conn)) == ['email_search']
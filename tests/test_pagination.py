@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from conftest import add_user
+from pagination import decode_cursor, encode_cursor, paginate
+
+USERS_SQL = "SELECT id, username FROM users WHERE username != 'admin' {keyset} ORDER BY {order}"
+KEY = [('id', 'id')]
+
+
+def test_cursor_round_trip():
+    token = encode_cursor(['2024-01-01 10:00:00', 42])
+    assert '=' not in token
+    assert decode_cursor(token, 2) == ('2024-01-01 10:00:00', 42)
+
+
+@pytest.mark.parametrize('token', ['', 'not base64!', encode_cursor([1]), encode_cursor([[1], 2]),
+                                   'eyJhIjoxfQ'])
+def test_malformed_cursor_is_ignored(token):
+    assert decode_cursor(token, 2) is None
+
+
+def page(app, conn, query_string, descending=False):
+    with app.test_request_context('/', query_string=query_string):
+        return paginate(conn, USERS_SQL, (), KEY, descending=descending)
+
+
+def names(page):
+    return [row['username'] for row in page.items]
+
+
+def test_pages_forward_and_back(app, conn):
+    for i in range(5):
+        add_user(conn, f's{i}')
+
+    first = page(app, conn, {'per_page': 2})
+    assert names(first) == ['s0', 's1']
+    assert first.has_next and not first.has_prev
+
+    second = page(app, conn, {'per_page': 2, 'after': first.next_cursor})
+    assert names(second) == ['s2', 's3']
+    assert second.has_next and second.has_prev
+
+    last = page(app, conn, {'per_page': 2, 'after': second.next_cursor})
+    assert names(last) == ['s4']
+    assert not last.has_next
+
+    back = page(app, conn, {'per_page': 2, 'before': last.prev_cursor})
+    assert names(back) == ['s2', 's3']
+    assert back.has_prev and back.next_cursor == second.next_cursor
+
+
+def test_descending_pages_follow_the_display_order(app, conn):
+    for i in range(3):
+        add_user(conn, f's{i}')
+    first = page(app, conn, {'per_page': 2}, descending=True)
+    assert names(first) == ['s2', 's1']
+    assert names(page(app, conn, {'per_page': 2, 'after': first.next_cursor}, descending=True)) == ['s0']
+
+
+def test_page_size_is_clamped(app, conn):
+    app.config['MAX_PAGE_SIZE'] = 3
+    for i in range(5):
+        add_user(conn, f's{i}')
+    assert len(page(app, conn, {'per_page': 50}).items) == 3
+    assert len(page(app, conn, {'per_page': 0}).items) == 1
+
+
+def test_a_bad_cursor_starts_from_the_first_page(app, conn):
+    for i in range(3):
+        add_user(conn, f's{i}')
+    assert names(page(app, conn, {'per_page': 2, 'after': 'garbage'})) == ['s0', 's1']
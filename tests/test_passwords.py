@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import hashlib
+
+import pytest
+
+import passwords
+from conftest import add_user
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def set_password_hash(conn, user_id, stored):
+    conn.execute("UPDATE users SET password_hash = ? WHERE id = ?", (stored, user_id))
+    conn.commit()
+
+
+def password_hash(conn, user_id):
+    return conn.execute("SELECT password_hash FROM users WHERE id = ?", (user_id,)).fetchone()[0]
+
+
+def test_scrypt_round_trip_and_cost_change():
+    hasher = passwords.ScryptHasher(n=2 ** 10)
+    stored = hasher.hash('secret')
+    assert hasher.verify('secret', stored)
+    assert not hasher.verify('Secret', stored)
+    assert not hasher.needs_rehash(stored)
+    assert passwords.ScryptHasher(n=2 ** 11).needs_rehash(stored)
+
+
+def test_legacy_hash_is_upgraded_on_login(client, conn):
+    user_id = add_user(conn, 'student')
+    set_password_hash(conn, user_id, hashlib.sha256(b'secret').hexdigest())
+
+    response = client.post('/login', data={'username': 'student', 'password': 'secret'})
+    assert response.status_code == 302 and '/dashboard' in response.location
+    stored = password_hash(conn, user_id)
+    assert stored.startswith('scrypt$16384$')
+    assert passwords.verify_password('secret', stored) == (True, False)
+
+
+def test_wrong_password_keeps_the_legacy_hash(client, conn):
+    user_id = add_user(conn, 'student')
+    legacy = hashlib.sha256(b'secret').hexdigest()
+    set_password_hash(conn, user_id, legacy)
+
+    response = client.post('/login', data={'username': 'student', 'password': 'wrong'})
+    assert '/login' in response.location
+    assert password_hash(conn, user_id) == legacy
+
+
+def test_unknown_username_is_checked_against_a_dummy_hash(client, monkeypatch):
+    checked = []
+    verify = passwords.PasswordPool.verify
+    monkeypatch.setattr(passwords.PasswordPool, 'verify',
+                        lambda self, password, stored: checked.append(stored) or verify(self, password, stored))
+
+    response = client.post('/login', data={'username': 'nobody', 'password': 'secret'})
+    assert '/login' in response.location
+    assert checked == [passwords.dummy_hash()]
+    assert checked[0].startswith('scrypt$16384$')
+
+
+def test_login_is_turned_away_while_the_pool_is_full(app, client, conn):
+    add_user(conn, 'student')
+    pool = passwords.get_password_pool(app)
+    held = 0
+    while pool._slots.acquire(blocking=False):
+        held += 1
+    try:
+        response = client.post('/login', data={'username': 'student', 'password': 'secret'})
+    finally:
+        for _ in range(held):
+            pool._slots.release()
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(app.config['PASSWORD_RETRY_AFTER'])
+    assert pool.rejected == 1
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import random
+from datetime import datetime
+
+import pytest
+
+import question_pool
+from conftest import add_test, add_user, login
+
+
+def test_allocate_splits_in_proportion():
+    assert question_pool.allocate({'a': 6, 'b': 3, 'c': 1}, 5) == {'a': 3, 'b': 2, 'c': 0}
+    assert sum(question_pool.allocate({'a': 7, 'b': 7, 'c': 7}, 10).values()) == 10
+
+
+@pytest.mark.parametrize('k', [0, -3])
+def test_allocate_draws_nothing_below_one(k):
+    assert question_pool.allocate({'a': 5}, k) == {}
+
+
+def test_allocate_takes_everything_when_k_covers_the_pool():
+    assert question_pool.allocate({'a': 2, 'b': 1}, 10) == {'a': 2, 'b': 1}
+
+
+def test_sample_ids_draws_distinct_ids_from_each_stratum():
+    index = question_pool.PoolIndex(1, 1, {'a': tuple(range(100)), 'b': tuple(range(100, 150))})
+    sampled = question_pool.sample_ids(index, 30, rng=random.Random(7))
+    assert len(set(sampled)) == 30
+    assert sum(qid >= 100 for qid in sampled) == 10
+    assert question_pool.sample_ids(index, 0) == []
+
+
+@pytest.fixture
+def pooled_test(conn):
+    """A test of ten questions, two per attempt, in two strata."""
+    test_id = add_test(conn, ['أ'] * 10)
+    conn.execute("UPDATE questions SET stratum = id % 2 WHERE test_id = ?", (test_id,))
+    conn.execute("UPDATE tests SET sample_size = 2 WHERE id = ?", (test_id,))
+    conn.commit()
+    return conn.execute("SELECT * FROM tests WHERE id = ?", (test_id,)).fetchone()
+
+
+def test_reload_returns_the_same_attempt(conn, pooled_test):
+    user_id = add_user(conn, 'student')
+    attempt_id, bank = question_pool.start_attempt(conn, user_id, pooled_test, datetime.now())
+    conn.commit()
+    again_id, again = question_pool.start_attempt(conn, user_id, pooled_test, datetime.now())
+    assert again_id == attempt_id
+    assert [q['id'] for q in again.questions] == [q['id'] for q in bank.questions]
+    assert len(bank.questions) == 2
+    assert {q['id'] % 2 for q in bank.questions} == {0, 1}
+
+
+def test_empty_draw_opens_no_attempt(conn, pooled_test):
+    user_id = add_user(conn, 'student')
+    conn.execute("UPDATE tests SET sample_size = 0 WHERE id = ?", (pooled_test['id'],))
+    test = conn.execute("SELECT * FROM tests WHERE id = ?", (pooled_test['id'],)).fetchone()
+    assert question_pool.start_attempt(conn, user_id, test, datetime.now()) == (None, None)
+    assert conn.execute("SELECT COUNT(*) FROM attempts").fetchone()[0] == 0
+
+
+def test_an_attempt_is_claimed_once_by_its_owner(conn, pooled_test):
+    user_id = add_user(conn, 'student')
+    other_id = add_user(conn, 'other')
+    attempt_id, bank = question_pool.start_attempt(conn, user_id, pooled_test, datetime.now())
+    conn.commit()
+
+    assert question_pool.claim_attempt(conn, attempt_id, other_id, pooled_test, datetime.now()) is None
+    claimed = question_pool.claim_attempt(conn, attempt_id, user_id, pooled_test, datetime.now())
+    assert [q['id'] for q in claimed.questions] == [q['id'] for q in bank.questions]
+    assert question_pool.claim_attempt(conn, attempt_id, user_id, pooled_test, datetime.now()) is None
+
+
+def test_submit_grades_only_the_questions_served(app, conn, pooled_test):
+    user_id = add_user(conn, 'student')
+    attempt_id, bank = question_pool.start_attempt(conn, user_id, pooled_test, datetime.now())
+    conn.commit()
+    client = app.test_client()
+    login(client, user_id, 'student')
+    form = {'attempt_id': attempt_id, **{f'question_{q["id"]}': 'أ' for q in bank.questions}}
+
+    client.post(f'/submit/{pooled_test["id"]}', data=form)
+    client.post(f'/submit/{pooled_test["id"]}', data=form) # A resubmitted page is not graded twice
+    rows = conn.execute("SELECT score, total_questions FROM test_results WHERE user_id = ?", (user_id,)).fetchall()
+    assert [tuple(row) for row in rows] == [(2, 2)]
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import io
+
+import pytest
+
+import passwords
+import user_io
+from conftest import add_user, login
+
+
+@pytest.fixture
+def pool():
+    pool = passwords.PasswordPool(workers=2, max_pending=4)
+    yield pool
+    pool.close()
+
+
+def roster(*rows):
+    return io.StringIO('username,email,password\n' + ''.join(f'{row}\n' for row in rows))
+
+
+def stored_hash(conn, username):
+    return conn.execute("SELECT password_hash FROM users WHERE username = ?", (username,)).fetchone()[0]
+
+
+def test_import_keeps_passwords_as_typed(conn, pool, monkeypatch):
+    monkeypatch.setattr(user_io, 'ProcessPoolExecutor', None) # The request path must not fork
+    summary = user_io.import_users(conn, roster(' s1 , s1@example.com , pass word ', 's2,s2@example.com,pw2'),
+                                   workers=4, pool=pool)
+    assert summary == {'imported': 2, 'errors': []}
+    assert passwords.verify_password(' pass word ', stored_hash(conn, 's1'))[0]
+    assert not passwords.verify_password('pass word', stored_hash(conn, 's1'))[0]
+    assert passwords.verify_password('pw2', stored_hash(conn, 's2'))[0]
+
+
+def test_import_reports_invalid_and_duplicate_rows(conn, pool):
+    summary = user_io.import_users(conn, roster('s1,s1@example.com,pw', 's1,other@example.com,pw',
+                                                'admin,a@example.com,pw', 's3,bad-email,pw'), pool=pool)
+    assert summary['imported'] == 1
+    assert [line for line, _ in summary['errors']] == [3, 4, 5]
+
+
+def test_pool_map_runs_in_batches_and_turns_away_when_full(pool):
+    assert pool.map(str.upper, ['a', 'b', 'c']) == ['A', 'B', 'C']
+    for _ in range(4):
+        pool._slots.acquire()
+    with pytest.raises(passwords.Overloaded):
+        pool.map(str.upper, ['a'])
+    assert pool.rejected == 1
+
+
+def test_admin_upload_hashes_through_the_password_pool(app, conn, monkeypatch):
+    monkeypatch.setattr(user_io, 'ProcessPoolExecutor', None)
+    client = app.test_client()
+    login(client, add_user(conn, 'admin'), 'admin')
+    data = {'users_file': (io.BytesIO('username,email,password\ns1,s1@example.com,pw\n'.encode()), 'r.csv')}
+    client.post('/admin/import-users', data=data, content_type='multipart/form-data')
+    assert passwords.verify_password('pw', stored_hash(conn, 's1'))[0]
+    assert 'password_pool' in app.extensions
+
+
+def test_imported_accounts_get_the_full_cost(conn, pool):
+    user_io.import_users(conn, roster('s1,s1@example.com,pw'), pool=pool)
+    assert passwords.verify_password('pw', stored_hash(conn, 's1')) == (True, False)
+
+
+def test_upload_stops_at_the_row_limit(conn, pool):
+    summary = user_io.import_users(conn, roster('s1,s1@example.com,pw', 's2,s2@example.com,pw',
+                                                's3,s3@example.com,pw'), pool=pool, max_rows=2)
+    assert summary['imported'] == 2
+    assert [line for line, _ in summary['errors']] == [4]
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""Bulk provisioning of student accounts from CSV rosters.
+
+A roster has ``username``, ``email`` and ``password`` columns. Rows are
+read ``chunk_size`` at a time; each chunk is checked against existing
+accounts with one set-based query, its passwords are hashed in parallel and
+the valid rows are inserted with ``executemany`` in one
+transaction, so a roster of thousands of students costs a few queries per
+chunk rather than several per student.
+
+Imported accounts are hashed like registered ones, at the full cost (about
+50 ms per account per core with the defaults). An upload is processed
+within the request, so the admin page takes at most
+``USER_IMPORT_MAX_ROWS`` rows (about fifteen seconds on one core, inside
+the worker timeout); larger rosters go through the command. The command hashes across a process pool of its own; the admin
+page runs inside a threaded worker, where forking could deadlock a child on
+a lock some other thread held, so it hashes through the worker's
+``PasswordPool`` instead.
+"""
+import csv
+import itertools
+import json
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+from passwords import hash_password
+
+FIELDS = ('username', 'email', 'password')
+
+_INSERT_USER = "INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)"
+
+
+def validate_user(username, email, password):
+    """Returns an error message for an invalid roster row, or None."""
+    if not all([username, email, password]):
+        return 'الرجاء ملء اسم المستخدم والبريد الإلكتروني وكلمة المرور.'
+    if username == 'admin':
+        return 'اسم المستخدم محجوز.'
+    if '@' not in email:
+        return 'البريد الإلكتروني غير صالح.'
+    return None
+
+
+def existing_accounts(conn, usernames, emails):
+    """Returns the ``(usernames, emails)`` among the given ones that are already taken."""
+    rows = conn.execute("""
+        SELECT username, email FROM users
+        WHERE username IN (SELECT value FROM json_each(?)) OR email IN (SELECT value FROM json_each(?))
+    """, (json.dumps(usernames), json.dumps(emails))).fetchall()
+    return {row[0] for row in rows}, {row[1] for row in rows}
+
+
+def hash_passwords(passwords, executor=None, pool=None):
+    """Hashes a list of passwords, through ``pool`` or across ``executor``'s processes when given."""
+    if pool is not None:
+        return pool.map(hash_password, passwords)
+    if executor is None:
+        return [hash_password(p) for p in passwords]
+    return list(executor.map(hash_password, passwords, chunksize=max(1, len(passwords) // 32)))
+
+
+def _insert_chunk(conn, rows, summary):
+    """Inserts ``(line_number, username, email, password_hash)`` rows in one transaction.
+
+    If an account was registered meanwhile the chunk is retried row by row,
+    so only the clashing rows are reported.
+    """
+    try:
+        conn.executemany(_INSERT_USER, [row[1:] for row in rows])
+        conn.commit()
+        summary['imported'] += len(rows)
+        return
+    except sqlite3.IntegrityError:
+        conn.rollback()
+    for line_number, *values in rows:
+        try:
+            conn.execute(_INSERT_USER, values)
+            conn.commit()
+            summary['imported'] += 1
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            summary['errors'].append((line_number, 'اسم المستخدم أو البريد الإلكتروني موجود مسبقاً.'))
+
+
+def import_users(conn, stream, chunk_size=1000, dry_run=False, workers=None, max_rows=None, pool=None):
+    """Validates a CSV roster from a text stream and creates its accounts.
+
+    Rows that are invalid, repeat an earlier row of the file or clash with an
+    existing account are skipped. Passwords are hashed through ``pool`` (a ``passwords.PasswordPool``, which may raise
+    ``Overloaded``) or, when ``workers`` > 1, in that many processes.
+    Usernames and emails are stripped of surrounding spaces, passwords are
+    kept as typed, as the register and login forms do. Rows after the first
+    ``max_rows`` are not read; one error reports where the file was cut off.
+    With ``dry_run`` nothing is hashed or inserted. Returns
+    ``{'imported': n, 'errors': [(line_number, message), ...]}``.
+    """
+    summary = {'imported': 0, 'errors': []}
+    seen_usernames, seen_emails = set(), set()
+    reader = csv.DictReader(stream)
+    rows = ((reader.line_num, row) for row in reader)
+    remaining = max_rows
+    use_processes = pool is None and workers and workers > 1 and not dry_run
+    executor = ProcessPoolExecutor(workers) if use_processes else None
+    try:
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size if remaining is None else min(chunk_size, remaining)))
+            if not chunk:
+                extra = next(rows, None) if remaining == 0 else None
+                if extra is not None:
+                    summary['errors'].append(
+                        (extra[0], f'تجاوز الملف الحد الأقصى ({max_rows} صف)؛ لم تتم معالجة هذا السطر وما بعده.'))
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            candidates = []
+            for line_number, row in chunk:
+                username, email = (str(row.get(f) or '').strip() for f in FIELDS[:2])
+                password = str(row.get('password') or '')
+                error = validate_user(username, email, password)
+                if not error and (username in seen_usernames or email in seen_emails):
+                    error = 'اسم المستخدم أو البريد الإلكتروني مكرر في الملف.'
+                if error:
+                    summary['errors'].append((line_number, error))
+                    continue
+                seen_usernames.add(username)
+                seen_emails.add(email)
+                candidates.append((line_number, username, email, password))
+
+            taken_usernames, taken_emails = existing_accounts(
+                conn, [c[1] for c in candidates], [c[2] for c in candidates])
+            valid = []
+            for candidate in candidates:
+                if candidate[1] in taken_usernames or candidate[2] in taken_emails:
+                    summary['errors'].append((candidate[0], 'اسم المستخدم أو البريد الإلكتروني موجود مسبقاً.'))
+                else:
+                    valid.append(candidate)
+            if dry_run:
+                summary['imported'] += len(valid)
+            elif valid:
+                hashes = hash_passwords([c[3] for c in valid], executor, pool)
+                _insert_chunk(conn, [c[:3] + (h,) for c, h in zip(valid, hashes)], summary)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    summary['errors'].sort()
+    return summary
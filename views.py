@@ -0,0 +1,603 @@
+# -*- coding: utf-8 -*-
+"""Student-facing pages: registration, login, dashboard, tests and results.
+
+The routes are collected here and added to the application by
+``init_app``, so they keep their plain endpoint names (``url_for('login')``).
+Views that grade import ``grading`` and ``adaptive`` (and so numpy) when
+first called, which keeps a fresh worker's start-up and first login cheap.
+"""
+import datetime
+import hmac
+import json
+import sqlite3
+from datetime import datetime as dt # For template 'now' function
+
+from flask import (
+    abort, current_app, flash, jsonify, make_response, redirect, render_template, request, Response, session,
+    url_for
+)
+
+import admission
+import autosave
+import http_cache
+import leaderboard
+import metrics
+import passwords
+import question_pool
+import queries
+from db import get_db
+from pagination import paginate
+from question_cache import get_question_bank
+from results import record_result
+from results_writer import get_result_writer
+
+_routes = []
+
+
+def route(rule, **options):
+    """Like ``app.route``, for a view added to the app later by ``init_app``."""
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
+
+# --- Make 'now' available to templates ---
+def inject_now():
+    return {'now': dt.utcnow}
+
+# --- Define datetime format filter ---
+def format_datetime_filter(value, format='%Y-%m-%d %H:%M'):
+    """Format a datetime object or string for display."""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        try:
+            value = dt.strptime(value, '%Y-%m-%d %H:%M:%S.%f') # Most common SQLite format
+        except ValueError:
+            try:
+                value = dt.strptime(value, '%Y-%m-%d %H:%M:%S') # Without microseconds
+            except ValueError:
+                 try:
+                      value = dt.strptime(value, '%Y-%m-%d %H:%M') # Format used in submit_test
+                 except ValueError:
+                    return value # Return original string if parsing fails
+    if isinstance(value, datetime.datetime):
+         return value.strftime(format)
+    return value
+
+
+
+def build_results_details(bank, sheet, correctness):
+    """Per-question rows for results.html from an encoded answer sheet."""
+    details = []
+    for question, chosen, is_correct in zip(bank.questions, sheet.tolist(), correctness.tolist()):
+        details.append({
+            'question_text': question['text'],
+            'submitted_answer': question['options'][chosen] if chosen >= 0 else "لم تتم الإجابة",
+            'correct_answer': bank.answer_key[question['id']],
+            'is_correct': is_correct
+        })
+    return details
+
+
+def metrics_authorized():
+    """A bearer token matching ``METRICS_TOKEN``, or the admin's session.
+
+    Not the peer address: behind the reverse proxy every client connects
+    from 127.0.0.1.
+    """
+    if session.get('username') == 'admin':
+        return True
+    token = current_app.config.get('METRICS_TOKEN')
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode())
+
+
+# Prometheus scrape endpoint: a bearer token (or the admin's session)
+@route('/metrics')
+def prometheus_metrics():
+    if not metrics_authorized():
+        abort(404)
+    return Response(metrics.get_registry(current_app).prometheus_text(),
+                    mimetype='text/plain; version=0.0.4')
+
+
+@route('/')
+def index():
+    if 'user_id' in session:
+        return redirect(url_for('dashboard')) if session.get('username') != 'admin' else redirect(url_for('admin.index'))
+    return render_template('index.html')
+
+@route('/register', methods=['GET', 'POST'])
+def register():
+    if 'user_id' in session:
+         return redirect(url_for('dashboard')) if session.get('username') != 'admin' else redirect(url_for('admin.index'))
+
+    if request.method == 'POST':
+        username = request.form.get('username')
+        email = request.form.get('email')
+        password = request.form.get('password')
+        confirm_password = request.form.get('confirm_password')
+
+        if not username or not email or not password or not confirm_password:
+            flash('الرجاء ملء جميع الحقول.', 'danger')
+            return redirect(url_for('register'))
+        if password != confirm_password:
+            flash('كلمتا المرور غير متطابقتين.', 'danger')
+            return redirect(url_for('register'))
+
+        try:
+            conn = get_db()
+            cursor = conn.cursor()
+            cursor.execute(queries.REGISTER_DUPLICATE, (username, email))
+            existing_user = cursor.fetchone()
+            if existing_user:
+                flash('اسم المستخدم أو البريد الإلكتروني موجود مسبقاً.', 'warning')
+                return redirect(url_for('register'))
+
+            try:
+                hashed_password = passwords.get_password_pool().hash(password)
+            except passwords.Overloaded:
+                return server_busy('register')
+            cursor.execute("INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
+                           (username, email, hashed_password))
+            conn.commit()
+            flash('تم التسجيل بنجاح! يمكنك الآن تسجيل الدخول.', 'success')
+            return redirect(url_for('login'))
+        except sqlite3.Error as e:
+            print(f"Database error during registration: {e}")
+            flash('حدث خطأ أثناء التسجيل. الرجاء المحاولة مرة أخرى.', 'danger')
+            return redirect(url_for('register'))
+    return render_template('register.html')
+
+
+def server_busy(endpoint):
+    """Turns a request away while the password pool is full, asking the client to retry shortly."""
+    metrics.get_registry(current_app).increment('password_pool_rejected', route=endpoint)
+    flash('الخادم مشغول حالياً بسبب كثرة طلبات الدخول، الرجاء المحاولة بعد لحظات.', 'warning')
+    response = make_response((render_template(f'{endpoint}.html'), 503))
+    response.headers['Retry-After'] = str(current_app.config.get('PASSWORD_RETRY_AFTER', 2))
+    return response
+
+
+@route('/login', methods=['GET', 'POST'])
+def login():
+    if 'user_id' in session:
+         return redirect(url_for('dashboard')) if session.get('username') != 'admin' else redirect(url_for('admin.index'))
+
+    if request.method == 'POST':
+        username = request.form.get('username')
+        password = request.form.get('password')
+        if not username or not password:
+            flash('الرجاء إدخال اسم المستخدم وكلمة المرور.', 'danger')
+            return redirect(url_for('login'))
+
+        try:
+            conn = get_db()
+            cursor = conn.cursor()
+            cursor.execute(queries.LOGIN_USER, (username,))
+            user = cursor.fetchone()
+            pool = passwords.get_password_pool()
+            try:
+                # An unknown username is checked against a dummy hash, so it takes as long as a wrong password
+                matches, needs_rehash = pool.verify(password, user['password_hash'] if user else passwords.dummy_hash())
+                matches = matches and user is not None
+                if matches and needs_rehash: # Legacy format or an older cost: upgrade it now
+                    cursor.execute("UPDATE users SET password_hash = ? WHERE id = ?", (pool.hash(password), user['id']))
+                    conn.commit()
+            except passwords.Overloaded:
+                return server_busy('login')
+            if matches:
+                session['user_id'] = user['id']
+                session['username'] = user['username']
+                flash(f'أهلاً بك مجدداً، {user["username"]}!', 'success')
+                return redirect(url_for('admin.index')) if user['username'] == 'admin' else redirect(url_for('dashboard'))
+            else:
+                flash('اسم المستخدم أو كلمة المرور غير صحيحة.', 'danger')
+                return redirect(url_for('login'))
+        except sqlite3.Error as e:
+            print(f"Database error during login: {e}")
+            flash('حدث خطأ أثناء تسجيل الدخول.', 'danger')
+            return redirect(url_for('login'))
+    return render_template('login.html')
+
+@route('/dashboard')
+def dashboard():
+    if 'user_id' not in session:
+        flash('الرجاء تسجيل الدخول أولاً للوصول لهذه الصفحة.', 'warning')
+        return redirect(url_for('login'))
+    if session.get('username') == 'admin':
+        flash('يتم توجيهك للوحة تحكم المدير.', 'info')
+        return redirect(url_for('admin.index'))
+
+    username = session.get('username', 'زائر')
+    full_history = request.args.get('history') == 'all'
+    data = {'tests_qiyas_by_level': {}, 'tests_tahseli_by_level': {}, 'past_results': [], 'history_page': None}
+    try:
+        data = dashboard_data(get_db(), session.get('user_id'), full_history)
+    except sqlite3.Error as e:
+        print(f"Database error loading data for dashboard: {e}")
+        flash('حدث خطأ أثناء تحميل بيانات لوحة التحكم.', 'danger')
+
+    return render_template('dashboard.html',
+                           username=username,
+                           full_history=full_history,
+                           has_archive=bool(current_app.config.get('ARCHIVE_DATABASE')),
+                           **data)
+
+
+def dashboard_data(conn, user_id, full_history=False):
+    """The unlocked tests and one page of past results shown on a student's dashboard.
+
+    The history page follows the request's ``after``/``before`` cursors.
+    Shared by ``dashboard`` and the JSON API.
+    """
+    available_tests_qiyas = {}
+    available_tests_tahseli = {}
+    cursor = conn.cursor()
+    cursor.execute(queries.DASHBOARD_PROGRESS, (user_id,))
+    completed_progress = cursor.fetchall()
+    max_completed_qiyas = 0
+    max_completed_tahseli = 0
+    for row in completed_progress:
+        if row['type'] == 'قياس': max_completed_qiyas = row['max_level']
+        elif row['type'] == 'تحصيلي': max_completed_tahseli = row['max_level']
+
+    next_qiyas_level = max_completed_qiyas + 1
+    cursor.execute(queries.AVAILABLE_TESTS, ('قياس', next_qiyas_level))
+    for test in cursor.fetchall():
+        level = test['level']
+        if level not in available_tests_qiyas: available_tests_qiyas[level] = []
+        available_tests_qiyas[level].append(dict(test))
+
+    next_tahseli_level = max_completed_tahseli + 1
+    cursor.execute(queries.AVAILABLE_TESTS, ('تحصيلي', next_tahseli_level))
+    for test in cursor.fetchall():
+        level = test['level']
+        if level not in available_tests_tahseli: available_tests_tahseli[level] = []
+        available_tests_tahseli[level].append(dict(test))
+
+    # Recent attempts by default; ?history=all adds the archived ones
+    source = 'all_test_results' if full_history else 'test_results'
+    history_page = paginate(conn, queries.DASHBOARD_HISTORY.format(source=source), (user_id,),
+                            queries.DASHBOARD_HISTORY_KEY, descending=True)
+    histograms = leaderboard.histograms(conn, sorted({row['test_id'] for row in history_page.items}))
+    past_results = [dict(row, percentile=leaderboard.percentile_rank(histograms.get(row['test_id']),
+                                                                      row['percentage']))
+                    for row in history_page.items]
+    return {'tests_qiyas_by_level': available_tests_qiyas,
+            'tests_tahseli_by_level': available_tests_tahseli,
+            'past_results': past_results,
+            'history_page': history_page}
+
+
+@route('/logout')
+def logout():
+    session.pop('user_id', None)
+    session.pop('username', None)
+    flash('تم تسجيل الخروج بنجاح.', 'info')
+    return redirect(url_for('index'))
+
+@route('/test/<int:test_id>')
+@admission.limit('take_test')
+def take_test(test_id):
+    if 'user_id' not in session:
+        flash('الرجاء تسجيل الدخول أولاً لبدء الاختبار.', 'warning')
+        return redirect(url_for('login'))
+    if session.get('username') == 'admin':
+         flash('لا يمكن للمدير أداء الاختبارات.', 'warning')
+         return redirect(url_for('admin.index'))
+
+    try:
+        conn = get_db()
+        test = conn.execute(queries.TEST_INFO, (test_id,)).fetchone()
+        if not test:
+            flash('الاختبار غير موجود.', 'danger')
+            return redirect(url_for('dashboard'))
+
+        test_data = open_test(conn, session['user_id'], test)
+        conn.commit()
+        if test_data is None:
+            flash('لا توجد أسئلة لهذا الاختبار حالياً.', 'warning')
+            return redirect(url_for('dashboard'))
+
+        # The whole bank is served and layout.html shows students nothing personal, so
+        # every student gets the same page until the bank changes
+        if test_data['version'] is not None:
+            page = http_cache.get_fragment_cache().get(
+                ('take_test', test_id), (test_data['version'], dt.now().year), # The footer shows the year
+                lambda: http_cache.RenderedPage(render_template('test.html', test=test_data)))
+            return http_cache.page_response(page)
+        return http_cache.conditional(make_response(render_template('test.html', test=test_data)))
+    except sqlite3.Error as e:
+        print(f"Database error loading test {test_id}: {e}")
+        flash('حدث خطأ أثناء تحميل الاختبار.', 'danger')
+        return redirect(url_for('dashboard'))
+
+
+def open_test(conn, user_id, test):
+    """The questions (without answers) a student is served for ``test``, or None if it has none.
+
+    Adaptive tests serve their current question and pooled tests the
+    student's own sample, opening an attempt if needed; the caller commits.
+    ``version`` is the bank version when every student gets the same
+    questions, else None.
+    """
+    if test['mode'] == 'adaptive': # One question at a time, chosen from the answers so far
+        import adaptive
+        attempt = adaptive.open_attempt(conn, user_id, test['id'], dt.now())
+        questions = question_pool.fetch_questions(conn, test['id'], [attempt.current_question])[0] if attempt else ()
+        if not questions:
+            return None
+        return {'id': test['id'], 'title': test['name'], 'questions': questions,
+                'attempt_id': attempt.id, 'adaptive': True, 'version': None,
+                'answered': len(attempt.responses), 'max_items': current_app.config['ADAPTIVE_MAX_ITEMS']}
+
+    attempt_id = None
+    if test['sample_size']: # Pooled test: serve this student's own sample
+        attempt_id, bank = question_pool.start_attempt(conn, user_id, test, dt.now())
+    else:
+        bank = get_question_bank(conn, test['id'])
+    if not bank or not bank.questions:
+        return None
+    return {'id': bank.test_id, 'title': bank.name, 'questions': bank.questions,
+            'attempt_id': attempt_id, 'version': bank.version if attempt_id is None else None}
+
+
+class SubmissionRejected(Exception):
+    """A submission that cannot be graded; carries the flash message and category."""
+
+    def __init__(self, message, category='danger'):
+        super().__init__(message)
+        self.message = message
+        self.category = category
+
+
+@route('/submit/<int:test_id>', methods=['POST'])
+@admission.limit('submit_test')
+def submit_test(test_id):
+    if 'user_id' not in session:
+        flash('انتهت جلستك، الرجاء تسجيل الدخول مرة أخرى.', 'warning')
+        return redirect(url_for('login'))
+    if session.get('username') == 'admin':
+         flash('لا يمكن للمدير إرسال نتائج الاختبارات.', 'warning')
+         return redirect(url_for('admin.index'))
+
+    try:
+        result = grade_submission(get_db(), session['user_id'], test_id, request.form)
+        if result is None: # An adaptive test goes on to its next question
+            return redirect(url_for('take_test', test_id=test_id))
+        return render_template('results.html', **result)
+    except SubmissionRejected as e:
+        flash(e.message, e.category)
+        return redirect(url_for('dashboard'))
+    except sqlite3.Error as e:
+        print(f"Database error submitting test {test_id}: {e}")
+        flash('حدث خطأ أثناء تصحيح الاختبار.', 'danger')
+        return redirect(url_for('dashboard'))
+
+
+def grade_submission(conn, user_id, test_id, form):
+    """Grades and records the answers in ``form`` (a request form ``MultiDict``).
+
+    Returns the values results.html shows, or None when an adaptive test
+    has recorded the answer and goes on to another question. Raises
+    ``SubmissionRejected`` when there is nothing valid to grade.
+    """
+    import adaptive
+    import grading
+
+    cursor = conn.cursor()
+    current_time = dt.now() # Using dt alias
+    test = conn.execute(queries.TEST_INFO, (test_id,)).fetchone()
+    if not test:
+        raise SubmissionRejected('الاختبار غير صالح.')
+
+    attempt_id = None
+    ability = None
+    if test['mode'] == 'adaptive': # Record one answer; grade only once the session stops
+        attempt_id = form.get('attempt_id', type=int)
+        attempt = adaptive.load_attempt(conn, attempt_id, user_id, test_id) if attempt_id else None
+        if attempt is None:
+            raise SubmissionRejected('هذه المحاولة غير صالحة أو تم تسليمها مسبقاً.', 'warning')
+        question_id = form.get('question_id', type=int)
+        if question_id != attempt.current_question: # A resubmitted or stale page
+            return None
+        questions, answer_key = question_pool.fetch_questions(conn, test_id, [question_id])
+        value = form.get(f'question_{question_id}')
+        options = questions[0]['options'] if questions else []
+        chosen = options.index(value) if value in options else grading.UNANSWERED
+        finished, theta, se = adaptive.answer(conn, attempt, test_id, chosen,
+                                              value is not None and value == answer_key.get(question_id),
+                                              current_app.config)
+        if not finished:
+            conn.commit()
+            return None
+        bank = question_pool.claim_attempt(conn, attempt_id, user_id, test, current_time)
+        ability = {'theta': theta, 'se': se}
+    elif test['sample_size']: # Grade exactly the questions this attempt was served
+        attempt_id = form.get('attempt_id', type=int)
+        bank = question_pool.claim_attempt(conn, attempt_id, user_id, test, current_time) if attempt_id else None
+        if bank is None:
+            conn.rollback()
+            raise SubmissionRejected('هذه المحاولة غير صالحة أو تم تسليمها مسبقاً.', 'warning')
+    else:
+        bank = get_question_bank(conn, test_id)
+
+    if not bank or not bank.questions:
+        raise SubmissionRejected('لا يمكن تصحيح الاختبار لعدم وجود أسئلة.')
+
+    key = grading.compiled_key(bank)
+    if ability is not None:
+        sheet = attempt.sheet(bank)
+    else:
+        buffer = autosave.get_autosave_buffer()
+        draft = buffer.draft(conn, user_id, test_id) if buffer else autosave.load_draft(conn, user_id, test_id)
+        draft_attempt = form.get('draft_attempt', type=int) # Sent by test.html; clients without it use the open draft
+        if draft and not draft.submitted and draft_attempt in (None, draft.attempt):
+            # Autosaved answers of this attempt fill in any the posted form lost
+            posted = form
+            form = {f'question_{qid}': option for qid, option in draft.answers.items()}
+            form.update(posted.to_dict())
+        if buffer:
+            buffer.discard(user_id, test_id)
+        autosave.close_draft(conn, user_id, test_id, current_time)
+        sheet = key.encode_form(form)
+    score, correctness = key.grade_one(sheet)
+    total_questions = len(bank.questions)
+    results_details = build_results_details(bank, sheet, correctness)
+
+    if ability is not None: # Percent correct means little when items track ability
+        percentage = adaptive.ability_percentage(ability['theta'])
+    else:
+        percentage = round((score / total_questions) * 100) if total_questions > 0 else 0
+    try:
+        writer = get_result_writer()
+        if writer and writer.submit(user_id, bank, score, total_questions, percentage, current_time, sheet,
+                                    attempt_id):
+            conn.commit() # The attempt claim, if any
+            current_app.logger.debug("Result queued for user %s on test %s", user_id, test_id)
+        else: # Write-behind disabled or its queue is full: write inline
+            record_result(conn, user_id, bank, score, total_questions, percentage, current_time, sheet,
+                          attempt_id)
+            conn.commit()
+            print(f"Result saved for user {user_id} on test {test_id}")
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Error saving test result: {e}")
+
+    next_test_id = None
+    try:
+        next_level = bank.level + 1
+        cursor.execute(queries.NEXT_TEST, (bank.type, next_level))
+        next_test = cursor.fetchone()
+        if next_test:
+            next_test_id = next_test['id']
+            print(f"Next test found for type {bank.type}, level {next_level}: ID {next_test_id}")
+    except sqlite3.Error as e:
+        print(f"Error finding next test: {e}")
+
+    return {'score': score, 'total_questions': total_questions, 'percentage': percentage,
+            'test_title': bank.name, 'results_details': results_details,
+            'next_test_id': next_test_id, 'ability': ability, 'test_id': test_id,
+            'percentile': leaderboard.percentile_rank(
+                leaderboard.histograms(conn, [test_id]).get(test_id), percentage)}
+
+
+@route('/autosave/<int:test_id>', methods=['GET', 'POST'])
+def autosave_answers(test_id):
+    """Saves answers of a test in progress (POST, JSON) or returns the saved ones (GET).
+
+    Saves carry the attempt token the GET returned; one for an attempt that
+    has been submitted gets a 409.
+    """
+    if 'user_id' not in session:
+        return jsonify(error='login required'), 401
+    user_id = session['user_id']
+    buffer = autosave.get_autosave_buffer()
+    try:
+        conn = get_db()
+        draft = buffer.draft(conn, user_id, test_id) if buffer else autosave.load_draft(conn, user_id, test_id)
+        if request.method == 'GET': # The open attempt's answers, or a token for a new attempt
+            if draft and not draft.submitted:
+                return jsonify(attempt=draft.attempt, answers=draft.answers)
+            return jsonify(attempt=autosave.new_attempt_token(draft), answers={})
+        saved = autosave.clean_answers(request.get_json(silent=True),
+                                       current_app.config.get('AUTOSAVE_MAX_ANSWERS', 500))
+        if saved is None:
+            return jsonify(error='invalid answers'), 400
+        attempt, answers = saved
+        if not autosave.accepts(draft, attempt):
+            return jsonify(error='attempt already submitted'), 409
+        if not (buffer and buffer.save(user_id, test_id, attempt, answers)): # Inline, or the buffer is full
+            autosave.write_drafts(conn, [(user_id, test_id, attempt, answers, dt.now())])
+            conn.commit()
+        return jsonify(saved=len(answers))
+    except sqlite3.Error as e:
+        print(f"Error autosaving answers of user {user_id} on test {test_id}: {e}")
+        return jsonify(error='database error'), 503
+
+
+@route('/attempt/<int:result_id>')
+def review_attempt(result_id):
+    """Shows the answers of a past attempt, decoded from its packed answer sheet."""
+    if 'user_id' not in session:
+        flash('الرجاء تسجيل الدخول أولاً للوصول لهذه الصفحة.', 'warning')
+        return redirect(url_for('login'))
+    import grading
+
+    try:
+        conn = get_db()
+        result = conn.execute("""
+            SELECT test_id, score, total_questions, percentage, timestamp, answers, answers_fingerprint, attempt_id
+            FROM all_test_results WHERE id = ? AND user_id = ?
+        """, (result_id, session['user_id'])).fetchone()
+        if not result:
+            flash('المحاولة غير موجودة.', 'danger')
+            return redirect(url_for('dashboard'))
+        attempt = None
+        if result['attempt_id'] is not None:
+            attempt = conn.execute("""
+                SELECT a.question_ids, t.id, t.name, t.type, t.level
+                FROM attempts a JOIN tests t ON t.id = a.test_id WHERE a.id = ?
+            """, (result['attempt_id'],)).fetchone()
+        if attempt:
+            bank = question_pool.attempt_bank(conn, attempt, json.loads(attempt['question_ids']))
+        else:
+            bank = get_question_bank(conn, result['test_id'])
+        key = grading.compiled_key(bank) if bank and bank.questions else None
+        if result['answers'] is None or key is None or key.fingerprint != result['answers_fingerprint']:
+            flash('لا يمكن عرض تفاصيل هذه المحاولة لأن أسئلة الاختبار تغيرت بعدها أو لم تُحفظ إجاباتها.', 'info')
+            return redirect(url_for('dashboard'))
+
+        sheet = grading.unpack_sheet(result['answers'], len(key))
+        _, correctness = key.grade_one(sheet)
+        return render_template('results.html',
+                               score=result['score'], total_questions=result['total_questions'],
+                               percentage=result['percentage'], test_title=bank.name,
+                               results_details=build_results_details(bank, sheet, correctness),
+                               next_test_id=None, attempt_time=result['timestamp'], test_id=result['test_id'],
+                               percentile=leaderboard.percentile_rank(
+                                   leaderboard.histograms(conn, [result['test_id']]).get(result['test_id']),
+                                   result['percentage']))
+    except (sqlite3.Error, ValueError) as e:
+        print(f"Error loading attempt {result_id}: {e}")
+        flash('حدث خطأ أثناء تحميل المحاولة.', 'danger')
+        return redirect(url_for('dashboard'))
+
+
+@route('/leaderboard/<int:test_id>')
+def test_leaderboard(test_id):
+    """Shows the best scores on a test and where the current student stands."""
+    if 'user_id' not in session:
+        flash('الرجاء تسجيل الدخول أولاً للوصول لهذه الصفحة.', 'warning')
+        return redirect(url_for('login'))
+
+    try:
+        conn = get_db()
+        test = conn.execute(queries.TEST_INFO, (test_id,)).fetchone()
+        if not test:
+            flash('الاختبار غير موجود.', 'danger')
+            return redirect(url_for('dashboard'))
+        top = leaderboard.get_leaderboard_cache().get(conn, test_id, current_app.config['LEADERBOARD_SIZE'])
+        best = conn.execute("SELECT best_percentage FROM test_best WHERE test_id = ? AND user_id = ?",
+                            (test_id, session['user_id'])).fetchone()
+        percentile = None
+        if best:
+            percentile = leaderboard.percentile_rank(leaderboard.histograms(conn, [test_id]).get(test_id),
+                                                     best['best_percentage'])
+        return render_template('leaderboard.html', test=test, top=top,
+                               best=best['best_percentage'] if best else None, percentile=percentile)
+    except sqlite3.Error as e:
+        print(f"Error loading leaderboard for test {test_id}: {e}")
+        flash('حدث خطأ أثناء تحميل لوحة المتصدرين.', 'danger')
+        return redirect(url_for('dashboard'))
+
+
+
+def init_app(app):
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    app.context_processor(inject_now)
+    app.jinja_env.filters['format_datetime'] = format_datetime_filter
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""Production entry point: ``gunicorn -c gunicorn.conf.py wsgi:app``.
+
+Settings come from config.py and ``FLASK_*`` environment variables; at least
+``FLASK_SECRET_KEY`` should be set.
+"""
+from app import create_app
+
+app = create_app()
+
+if app.config['SECRET_KEY'] == 'a_very_secret_random_key_change_this':
+    app.logger.warning("SECRET_KEY is the development default; set FLASK_SECRET_KEY")